@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Asyncio ComfyUI client that keeps the GPU busy.
+Several prompts are kept queued on the server at once and completion is
+tracked over the /ws websocket instead of polling /history. Inputs for the
+next prompts are uploaded while the current one renders.
+
+Workflows are API-format JSON exported from ComfyUI ("Save (API Format)").
+patch_workflow() fills in the input image, prompt text, seed, steps, cfg and
+flux guidance by node class_type, so one exported graph serves every batch.
+
+Needs aiohttp, which ships with every ComfyUI install. comfyui_stub.py is a
+local stand-in server for trying this without a GPU.
+"""
+
+import asyncio
+import copy
+import inspect
+import json
+import uuid
+
+import aiohttp
+
+
+class ComfyError(Exception):
+    pass
+
+
+def load_workflow(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def patch_workflow(workflow, image=None, prompt=None, seed=None, steps=None, cfg=None, guidance=None):
+    """Copy of an API-format workflow with per-prompt values filled in"""
+    wf = copy.deepcopy(workflow)
+    for node in wf.values():
+        kind = node.get("class_type", "")
+        inputs = node.setdefault("inputs", {})
+        title = node.get("_meta", {}).get("title", "").lower()
+        if image is not None and kind == "LoadImage":
+            inputs["image"] = image
+        if prompt is not None and kind.startswith("CLIPTextEncode") and "negative" not in title:
+            for field in ("text", "clip_l", "t5xxl"):
+                if field in inputs and not isinstance(inputs[field], list):
+                    inputs[field] = prompt
+        if seed is not None:
+            for field in ("seed", "noise_seed"):
+                if field in inputs and not isinstance(inputs[field], list):
+                    inputs[field] = seed
+        if steps is not None and "steps" in inputs and not isinstance(inputs["steps"], list):
+            inputs["steps"] = steps
+        if cfg is not None and kind in ("KSampler", "KSamplerAdvanced") and "cfg" in inputs:
+            inputs["cfg"] = cfg
+        if guidance is not None and kind == "FluxGuidance":
+            inputs["guidance"] = guidance
+    return wf
+
+
+class AsyncComfyClient:
+    """One websocket-tracked session against a ComfyUI server"""
+
+    def __init__(self, base_url="http://127.0.0.1:8188", timeout=3600):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = uuid.uuid4().hex
+        self.timeout = timeout
+        self.session = None
+        self._ws = None
+        self._ws_task = None
+        self._waiters = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=30))
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/ws?clientId={self.client_id}"
+        self._ws = await self.session.ws_connect(ws_url, heartbeat=30)
+        self._ws_task = asyncio.ensure_future(self._listen())
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._ws_task is not None:
+            self._ws_task.cancel()
+        await self._ws.close()
+        await self.session.close()
+
+    async def _listen(self):
+        try:
+            async for msg in self._ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue  # binary preview frames
+                data = json.loads(msg.data)
+                kind, payload = data.get("type"), data.get("data") or {}
+                prompt_id = payload.get("prompt_id")
+                waiter = self._waiters.get(prompt_id)
+                if waiter is None or waiter.done():
+                    continue
+                if kind == "executing" and payload.get("node") is None:
+                    waiter.set_result(prompt_id)
+                elif kind == "execution_success":
+                    waiter.set_result(prompt_id)
+                elif kind == "execution_error":
+                    waiter.set_exception(ComfyError(payload.get("exception_message", "execution error")))
+        finally:
+            # Socket gone: nothing will ever complete the outstanding prompts
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(ComfyError("ComfyUI websocket closed"))
+
+    async def upload_image(self, data, name):
+        form = aiohttp.FormData()
+        form.add_field("image", data, filename=name, content_type="image/png")
+        form.add_field("overwrite", "true")
+        async with self.session.post(f"{self.base_url}/upload/image", data=form) as r:
+            if r.status != 200:
+                raise ComfyError(f"Upload of {name} failed: HTTP {r.status}")
+            info = await r.json()
+        return f"{info['subfolder']}/{info['name']}" if info.get("subfolder") else info["name"]
+
+    async def queue_prompt(self, workflow):
+        """Queue a workflow and return (prompt_id, completion future)"""
+        payload = {"prompt": workflow, "client_id": self.client_id}
+        async with self.session.post(f"{self.base_url}/prompt", json=payload) as r:
+            body = await r.json()
+            if r.status != 200 or "prompt_id" not in body:
+                raise ComfyError(f"Prompt rejected: {body.get('error') or body}")
+        prompt_id = body["prompt_id"]
+        self._waiters[prompt_id] = asyncio.get_running_loop().create_future()
+        return prompt_id, self._waiters[prompt_id]
+
+    async def outputs(self, prompt_id):
+        """Bytes of every image the prompt produced"""
+        async with self.session.get(f"{self.base_url}/history/{prompt_id}") as r:
+            history = (await r.json()).get(prompt_id, {})
+        images = []
+        for node_output in history.get("outputs", {}).values():
+            for image in node_output.get("images", []):
+                params = {"filename": image["filename"], "subfolder": image.get("subfolder", ""),
+                          "type": image.get("type", "output")}
+                async with self.session.get(f"{self.base_url}/view", params=params) as r:
+                    images.append(await r.read())
+        return images
+
+    async def run_pipelined(self, units, prepare, on_result, max_in_flight=3):
+        """
+        Push work units through the server with up to max_in_flight prompts queued.
+        prepare(client, unit) uploads the unit's inputs and returns its workflow;
+        on_result(unit, images) receives the rendered images in completion order
+        (a coroutine function is awaited, so slow work can leave the loop).
+        """
+        in_flight = set()
+
+        async def finish(unit, prompt_id, future):
+            await asyncio.wait_for(future, timeout=self.timeout)
+            self._waiters.pop(prompt_id, None)
+            result = on_result(unit, await self.outputs(prompt_id))
+            if inspect.isawaitable(result):
+                await result
+
+        try:
+            for unit in units:
+                # Upload and queue the next unit while earlier ones are rendering
+                workflow = await prepare(self, unit)
+                while len(in_flight) >= max_in_flight:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                prompt_id, future = await self.queue_prompt(workflow)
+                in_flight.add(asyncio.ensure_future(finish(unit, prompt_id, future)))
+            if in_flight:
+                for task in await asyncio.gather(*in_flight, return_exceptions=True):
+                    if isinstance(task, Exception):
+                        raise task
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+
+def run_pipelined(base_url, units, prepare, on_result, max_in_flight=3):
+    """Blocking wrapper around AsyncComfyClient.run_pipelined for stage threads"""
+
+    async def main():
+        async with AsyncComfyClient(base_url) as client:
+            await client.run_pipelined(units, prepare, on_result, max_in_flight=max_in_flight)
+
+    asyncio.run(main())
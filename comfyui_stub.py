@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stand-in ComfyUI server for local testing without a GPU.
+Speaks the parts of the ComfyUI HTTP/websocket API that comfy_client.py and
+comfyui_supervisor.py use: /, /system_stats, /queue, /free, /upload/image,
+/prompt, /history/<id>, /view and /ws. Prompts run one at a time in queue
+order. "Rendering" sleeps --render-seconds and returns the LoadImage input
+unchanged (or --tint'ed if opencv is available).
+
+    python comfyui_stub.py --port 8288 --render-seconds 0.5
+    COMFYUI_PORT=8288 COMFYFLUX_WORKFLOW=workflow_api.json python pipeline.py ...
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from aiohttp import web
+
+
+class StubComfy:
+    def __init__(self, root, render_seconds=1.0, tint=None):
+        self.input_dir = os.path.join(root, "input")
+        self.output_dir = os.path.join(root, "output")
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.render_seconds = render_seconds
+        self.tint = tint
+        self.queue = asyncio.Queue()
+        self.pending = []
+        self.running = None
+        self.history = {}
+        self.sockets = {}
+        self.counter = 0
+
+    async def send(self, client_id, kind, data):
+        ws = self.sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_str(json.dumps({"type": kind, "data": data}))
+
+    def render(self, source, target):
+        with open(source, "rb") as f:
+            data = f.read()
+        if self.tint is not None:
+            try:
+                import cv2
+                import numpy as np
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                image = cv2.addWeighted(image, 0.7, np.full_like(image, self.tint), 0.3, 0)
+                data = cv2.imencode(".png", image)[1].tobytes()
+            except ImportError:
+                pass
+        with open(target, "wb") as f:
+            f.write(data)
+
+    async def worker(self):
+        while True:
+            prompt_id, number, prompt, client_id = await self.queue.get()
+            self.pending.remove(prompt_id)
+            self.running = prompt_id
+            await self.send(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": time.time()})
+            outputs = {}
+            try:
+                loader = next((k for k, n in prompt.items() if n.get("class_type") == "LoadImage"), None)
+                await self.send(client_id, "executing", {"node": loader, "prompt_id": prompt_id})
+                await asyncio.sleep(self.render_seconds)
+                if loader is not None:
+                    source = os.path.join(self.input_dir, prompt[loader]["inputs"]["image"])
+                    name = f"ComfyUI_{number:05d}_.png"
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.render, source, os.path.join(self.output_dir, name))
+                    outputs["9"] = {"images": [{"filename": name, "subfolder": "", "type": "output"}]}
+                self.history[prompt_id] = {"prompt": [number, prompt_id, prompt], "outputs": outputs,
+                                           "status": {"status_str": "success", "completed": True}}
+                await self.send(client_id, "executed", {"node": "9", "output": outputs.get("9"), "prompt_id": prompt_id})
+                await self.send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+            except Exception as e:
+                self.history[prompt_id] = {"prompt": [number, prompt_id, prompt], "outputs": {},
+                                           "status": {"status_str": "error", "completed": False}}
+                await self.send(client_id, "execution_error", {"prompt_id": prompt_id, "exception_message": str(e)})
+            finally:
+                self.running = None
+
+    async def index(self, request):
+        return web.Response(text="<html><body>ComfyUI stub</body></html>", content_type="text/html")
+
+    async def system_stats(self, request):
+        return web.json_response({"system": {"os": "stub", "python_version": "stub"}, "devices": []})
+
+    async def get_queue(self, request):
+        return web.json_response({"queue_running": [self.running] if self.running else [],
+                                  "queue_pending": list(self.pending)})
+
+    async def free(self, request):
+        return web.json_response({})
+
+    async def upload_image(self, request):
+        form = await request.post()
+        upload = form["image"]
+        subfolder = form.get("subfolder", "")
+        folder = os.path.join(self.input_dir, subfolder)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, upload.filename), "wb") as f:
+            f.write(upload.file.read())
+        return web.json_response({"name": upload.filename, "subfolder": subfolder, "type": "input"})
+
+    async def post_prompt(self, request):
+        body = await request.json()
+        prompt = body.get("prompt")
+        if not isinstance(prompt, dict):
+            return web.json_response({"error": "no prompt", "node_errors": {}}, status=400)
+        loader = next((n for n in prompt.values() if n.get("class_type") == "LoadImage"), None)
+        if loader is not None and not os.path.isfile(os.path.join(self.input_dir, loader["inputs"].get("image", ""))):
+            return web.json_response({"error": "image not uploaded", "node_errors": {}}, status=400)
+        prompt_id = str(uuid.uuid4())
+        self.counter += 1
+        self.pending.append(prompt_id)
+        await self.queue.put((prompt_id, self.counter, prompt, body.get("client_id")))
+        return web.json_response({"prompt_id": prompt_id, "number": self.counter, "node_errors": {}})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info["prompt_id"]
+        if prompt_id not in self.history:
+            return web.json_response({})
+        return web.json_response({prompt_id: self.history[prompt_id]})
+
+    async def view(self, request):
+        folder = self.output_dir if request.query.get("type", "output") == "output" else self.input_dir
+        path = os.path.join(folder, request.query.get("subfolder", ""), os.path.basename(request.query["filename"]))
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    async def websocket(self, request):
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.sockets[client_id] = ws
+        await ws.send_str(json.dumps({"type": "status", "data": {"sid": client_id, "status": {
+            "exec_info": {"queue_remaining": len(self.pending)}}}}))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.sockets.pop(client_id, None)
+        return ws
+
+    def app(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_get("/", self.index)
+        app.router.add_get("/system_stats", self.system_stats)
+        app.router.add_get("/queue", self.get_queue)
+        app.router.add_post("/free", self.free)
+        app.router.add_post("/upload/image", self.upload_image)
+        app.router.add_post("/prompt", self.post_prompt)
+        app.router.add_get("/history/{prompt_id}", self.get_history)
+        app.router.add_get("/view", self.view)
+        app.router.add_get("/ws", self.websocket)
+
+        async def start_worker(app):
+            app["worker"] = asyncio.ensure_future(self.worker())
+
+        async def stop_worker(app):
+            app["worker"].cancel()
+
+        app.on_startup.append(start_worker)
+        app.on_cleanup.append(stop_worker)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ComfyUI stub server")
+    parser.add_argument("--listen", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--root", default=None, help="directory for input/ and output/ (default: a temp dir)")
+    parser.add_argument("--render-seconds", type=float, default=1.0)
+    parser.add_argument("--tint", type=int, nargs=3, default=None, metavar=("B", "G", "R"))
+    args = parser.parse_args()
+    root = args.root or tempfile.mkdtemp(prefix="comfyui_stub_")
+    print(f"ComfyUI stub on http://{args.listen}:{args.port} (files in {root})")
+    web.run_app(StubComfy(root, args.render_seconds, args.tint).app(), host=args.listen, port=args.port,
+                print=None)
+
+
+if __name__ == "__main__":
+    main()
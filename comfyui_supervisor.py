@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ComfyUI process supervisor used by pipeline.py.
+Starts ComfyUI once, probes readiness over HTTP instead of sleeping, and keeps
+the server warm for every flux stage and for later jobs on the same node.
+The server is only restarted when it has crashed or when release_vram() is
+asked to hard-restart it.
+
+The launch command, host and port are configurable, so the supervisor can be
+pointed at any local stub HTTP server for testing, e.g.
+    ComfyUISupervisor(command=["python", "-m", "http.server", "8299"], port=8299)
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+COMFYUI_MAIN = os.environ.get("COMFYUI_MAIN", "/opt/comfyui/main.py")
+COMFYUI_HOST = os.environ.get("COMFYUI_HOST", "127.0.0.1")
+COMFYUI_PORT = int(os.environ.get("COMFYUI_PORT", "8188"))
+COMFYUI_LOG = os.environ.get("COMFYUI_LOG", "/workspace/comfyui_runtime.log")
+COMFYUI_RUN_DIR = os.environ.get("COMFYUI_RUN_DIR", "/workspace")
+
+
+def default_command(port):
+    return ["python", COMFYUI_MAIN, "--listen", "0.0.0.0", "--port", str(port)]
+
+
+def pidfile_path(port):
+    return os.path.join(COMFYUI_RUN_DIR, f"comfyui_{port}.pid")
+
+
+def probe(host, port, timeout=2.0):
+    """Return True if an HTTP server answers 200 on host:port"""
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/", timeout=timeout) as r:
+            return r.status == 200
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # An exited child of ours that nobody has reaped yet (a zombie) still answers kill(0)
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def _read_pid(port):
+    try:
+        with open(pidfile_path(port)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _cmdline(pid):
+    """Arguments of a running process (Linux /proc), None if unknown"""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return [arg.decode(errors="replace") for arg in f.read().split(b"\0") if arg]
+    except OSError:
+        return None
+
+
+def _serves(pid, command, port):
+    """True if pid is still the server started with command (or another one told to use port)"""
+    args = _cmdline(pid)
+    if not args:
+        return False
+    if args[1:] == list(command)[1:]:
+        return True
+    return any(a == "--port" and b == str(port) for a, b in zip(args, args[1:]))
+
+
+def kill_process_group(pid, grace=30):
+    """SIGTERM the process group of pid, SIGKILL it if still alive after grace seconds"""
+    try:
+        pgid = os.getpgid(pid)
+    except ProcessLookupError:
+        return True
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except ProcessLookupError:
+        return True
+    deadline = time.time() + grace
+    while time.time() < deadline:
+        if not _pid_alive(pid):
+            return True
+        time.sleep(0.5)
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return not _pid_alive(pid)
+
+
+class ComfyUISupervisor:
+    """Owns (or adopts) one ComfyUI server on a port"""
+
+    def __init__(self, command=None, host=COMFYUI_HOST, port=COMFYUI_PORT,
+                 log_path=COMFYUI_LOG, startup_timeout=600, probe_interval=1.0):
+        self.host = host
+        self.port = port
+        self.command = command or default_command(port)
+        self.log_path = log_path
+        self.startup_timeout = startup_timeout
+        self.probe_interval = probe_interval
+        self.process = None
+        self.pid = None
+        self.starts = 0
+        self._lock = threading.RLock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def is_ready(self):
+        return probe(self.host, self.port)
+
+    def _alive(self):
+        if self.process is not None:
+            return self.process.poll() is None
+        if self.pid is not None:
+            return _pid_alive(self.pid)
+        return False
+
+    def _recorded_pid(self):
+        """PID from the pidfile if that process is still this port's ComfyUI (PIDs get reused)"""
+        pid = _read_pid(self.port)
+        if pid is None or not _pid_alive(pid):
+            return None
+        if not _serves(pid, self.command, self.port):
+            print(f"⚠️ PID {pid} in {pidfile_path(self.port)} is no longer ComfyUI, ignoring it")
+            return None
+        return pid
+
+    def ensure_running(self):
+        """Return once ComfyUI answers, starting it only if nothing is serving the port"""
+        with self._lock:
+            if self.pid is None and self.process is None:
+                # Adopt a server left running by an earlier job on this node
+                self.pid = self._recorded_pid()
+            if self.is_ready():
+                if self.process is None:
+                    print(f"♻️ Reusing warm ComfyUI on port {self.port}")
+                return self
+            if self._alive():
+                # Started but still loading (or wedged): wait on the probe
+                self.wait_ready()
+                return self
+            self._start()
+            self.wait_ready()
+            return self
+
+    def _start(self):
+        print(f"🚀 Starting ComfyUI on port {self.port}...")
+        log_dir = os.path.dirname(self.log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        log_file = open(self.log_path, "a")
+        # New session so the server outlives this job and can be killed as a group
+        self.process = subprocess.Popen(
+            self.command,
+            stdout=log_file,
+            stderr=log_file,
+            start_new_session=True,
+        )
+        log_file.close()
+        self.pid = self.process.pid
+        self.starts += 1
+        try:
+            os.makedirs(os.path.dirname(pidfile_path(self.port)), exist_ok=True)
+            with open(pidfile_path(self.port), "w") as f:
+                f.write(str(self.pid))
+        except OSError:
+            pass
+
+    def wait_ready(self):
+        print(f"⏳ Waiting for ComfyUI to start on port {self.port}...")
+        start_time = time.time()
+        while time.time() - start_time < self.startup_timeout:
+            if self.is_ready():
+                print(f"✅ ComfyUI is ready (PID {self.pid}) after {time.time() - start_time:.1f}s")
+                return True
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(
+                    f"❌ ComfyUI exited with code {self.process.returncode} during startup, see {self.log_path}")
+            time.sleep(self.probe_interval)
+        raise TimeoutError("❌ ComfyUI failed to start within timeout")
+
+    def release_vram(self, restart=False):
+        """Ask ComfyUI to unload its models; with restart=True kill it so the next use starts fresh"""
+        with self._lock:
+            if restart:
+                self.stop()
+                return True
+            if not self.is_ready():
+                return False
+            req = urllib.request.Request(
+                f"{self.base_url}/free",
+                data=b'{"unload_models": true, "free_memory": true}',
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=30):
+                    pass
+                print("🧹 ComfyUI models unloaded")
+                return True
+            except (urllib.error.URLError, OSError):
+                # Older ComfyUI builds have no /free endpoint: fall back to a restart
+                self.stop()
+                return True
+
+    def stop(self, grace=30):
+        """Stop the server and wait until the port is free"""
+        with self._lock:
+            if self.process is not None:
+                pid = self.process.pid if self.process.poll() is None else None
+            else:
+                pid = self._recorded_pid()
+            if pid is None:
+                # Nothing of ours is running; a stale pidfile must not point at a reused PID later
+                self.process = None
+                self.pid = None
+                self._remove_pidfile()
+                return
+            print(f"🛑 Stopping ComfyUI (PID: {pid})...")
+            kill_process_group(pid, grace=grace)
+            if self.process is not None:
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    pass
+            deadline = time.time() + grace
+            while self.is_ready() and time.time() < deadline:
+                time.sleep(0.5)
+            self.process = None
+            self.pid = None
+            self._remove_pidfile()
+            print("✅ ComfyUI stopped.")
+
+    def _remove_pidfile(self):
+        try:
+            os.remove(pidfile_path(self.port))
+        except OSError:
+            pass
+
+
+_supervisors = {}
+_supervisors_lock = threading.Lock()
+
+
+def get_supervisor(port=None, **kwargs):
+    """Process-wide supervisor per port"""
+    port = port or COMFYUI_PORT
+    with _supervisors_lock:
+        if port not in _supervisors:
+            _supervisors[port] = ComfyUISupervisor(port=port, **kwargs)
+        return _supervisors[port]
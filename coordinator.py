@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Coordinator for spreading one job over several remote_api_server nodes.
+The input video is cut into scene segments (scene_shards.py). Each segment is
+uploaded to a node and run there as an ordinary job. The coordinator polls
+the sub-jobs, downloads each segment's result and stitches the results back
+together with the original audio.
+
+A segment whose sub-job fails, or whose node stops answering, is retried on
+another node. A segment running much longer than the segments already done
+(slow_factor times the expected time for its length) gets a second attempt
+on an idle node, and whichever attempt finishes first wins.
+
+Nodes talk plain HTTP, so this can be tried on one machine with several
+servers running pipeline_stub.py:
+    python remote_api_server.py --port 5001 --execution subprocess --pipeline-script pipeline_stub.py
+    python remote_api_server.py --port 5002 --execution subprocess --pipeline-script pipeline_stub.py
+    python remote_api_server.py --port 5000 --coordinator http://127.0.0.1:5001,http://127.0.0.1:5002
+"""
+
+import hashlib
+import os
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from scene_shards import concat_videos, count_frames, cut_shards, detect_scene_cuts, plan_shards
+from frame_stream import probe_video
+
+NODE_TIMEOUT = 30
+NODE_MAX_ERRORS = 3
+NODE_COOLDOWN = 60
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_RETRIES = 3
+
+
+class Node:
+    """One remote_api_server instance"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.workspace = None
+        self.busy = 0
+        self.errors = 0
+        self.down_until = 0
+
+    def available(self):
+        return self.busy == 0 and time.time() >= self.down_until
+
+    def ok(self):
+        self.errors = 0
+
+    def error(self):
+        self.errors += 1
+        if self.errors >= NODE_MAX_ERRORS:
+            print(f"[Coordinator] Node {self.url} unreachable, cooling down for {NODE_COOLDOWN}s")
+            self.down_until = time.time() + NODE_COOLDOWN
+            self.errors = 0
+
+    def call(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", NODE_TIMEOUT)
+        response = requests.request(method, f"{self.url}{path}", **kwargs)
+        response.raise_for_status()
+        return response
+
+    def ensure_workspace(self):
+        if self.workspace is None:
+            self.workspace = self.call("GET", "/health").json()["workspace"]
+        return self.workspace
+
+    def download(self, relative, local, workers=DOWNLOAD_WORKERS):
+        """
+        Fetch a workspace file as parallel Range requests, each piece checked
+        against the node's manifest hash and retried on its own. Nodes without
+        /download/manifest get one streamed GET.
+        """
+        try:
+            manifest = self.call("GET", "/download/manifest", params={"path": relative}, timeout=None).json()
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (404, 405):
+                raise
+            with self.call("GET", "/download", params={"path": relative}, stream=True, timeout=None) as r:
+                with open(local, "wb") as f:
+                    for block in r.iter_content(chunk_size=1024 * 1024):
+                        f.write(block)
+            return
+        with open(local, "wb") as f:
+            f.truncate(manifest["size"])
+        fd = os.open(local, os.O_WRONLY)
+
+        def fetch(chunk):
+            end = chunk["offset"] + chunk["length"]
+            headers = {"Range": f"bytes={chunk['offset']}-{end - 1}", "If-Range": manifest["last_modified"]}
+            for attempt in range(1, DOWNLOAD_RETRIES + 1):
+                try:
+                    with self.call("GET", "/download", params={"path": relative}, headers=headers,
+                                   stream=True, timeout=NODE_TIMEOUT) as r:
+                        if r.status_code != 206:
+                            raise RuntimeError(f"{relative} changed on {self.url} during download")
+                        digest, position = hashlib.sha256(), chunk["offset"]
+                        for block in r.iter_content(chunk_size=1024 * 1024):
+                            os.pwrite(fd, block, position)
+                            digest.update(block)
+                            position += len(block)
+                    if position == end and digest.hexdigest() == chunk["sha256"]:
+                        return
+                    print(f"[Coordinator] Piece {chunk['index']} of {relative} from {self.url} is corrupt")
+                except requests.RequestException as e:
+                    print(f"[Coordinator] Piece {chunk['index']} of {relative} from {self.url} failed: {e}")
+            raise RuntimeError(f"Piece {chunk['index']} of {relative} failed {DOWNLOAD_RETRIES} times")
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(fetch, manifest["chunks"]))
+        finally:
+            os.close(fd)
+
+
+class Attempt:
+    def __init__(self, segment, node):
+        self.segment = segment
+        self.node = node
+        self.job_id = None
+        self.started = time.time()
+        self.status = "submitting"
+
+
+class Segment:
+    def __init__(self, index, start, end, fps_value, path):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.seconds = (end - start) / fps_value
+        self.path = path
+        self.attempts = []
+        self.failures = 0
+        self.result = None
+        self.status = "pending"
+        self.finished_seconds = None
+
+    def running(self):
+        return [a for a in self.attempts if a.status in ("submitting", "running")]
+
+    def summary(self):
+        return {
+            "index": self.index,
+            "start_frame": self.start,
+            "end_frame": self.end,
+            "status": self.status,
+            "attempts": [{"node": a.node.url, "job_id": a.job_id, "status": a.status} for a in self.attempts],
+            "seconds": round(self.finished_seconds, 1) if self.finished_seconds else None,
+        }
+
+
+class Coordinator:
+    def __init__(self, node_urls, poll_interval=2.0, slow_factor=2.0, min_slow_seconds=60.0,
+                 max_failures=3, min_segment_seconds=30.0):
+        if not node_urls:
+            raise ValueError("Coordinator needs at least one node")
+        self.nodes = [Node(url) for url in node_urls]
+        self.poll_interval = poll_interval
+        self.slow_factor = slow_factor
+        self.min_slow_seconds = min_slow_seconds
+        self.max_failures = max_failures
+        self.min_segment_seconds = min_segment_seconds
+        self._lock = threading.Lock()
+
+    # ------------------------
+    # Segment I/O
+    # ------------------------
+    def split(self, input_path, work_dir):
+        info = probe_video(input_path)
+        total = count_frames(input_path)
+        cuts = detect_scene_cuts(input_path, info["fps_value"])
+        plan = plan_shards(cuts, total, info["fps_value"], self.min_segment_seconds)
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        paths = cut_shards(input_path, plan, os.path.join(work_dir, f"{stem.replace('%', '%%')}_seg%04d.mp4"),
+                           info["fps"])
+        segments = [Segment(index, start, end, info["fps_value"], path)
+                    for index, ((start, end), path) in enumerate(zip(plan, paths))]
+        print(f"[Coordinator] {len(cuts)} scene cuts -> {len(segments)} segments over {len(self.nodes)} nodes")
+        return segments, total
+
+    def submit(self, attempt, job_key, params):
+        node, segment = attempt.node, attempt.segment
+        with open(segment.path, "rb") as f:
+            name = f"{job_key}_{os.path.basename(segment.path)}"
+            uploaded = node.call("POST", "/upload", files={"file": (name, f)}, timeout=None).json()
+        # Never joined with another job on the node: the coordinator cancels its spare attempts
+        payload = dict(params, inputMethod="manual", manualPath=uploaded["path"], dedupe=False)
+        attempt.job_id = node.call("POST", "/jobs", json=payload).json()["id"]
+        with self._lock:
+            if attempt.status == "submitting":
+                attempt.status = "running"
+        if attempt.status == "cancelled":
+            # The segment finished elsewhere while this copy was uploading
+            self.cancel(attempt)
+            return
+        print(f"[Coordinator] Segment {segment.index} -> {node.url} as {attempt.job_id}")
+
+    def fetch(self, attempt, job, work_dir):
+        outputs = job.get("outputs") or {}
+        remote = outputs.get("colorized_final_video_path") or outputs.get("final_video_path")
+        if not remote:
+            raise RuntimeError(f"Sub-job {attempt.job_id} reported no output video")
+        workspace = attempt.node.ensure_workspace()
+        if not os.path.isabs(remote):
+            # Outputs may be reported relative to the sub-job's own directory
+            remote = os.path.join(job.get("work_dir") or workspace, remote)
+        relative = os.path.relpath(os.path.normpath(remote), workspace)
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            raise RuntimeError(f"Sub-job {attempt.job_id} output {remote} is outside the node workspace {workspace}")
+        local = os.path.join(work_dir, f"result_{attempt.segment.index:04d}{os.path.splitext(remote)[1]}")
+        tmp = f"{local}.part"
+        attempt.node.download(relative, tmp)
+        frames = count_frames(tmp)
+        expected = attempt.segment.end - attempt.segment.start
+        if frames != expected:
+            raise RuntimeError(f"Segment {attempt.segment.index} came back with {frames} frames, expected {expected}")
+        os.replace(tmp, local)
+        return local
+
+    def cancel(self, attempt):
+        self._finish(attempt, "cancelled")
+        if attempt.job_id is None:
+            return
+        try:
+            attempt.node.call("POST", f"/jobs/{attempt.job_id}/cancel")
+        except requests.RequestException:
+            pass
+
+    # ------------------------
+    # Scheduling
+    # ------------------------
+    def _expected_seconds(self, segment, segments):
+        rates = [s.finished_seconds / s.seconds for s in segments if s.finished_seconds and s.seconds]
+        if not rates:
+            return None
+        return max(self.min_slow_seconds, statistics.median(rates) * segment.seconds)
+
+    def _pick_node(self, segment):
+        # A retry waits for a node it has not failed on, unless every such node is down
+        tried = {a.node.url for a in segment.attempts}
+        fresh = [n for n in self.nodes if n.url not in tried and time.time() >= n.down_until]
+        if fresh:
+            return next((n for n in fresh if n.available()), None)
+        return next((n for n in self.nodes if n.available()), None)
+
+    def _start(self, segment, node, job_key, params, threads):
+        attempt = Attempt(segment, node)
+        with self._lock:
+            segment.attempts.append(attempt)
+            segment.status = "running"
+            node.busy += 1
+
+        def run():
+            try:
+                self.submit(attempt, job_key, params)
+                node.ok()
+            except Exception as e:
+                print(f"[Coordinator] Submitting segment {segment.index} to {node.url} failed: {e}")
+                node.error()
+                self._finish(attempt, "failed")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    def _finish(self, attempt, status):
+        with self._lock:
+            if attempt.status not in ("submitting", "running"):
+                return False
+            attempt.node.busy -= 1
+            attempt.status = status
+            return True
+
+    def run(self, input_path, output_path, params, job_key, work_dir, on_update=None, cancelled=None):
+        """
+        Process input_path on the nodes and write the stitched result to output_path.
+        params are the POST /jobs flags passed on to every sub-job. on_update(summary)
+        is called whenever a segment changes; cancelled() returning True stops the run.
+        """
+        os.makedirs(work_dir, exist_ok=True)
+        segments, total = self.split(input_path, work_dir)
+        threads = []
+        started = time.time()
+
+        def update():
+            if on_update is not None:
+                done = sum(1 for s in segments if s.status == "completed")
+                on_update({"segments": [s.summary() for s in segments], "completed": done,
+                           "total": len(segments)})
+
+        update()
+        try:
+            while any(s.status != "completed" for s in segments):
+                if cancelled is not None and cancelled():
+                    raise RuntimeError("Job cancelled")
+                changed = False
+                # Start pending segments (and speculative copies of slow ones) on free nodes
+                for segment in segments:
+                    if segment.status == "completed":
+                        continue
+                    running = segment.running()
+                    if running:
+                        expected = self._expected_seconds(segment, segments)
+                        slow = (expected is not None and len(running) == 1
+                                and time.time() - running[0].started > self.slow_factor * expected)
+                        if not slow:
+                            continue
+                    node = self._pick_node(segment)
+                    if node is None or (running and node is running[0].node):
+                        continue
+                    if running:
+                        print(f"[Coordinator] Segment {segment.index} is slow on {running[0].node.url}, "
+                              f"also trying {node.url}")
+                    self._start(segment, node, job_key, params, threads)
+                    changed = True
+                # Poll running sub-jobs
+                for segment in segments:
+                    for attempt in segment.running():
+                        if attempt.status == "submitting":
+                            continue
+                        try:
+                            job = attempt.node.call("GET", f"/jobs/{attempt.job_id}").json()
+                            attempt.node.ok()
+                        except requests.RequestException as e:
+                            attempt.node.error()
+                            if time.time() < attempt.node.down_until:
+                                print(f"[Coordinator] Lost {attempt.node.url} running segment {segment.index}: {e}")
+                                self._finish(attempt, "failed")
+                                changed = True
+                            continue
+                        if job["status"] in ("completed", "failed", "cancelled"):
+                            changed = True
+                        if job["status"] == "completed" and segment.status != "completed":
+                            try:
+                                segment.result = self.fetch(attempt, job, work_dir)
+                            except Exception as e:
+                                print(f"[Coordinator] Segment {segment.index} result from {attempt.node.url} "
+                                      f"unusable: {e}")
+                                self._finish(attempt, "failed")
+                                continue
+                            self._finish(attempt, "completed")
+                            segment.status = "completed"
+                            segment.finished_seconds = time.time() - attempt.started
+                            for other in segment.running():
+                                self.cancel(other)
+                        elif job["status"] in ("failed", "cancelled"):
+                            print(f"[Coordinator] Segment {segment.index} failed on {attempt.node.url}: "
+                                  f"{job.get('error')}")
+                            self._finish(attempt, "failed")
+                # Give up on segments that keep failing
+                for segment in segments:
+                    if segment.status == "completed" or segment.running():
+                        continue
+                    segment.failures = sum(1 for a in segment.attempts if a.status == "failed")
+                    if segment.failures >= self.max_failures:
+                        raise RuntimeError(f"Segment {segment.index} failed on {segment.failures} attempts")
+                    segment.status = "pending"
+                if changed:
+                    update()
+                time.sleep(self.poll_interval)
+        except BaseException:
+            for segment in segments:
+                for attempt in segment.running():
+                    self.cancel(attempt)
+            raise
+        finally:
+            for thread in threads:
+                thread.join(timeout=NODE_TIMEOUT)
+        update()
+
+        stitched = f"{os.path.splitext(output_path)[0]}_video.mp4"
+        concat_videos([s.result for s in segments], stitched)
+        frames = count_frames(stitched)
+        if frames != total:
+            raise RuntimeError(f"Stitched video has {frames} frames, source has {total}")
+        # Put the original audio back under the stitched video
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", stitched, "-i", input_path,
+                        "-map", "0:v", "-map", "1:a?", "-c", "copy", "-shortest", output_path], check=True)
+        os.remove(stitched)
+        print(f"[Coordinator] {len(segments)} segments stitched into {output_path} "
+              f"in {time.time() - started:.1f}s")
+        return output_path
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Flux colorization of a scene video through ComfyUI, driven by comfy_client.
+A video is decoded into frames and grouped into tiles: images_per_combined
+frames laid out images_per_row to a row, or a single frame per prompt. Each
+tile becomes one prompt on a patched API-format workflow. Prompts are kept
+queued on the server while the next tiles are composed and uploaded. The
+rendered tiles are cut back into frames at the source size and re-encoded at
+the source frame rate. colorize_videos() runs several videos (the concat and
+prevscene passes) through one queue with their tiles interleaved. Frames are
+decoded only as tiles are needed and encoded as results come back, so
+memory stays bounded by the prompts in flight, not the length of the scene.
+
+Used by pipeline.py when COMFYFLUX_WORKFLOW points at an exported workflow.
+Without one, the pipeline keeps using the Utils helpers.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from comfy_client import load_workflow, patch_workflow, run_pipelined
+from comfyui_supervisor import COMFYUI_HOST, COMFYUI_PORT
+from frame_stream import FrameWriter, probe_video, read_frames
+
+COMFYFLUX_WORKFLOW = os.environ.get("COMFYFLUX_WORKFLOW")
+COMFYFLUX_IN_FLIGHT = int(os.environ.get("COMFYFLUX_IN_FLIGHT", "3"))
+
+
+class FluxTile:
+    """One prompt's worth of frames and where they go back in the video"""
+
+    def __init__(self, job, index, frame_indices, frames, images_per_row):
+        self.job = job
+        self.index = index
+        self.frame_indices = frame_indices
+        self.frames = frames
+        self.count = len(frames)
+        self.frame_shape = frames[0].shape[:2]
+        self.images_per_row = images_per_row
+        self.layout = None
+
+    def compose(self):
+        """The tile's frames as one PNG grid (unused cells are black); the frames are dropped after"""
+        height, width = self.frame_shape
+        cols = min(self.images_per_row, self.count)
+        rows = (self.count + cols - 1) // cols
+        grid = np.zeros((rows * height, cols * width, 3), dtype=np.uint8)
+        for i, frame in enumerate(self.frames):
+            r, c = divmod(i, cols)
+            grid[r * height:(r + 1) * height, c * width:(c + 1) * width] = frame
+        ok, png = cv2.imencode(".png", cv2.cvtColor(grid, cv2.COLOR_RGB2BGR))
+        if not ok:
+            raise RuntimeError(f"Could not encode tile {self.index}")
+        self.layout = (rows, cols)
+        self.frames = None
+        return png.tobytes()
+
+    def split(self, image_bytes):
+        """Cut a rendered grid back into frames at the source frame size"""
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise RuntimeError(f"ComfyUI returned an unreadable image for tile {self.index}")
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        rows, cols = self.layout
+        height, width = self.frame_shape
+        image = cv2.resize(image, (cols * width, rows * height), interpolation=cv2.INTER_AREA)
+        out = []
+        for i in range(self.count):
+            r, c = divmod(i, cols)
+            out.append(image[r * height:(r + 1) * height, c * width:(c + 1) * width])
+        return out
+
+
+class FluxJob:
+    """One video to colorize: source, destination, prompt settings and tiling"""
+
+    def __init__(self, video_path, output_path, prompt, seed, steps, cfg, guidance,
+                 images_per_row=1, images_per_combined=1):
+        self.video_path = video_path
+        self.output_path = output_path
+        self.prompt = prompt
+        self.seed = seed
+        self.steps = steps
+        self.cfg = cfg
+        self.guidance = guidance
+        self.images_per_row = max(1, int(images_per_row))
+        self.images_per_combined = max(1, int(images_per_combined))
+        self.info = None
+        self.position = 0      # next source frame to put in a tile
+        self.tiles_made = 0
+        self.tiles_done = 0
+        self._writer = None
+        self._pending = {}     # tile index -> rendered frames that arrived ahead of their turn
+        self._next_tile = 0
+
+    @property
+    def expected_tiles(self):
+        frames = (self.info or {}).get("frames")
+        return -(-frames // self.images_per_combined) if frames else None
+
+    def open(self, info):
+        self.info = info
+        self._writer = FrameWriter(self.output_path, info["fps"])
+
+    def add_result(self, tile, frames):
+        """Encode a rendered tile's frames, holding back tiles that finish before earlier ones"""
+        self._pending[tile.index] = frames
+        while self._next_tile in self._pending:
+            for frame in self._pending.pop(self._next_tile):
+                self._writer.write(frame)
+            self._next_tile += 1
+        self.tiles_done += 1
+
+    def write(self):
+        self._writer.close()
+        if self._next_tile != self.tiles_made:
+            raise RuntimeError(f"{self.output_path}: {self._next_tile} of {self.tiles_made} tiles written")
+        return self.output_path
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class FrameSource:
+    """
+    One decode of a video shared by the jobs that read it. Frames stay
+    buffered only until every job has put them in a tile.
+    """
+
+    def __init__(self, path, jobs):
+        self.info = probe_video(path)
+        self.jobs = jobs
+        self._reader = read_frames(path, self.info["width"], self.info["height"])
+        self._buffer = []
+        self._base = 0  # source index of _buffer[0]
+        self._exhausted = False
+        for job in jobs:
+            job.open(self.info)
+
+    def next_tile(self, job):
+        """The job's next tile, None once the video is used up"""
+        want = job.position + job.images_per_combined
+        while not self._exhausted and self._base + len(self._buffer) < want:
+            frame = next(self._reader, None)
+            if frame is None:
+                self._exhausted = True
+            else:
+                self._buffer.append(frame)
+        end = min(want, self._base + len(self._buffer))
+        if end <= job.position:
+            if job.position == 0:
+                raise RuntimeError(f"No frames decoded from {job.video_path}")
+            return None
+        indices = list(range(job.position, end))
+        tile = FluxTile(job, job.tiles_made, indices, self._buffer[job.position - self._base:end - self._base],
+                        job.images_per_row)
+        job.position = end
+        job.tiles_made += 1
+        drop = min(j.position for j in self.jobs) - self._base
+        if drop > 0:
+            del self._buffer[:drop]
+            self._base += drop
+        return tile
+
+    def close(self):
+        self._reader.close()
+
+
+def output_path_for(video_path, suffix):
+    stem, _ = os.path.splitext(video_path)
+    return f"{stem}{suffix}"
+
+
+def iter_tiles(jobs, sources):
+    """
+    Tiles of all jobs, cut lazily while the queue asks for them. The job
+    furthest behind in its video goes next, so jobs sharing a video (both
+    flux passes read the prevscene video) keep only a tile's worth of
+    frames buffered between them.
+    """
+    active = list(jobs)
+    while active:
+        job = min(active, key=lambda j: (j.position, jobs.index(j)))
+        tile = sources[job.video_path].next_tile(job)
+        if tile is None:
+            active.remove(job)
+            continue
+        yield tile
+
+
+def colorize_videos(jobs, workflow=None, base_url=None, max_in_flight=COMFYFLUX_IN_FLIGHT):
+    """
+    Colorize several videos on one ComfyUI queue.
+    Tiles of all jobs are submitted interleaved, so both passes share the server
+    and its loaded weights, and each result is routed back to its own job.
+    Frames are decoded, tiled and encoded as the queue moves, never held for a
+    whole video. Returns the output paths in job order.
+    """
+    workflow = workflow or load_workflow(COMFYFLUX_WORKFLOW)
+    base_url = base_url or f"http://{COMFYUI_HOST}:{COMFYUI_PORT}"
+    # Jobs reading the same video decode it once
+    sources = {}
+    for job in jobs:
+        if job.video_path not in sources:
+            sources[job.video_path] = FrameSource(job.video_path, [j for j in jobs if j.video_path == job.video_path])
+
+    # PNG coding and frame encoding run off the event loop, so it keeps serving the websocket.
+    # Results are encoded on one thread: a job's writer is not shared between threads.
+    encoder = ThreadPoolExecutor(max_workers=1)
+
+    async def prepare(client, tile):
+        job = tile.job
+        prefix = os.path.basename(os.path.splitext(job.output_path)[0])
+        png = await asyncio.get_running_loop().run_in_executor(None, tile.compose)
+        name = await client.upload_image(png, f"{prefix}_tile{tile.index:05d}.png")
+        return patch_workflow(workflow, image=name, prompt=job.prompt, seed=job.seed, steps=job.steps,
+                              cfg=job.cfg, guidance=job.guidance)
+
+    async def on_result(tile, images):
+        job = tile.job
+        if not images:
+            raise RuntimeError(f"ComfyUI produced no image for tile {tile.index} of {job.output_path}")
+        loop = asyncio.get_running_loop()
+        frames = await loop.run_in_executor(None, tile.split, images[-1])
+        await loop.run_in_executor(encoder, job.add_result, tile, frames)
+        print(f"🎨 Flux {os.path.basename(job.output_path)}: tile {job.tiles_done}/{job.expected_tiles or '?'} done")
+
+    expected = [job.expected_tiles for job in jobs]
+    prompts = f"{sum(expected)} prompts" if all(expected) else "prompts"
+    print(f"🎨 Flux colorizing {len(jobs)} video(s) as {prompts} ({max_in_flight} in flight) via {base_url}")
+    try:
+        run_pipelined(base_url, iter_tiles(jobs, sources), prepare, on_result, max_in_flight=max_in_flight)
+    except BaseException:
+        encoder.shutdown()  # let a tile being encoded finish before its writer is closed
+        for job in jobs:
+            job.abort()
+        raise
+    finally:
+        encoder.shutdown()
+        for source in sources.values():
+            source.close()
+    return [job.write() for job in jobs]
+
+
+def colorize_video(video_path, output_path, prompt, seed, steps, cfg, guidance,
+                   images_per_row=1, images_per_combined=1, workflow=None, base_url=None,
+                   max_in_flight=COMFYFLUX_IN_FLIGHT):
+    """Colorize every frame of video_path through ComfyUI and write output_path"""
+    job = FluxJob(video_path, output_path, prompt, seed, steps, cfg, guidance,
+                  images_per_row, images_per_combined)
+    return colorize_videos([job], workflow=workflow, base_url=base_url, max_in_flight=max_in_flight)[0]
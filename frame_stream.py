@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Frame-streaming execution for per-frame stages.
+Frames are decoded by ffmpeg, passed through a chain of frame processors and
+encoded by a second ffmpeg, each step on its own thread with a bounded queue
+in between. Decode, every inference step and encode overlap, memory stays at
+a few frames per queue, and only the final video is written to disk.
+
+A processor is a callable frame -> frame (HxWx3 uint8 RGB numpy arrays).
+It may also define setup(), which runs on the processor's own thread before
+the first frame, so model loading overlaps with decoding.
+"""
+
+import json
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+_END = object()
+
+
+def probe_video(path):
+    """Width, height, frame rate, duration and frame count of the first video stream"""
+    out = subprocess.check_output([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate,nb_frames:format=duration",
+        "-of", "json", path,
+    ])
+    data = json.loads(out)
+    stream = data["streams"][0]
+    num, den = stream["r_frame_rate"].split("/")
+    fps_value = float(num) / float(den or 1)
+    duration = data.get("format", {}).get("duration")
+    duration = float(duration) if duration not in (None, "N/A") else None
+    nb_frames = stream.get("nb_frames")
+    if nb_frames and nb_frames.isdigit():
+        frames = int(nb_frames)
+    else:
+        frames = int(round(duration * fps_value)) if duration else None
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "fps": stream["r_frame_rate"],
+        "fps_value": fps_value,
+        "duration": duration,
+        "frames": frames,
+    }
+
+
+def read_frames(path, width, height):
+    """Yield decoded RGB frames of path"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-i", path, "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+        stdout=subprocess.PIPE,
+    )
+    frame_bytes = width * height * 3
+    try:
+        while True:
+            buf = process.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 3)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+class FrameWriter:
+    """ffmpeg encoder fed with raw RGB frames; opened on the first frame so the size is known"""
+
+    def __init__(self, path, fps, crf=16, codec="libx264"):
+        self.path = path
+        self.fps = fps
+        self.crf = crf
+        self.codec = codec
+        self.process = None
+        self.frames = 0
+
+    def write(self, frame):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.process = subprocess.Popen([
+                "ffmpeg", "-v", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+                "-c:v", self.codec, "-crf", str(self.crf), "-pix_fmt", "yuv420p", self.path,
+            ], stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        self.frames += 1
+
+    def close(self):
+        if self.process is None:
+            return 0
+        self.process.stdin.close()
+        code = self.process.wait()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg encoder exited with code {code} for {self.path}")
+        return code
+
+
+def stream_video(input_path, output_path, processors, queue_size=8, crf=16):
+    """
+    Run frames of input_path through processors [(name, callable), ...] into output_path.
+    Returns per-step stats: frames, busy seconds and frames/sec for each processor.
+    """
+    info = probe_video(input_path)
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(processors) + 1)]
+    stats = {name: {"frames": 0, "busy_seconds": 0.0} for name, _ in processors}
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def decode():
+        frames = read_frames(input_path, info["width"], info["height"])
+        try:
+            for frame in frames:
+                if not put(queues[0], frame):
+                    return
+            put(queues[0], _END)
+        except Exception as e:
+            fail(e)
+        finally:
+            frames.close()
+
+    def process(index, name, func):
+        try:
+            setup = getattr(func, "setup", None)
+            if setup is not None:
+                setup()
+            step = stats[name]
+            while True:
+                frame = get(queues[index])
+                if frame is _END:
+                    put(queues[index + 1], _END)
+                    return
+                started = time.time()
+                result = func(frame)
+                step["busy_seconds"] += time.time() - started
+                step["frames"] += 1
+                if not put(queues[index + 1], result):
+                    return
+        except Exception as e:
+            fail(e)
+
+    writer = FrameWriter(output_path, info["fps"], crf=crf)
+    threads = [threading.Thread(target=decode, daemon=True)]
+    for index, (name, func) in enumerate(processors):
+        threads.append(threading.Thread(target=process, args=(index, name, func), daemon=True))
+    started = time.time()
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            frame = get(queues[-1])
+            if frame is _END:
+                break
+            writer.write(frame)
+    except Exception as e:
+        fail(e)
+    finally:
+        for t in threads:
+            t.join()
+        writer.close()
+    if errors:
+        raise errors[0]
+    elapsed = time.time() - started
+    for step in stats.values():
+        step["fps"] = round(step["frames"] / step["busy_seconds"], 2) if step["busy_seconds"] else None
+    return {
+        "frames": writer.frames,
+        "expected_frames": info["frames"],
+        "wall_seconds": round(elapsed, 2),
+        "fps": round(writer.frames / elapsed, 2) if elapsed else None,
+        "steps": stats,
+    }
+
+
+class OnnxUpscaler:
+    """Real-ESRGAN style ONNX super-resolution as a frame processor"""
+
+    def __init__(self, model_path, scale=4, clahe=False, providers=None):
+        self.model_path = model_path
+        self.scale = scale
+        self.clahe = clahe
+        self.providers = providers or ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        self.session = None
+
+    def setup(self):
+        if self.session is None:
+            import onnxruntime as ort
+            self.session = ort.InferenceSession(self.model_path, providers=self.providers)
+            self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, frame):
+        import cv2
+        self.setup()
+        if self.clahe:
+            lab = cv2.cvtColor(frame, cv2.COLOR_RGB2LAB)
+            lab[..., 0] = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(lab[..., 0])
+            frame = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+        x = frame.astype(np.float32).transpose(2, 0, 1)[None] / 255.0
+        y = self.session.run(None, {self.input_name: x})[0][0]
+        out = (np.clip(y.transpose(1, 2, 0), 0, 1) * 255.0).round().astype(np.uint8)
+        height, width = frame.shape[:2]
+        target = (width * self.scale, height * self.scale)
+        if (out.shape[1], out.shape[0]) != target:
+            out = cv2.resize(out, target, interpolation=cv2.INTER_AREA)
+        return out
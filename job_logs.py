@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-job pipeline logs for remote_api_server.py.
+Every output line is appended to jobs/<id>/output.log as it arrives, and the
+last RING_BYTES are also kept in memory. Readers ask for everything after a
+byte offset: recent offsets are answered from the ring buffer, older ones
+from the file, so memory per job stays bounded no matter how long it runs.
+Readers can block until new bytes arrive (long-poll and Server-Sent Events).
+A log written by another process (an executor behind API workers) is read
+from the file, and waiting on it polls the file size.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+RING_BYTES = 256 * 1024
+READ_LIMIT = 1024 * 1024
+POLL_INTERVAL = 0.5
+
+
+class JobLog:
+    """Append-only log of one job, addressed by byte offset"""
+
+    def __init__(self, path, ring_bytes=RING_BYTES):
+        self.path = path
+        self.ring_bytes = ring_bytes
+        self._file = None
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._ring = deque()  # (offset, bytes) chunks, oldest first
+        self._ring_size = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def append(self, text):
+        data = text.encode("utf-8", errors="replace")
+        with self._cond:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "ab")
+                self.closed = False
+            self._file.write(data)
+            self._file.flush()
+            self._ring.append((self.size, data))
+            self._ring_size += len(data)
+            self.size += len(data)
+            while self._ring_size > self.ring_bytes and len(self._ring) > 1:
+                _, old = self._ring.popleft()
+                self._ring_size -= len(old)
+            self._cond.notify_all()
+
+    def _refresh(self):
+        # Not written by this process (yet): take the size from the file
+        if self._file is None:
+            try:
+                self.size = max(self.size, os.path.getsize(self.path))
+            except OSError:
+                pass
+
+    def read(self, offset=0, limit=READ_LIMIT):
+        """(bytes after offset, up to limit, cut at a line end when possible; next offset)"""
+        with self._cond:
+            self._refresh()
+            size = self.size
+            offset = max(0, min(offset, size))
+            if offset == size:
+                return b"", offset
+            if self._ring and offset >= self._ring[0][0]:
+                parts = []
+                for start, chunk in self._ring:
+                    end = start + len(chunk)
+                    if end > offset:
+                        parts.append(chunk[max(0, offset - start):])
+                data = b"".join(parts)[:limit]
+            else:
+                data = None
+        if data is None:
+            # Older than the ring buffer (or written by an earlier server process)
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read(min(limit, size - offset))
+        if len(data) == limit:
+            # Do not hand out half a line (or half a UTF-8 character) unless a single line exceeds limit
+            cut = data.rfind(b"\n")
+            if cut >= 0:
+                data = data[:cut + 1]
+        return data, offset + len(data)
+
+    def tail(self, nbytes):
+        """Offset nbytes before the end (at a line start when the ring buffer covers it)"""
+        with self._cond:
+            self._refresh()
+            start = max(0, self.size - nbytes)
+            for offset, chunk in self._ring:
+                if offset >= start:
+                    return offset
+            return start
+
+    def wait(self, offset, timeout):
+        """Block until the log grows past offset, is closed, or timeout passes; True if there is new data"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                self._refresh()
+                remaining = deadline - time.time()
+                if self.size > offset or self.closed or remaining <= 0:
+                    return self.size > offset
+                self._cond.wait(min(remaining, POLL_INTERVAL) if self._file is None else remaining)
+
+    def close(self):
+        with self._cond:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.closed = True
+            self._cond.notify_all()
+
+
+class JobLogs:
+    """The JobLog of every job this server has touched, opened lazily"""
+
+    def __init__(self, path_for):
+        self.path_for = path_for
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            log = self._logs.get(job_id)
+            if log is None:
+                log = JobLog(self.path_for(job_id))
+                self._logs[job_id] = log
+            return log
+
+    def reader(self, job_id):
+        """The live log of a running job, else a read-only view of its file"""
+        with self._lock:
+            log = self._logs.get(job_id)
+        return log if log is not None else JobLog(self.path_for(job_id))
+
+    def release(self, job_id):
+        """Close a finished job's log and drop its ring buffer; later reads go to the file"""
+        with self._lock:
+            log = self._logs.pop(job_id, None)
+        if log is not None:
+            log.close()
+
+    def exists(self, job_id):
+        with self._lock:
+            if job_id in self._logs:
+                return True
+        return os.path.exists(self.path_for(job_id))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Job queue with admission control for remote_api_server.py.
+Jobs wait in one queue ordered by priority (higher first), then by arrival.
+A fixed number of slots bounds how many run at once, and every job carries
+an estimated peak VRAM; the job at the head of the queue starts only when a
+slot is free and its estimate fits next to the jobs already running. Jobs
+behind it wait their turn even if they would fit, so a large job is never
+starved by a stream of small ones. A job whose estimate exceeds the whole
+budget is still run, but only on an otherwise idle GPU.
+
+    scheduler = JobScheduler(run=lambda job_id, slot: ..., slots=2, vram_budget_gb=80)
+    scheduler.submit("job_1", priority=0, vram_gb=24)
+"""
+
+import itertools
+import os
+import subprocess
+import threading
+import time
+
+DEFAULT_JOB_VRAM_GB = float(os.environ.get("JOB_VRAM_GB", "24"))
+
+
+def detect_vram_gb():
+    """NODE_VRAM_GB, else the total memory of the first GPU per nvidia-smi, else unlimited"""
+    if os.environ.get("NODE_VRAM_GB"):
+        return float(os.environ["NODE_VRAM_GB"])
+    try:
+        out = subprocess.run(["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+                             capture_output=True, text=True, timeout=10, check=True).stdout
+        return float(out.splitlines()[0]) / 1024
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return float("inf")
+
+
+class QueuedJob:
+    def __init__(self, job_id, priority, vram_gb, seq):
+        self.job_id = job_id
+        self.priority = priority
+        self.vram_gb = vram_gb
+        self.seq = seq
+        self.queued_at = time.time()
+
+    def key(self):
+        return (-self.priority, self.seq)
+
+
+class JobScheduler:
+    """
+    run(job_id, slot) is called on a fresh thread for every admitted job and
+    holds its slot until it returns. on_positions({job_id: position}) is told
+    about queued jobs whose 1-based queue position changed.
+    """
+
+    def __init__(self, run, slots=1, vram_budget_gb=None, on_positions=None):
+        if slots < 1:
+            raise ValueError("JobScheduler needs at least one slot")
+        self.run = run
+        self.slots = slots
+        self.vram_budget_gb = detect_vram_gb() if vram_budget_gb is None else vram_budget_gb
+        self.on_positions = on_positions
+        self._queue = []
+        self._running = {}  # job_id -> (slot, vram_gb, started)
+        self._free_slots = list(range(slots))
+        self._positions = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def __contains__(self, job_id):
+        with self._cond:
+            return job_id in self._running or any(q.job_id == job_id for q in self._queue)
+
+    @property
+    def reserved_gb(self):
+        return sum(vram for _, vram, _ in self._running.values())
+
+    def submit(self, job_id, priority=0, vram_gb=DEFAULT_JOB_VRAM_GB):
+        """Queue a job; returns its queue position"""
+        with self._cond:
+            if job_id in self._running or any(q.job_id == job_id for q in self._queue):
+                raise ValueError(f"Job {job_id} is already scheduled")
+            entry = QueuedJob(job_id, priority, vram_gb, next(self._seq))
+            self._queue.append(entry)
+            self._queue.sort(key=QueuedJob.key)
+            changed = self._positions_changed()
+            position = self._positions[job_id]
+            self._cond.notify_all()
+        self._report(changed)
+        return position
+
+    def remove(self, job_id):
+        """Take a job out of the queue; False if it is not queued (already started or unknown)"""
+        with self._cond:
+            entry = next((q for q in self._queue if q.job_id == job_id), None)
+            if entry is None:
+                return False
+            self._queue.remove(entry)
+            changed = self._positions_changed()
+            self._cond.notify_all()
+        self._report(changed)
+        return True
+
+    def position(self, job_id):
+        """1-based queue position, 0 if running, None if unknown"""
+        with self._cond:
+            if job_id in self._running:
+                return 0
+            return self._positions.get(job_id)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "free_slots": len(self._free_slots),
+                "vram_budget_gb": self.vram_budget_gb if self.vram_budget_gb != float("inf") else None,
+                "vram_reserved_gb": self.reserved_gb,
+                "running": [{"id": job_id, "slot": slot, "vram_gb": vram, "started_at": started}
+                            for job_id, (slot, vram, started) in self._running.items()],
+                "queued": [{"id": q.job_id, "position": i + 1, "priority": q.priority, "vram_gb": q.vram_gb,
+                            "queued_at": q.queued_at} for i, q in enumerate(self._queue)],
+            }
+
+    def _positions_changed(self):
+        positions = {q.job_id: i + 1 for i, q in enumerate(self._queue)}
+        changed = {job_id: pos for job_id, pos in positions.items() if self._positions.get(job_id) != pos}
+        self._positions = positions
+        return changed
+
+    def _report(self, changed):
+        if changed and self.on_positions is not None:
+            try:
+                self.on_positions(changed)
+            except Exception as e:
+                print(f"[Scheduler] Reporting queue positions failed: {e}")
+
+    def _admissible(self):
+        if not self._queue or not self._free_slots:
+            return False
+        head = self._queue[0]
+        return not self._running or self.reserved_gb + head.vram_gb <= self.vram_budget_gb
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._admissible)
+                entry = self._queue.pop(0)
+                slot = self._free_slots.pop(0)
+                self._running[entry.job_id] = (slot, entry.vram_gb, time.time())
+                changed = self._positions_changed()
+            print(f"[Scheduler] Starting {entry.job_id} on slot {slot} "
+                  f"(~{entry.vram_gb:g} GB, waited {time.time() - entry.queued_at:.1f}s)")
+            self._report(changed)
+            threading.Thread(target=self._run, args=(entry.job_id, slot), daemon=True).start()
+
+    def _run(self, job_id, slot):
+        try:
+            self.run(job_id, slot)
+        except Exception as e:
+            print(f"[Scheduler] Job {job_id} raised: {e}")
+        finally:
+            with self._cond:
+                self._running.pop(job_id, None)
+                self._free_slots.append(slot)
+                self._free_slots.sort()
+                self._cond.notify_all()
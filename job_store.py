@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Persistent job store for remote_api_server.py.
+Jobs live in a WAL-mode SQLite database, so history survives restarts and
+readers never wait on writers. Each job is one row: status and timestamps
+are columns (indexed for listing), and the rest of the job dict is a JSON
+document. A status or progress update rewrites only the changed keys with
+json_set() in a single UPDATE. Every change bumps the row's version.
+
+The pipeline output log is kept in a separate table and is only loaded
+when asked for, so listing jobs never touches it.
+
+Every thread gets its own connection; write transactions are short and take
+the write lock up front (BEGIN IMMEDIATE) so concurrent writers queue up
+instead of failing.
+
+wait() lets a reader block until a job moves past a version it has already
+seen (long-polling); writers in this process wake it at once, writes from
+other processes are noticed within WAIT_POLL seconds.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (json_extract(data, '$.fingerprint'));
+CREATE TABLE IF NOT EXISTS job_output (
+    job_id TEXT PRIMARY KEY REFERENCES jobs (id) ON DELETE CASCADE,
+    output TEXT NOT NULL DEFAULT ''
+);
+"""
+
+# Kept in columns, everything else only in the JSON document
+COLUMNS = ("status", "created_at", "updated_at", "version")
+
+WAIT_POLL = 1.0
+
+
+class JobStore:
+    """SQLite-backed job table shared by every request and job thread"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._generation = 0
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.pid != os.getpid():
+            db = None  # inherited through fork (gunicorn workers): never share a connection
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    class _Transaction:
+        def __init__(self, store):
+            self.store = store
+            self.db = store._connect()
+
+        def __enter__(self):
+            self.db.execute("BEGIN IMMEDIATE")
+            return self.db
+
+        def __exit__(self, exc_type, exc, tb):
+            self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+            if exc_type is None:
+                self.store._notify()
+
+    def _write(self):
+        return self._Transaction(self)
+
+    def _notify(self):
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _row_to_job(row, output=None):
+        job = json.loads(row["data"])
+        for column in COLUMNS:
+            job[column] = row[column]
+        if output is not None:
+            job["output"] = output
+        return job
+
+    def _insert(self, db, job):
+        job = dict(job)
+        output = job.pop("output", "") or ""
+        now = time.time()
+        job.setdefault("created_at", now)
+        job.setdefault("updated_at", now)
+        job["version"] = 1
+        data = {k: v for k, v in job.items() if k not in COLUMNS}
+        db.execute("INSERT INTO jobs (id, status, created_at, updated_at, version, data) VALUES (?, ?, ?, ?, 1, ?)",
+                   (job["id"], job["status"], job["created_at"], job["updated_at"], json.dumps(data, default=str)))
+        db.execute("INSERT INTO job_output (job_id, output) VALUES (?, ?)", (job["id"], output))
+        job["output"] = output
+        return job
+
+    def create(self, job):
+        """Insert a new job dict (its 'output' goes to the output table)"""
+        with self._write() as db:
+            return self._insert(db, job)
+
+    def create_or_find(self, job, statuses, accept=None):
+        """
+        Insert job unless a job with the same 'fingerprint' is in one of statuses
+        (completed ones first, then newest) and accept(existing) agrees. Returns
+        (job, created). The lookup and the insert share one write transaction,
+        so two identical requests cannot both create a job.
+        """
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._write() as db:
+            rows = db.execute(f"SELECT * FROM jobs WHERE json_extract(data, '$.fingerprint') = ? "
+                              f"AND status IN ({placeholders}) ORDER BY status = 'completed' DESC, created_at DESC",
+                              (job["fingerprint"], *statuses)).fetchall()
+            for row in rows:
+                existing = self._row_to_job(row)
+                if accept is None or accept(existing):
+                    return existing, False
+            return self._insert(db, job), True
+
+    def get(self, job_id, include_output=True):
+        """Job dict or None"""
+        db = self._connect()
+        row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        output = None
+        if include_output:
+            out = db.execute("SELECT output FROM job_output WHERE job_id = ?", (job_id,)).fetchone()
+            output = out["output"] if out is not None else ""
+        return self._row_to_job(row, output)
+
+    def exists(self, job_id):
+        return self._connect().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def update(self, job_id, **fields):
+        """Set top-level fields in one UPDATE; returns the new version (None if no such job)"""
+        output = fields.pop("output", None)
+        now = fields.pop("updated_at", time.time())
+        sets = ["updated_at = ?", "version = version + 1"]
+        params = [now]
+        if "status" in fields:
+            sets.append("status = ?")
+            params.append(fields["status"])
+        data_fields = {k: v for k, v in fields.items() if k not in COLUMNS}
+        if data_fields:
+            paths = []
+            for key, value in data_fields.items():
+                paths.append("?, json(?)")
+                params.extend(['$."{}"'.format(key.replace('"', '')), json.dumps(value, default=str)])
+            sets.append(f"data = json_set(data, {', '.join(paths)})")
+        params.append(job_id)
+        with self._write() as db:
+            if db.execute(f"UPDATE jobs SET {', '.join(sets)} WHERE id = ?", params).rowcount == 0:
+                return None
+            if output is not None:
+                db.execute("UPDATE job_output SET output = ? WHERE job_id = ?", (output, job_id))
+            return db.execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()["version"]
+
+    def mutate(self, job_id, func):
+        """
+        Read-modify-write a job under the write lock: func(job) edits the dict
+        in place and may return False to leave the row untouched.
+        Returns the job dict as written, or None if it does not exist.
+        """
+        with self._write() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = self._row_to_job(row)
+            if func(job) is False:
+                return job
+            job["updated_at"] = time.time()
+            job["version"] = row["version"] + 1
+            data = {k: v for k, v in job.items() if k not in COLUMNS and k != "output"}
+            db.execute("UPDATE jobs SET status = ?, updated_at = ?, version = ?, data = ? WHERE id = ?",
+                       (job["status"], job["updated_at"], job["version"], json.dumps(data, default=str), job_id))
+        return job
+
+    def version(self, job_id):
+        row = self._connect().execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["version"] if row is not None else None
+
+    def wait(self, job_id, since_version, timeout):
+        """
+        Block until the job's version is above since_version or timeout
+        seconds pass; returns the current version (None if no such job).
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._changed:
+                generation = self._generation
+            version = self.version(job_id)
+            remaining = deadline - time.time()
+            if version is None or version > since_version or remaining <= 0:
+                return version
+            with self._changed:
+                self._changed.wait_for(lambda: self._generation != generation, timeout=min(remaining, WAIT_POLL))
+
+    def list(self, status=None, limit=None, include_output=False):
+        """Jobs newest first (without their output unless asked)"""
+        query = "SELECT jobs.*{} FROM jobs".format(", job_output.output" if include_output else "")
+        if include_output:
+            query += " LEFT JOIN job_output ON job_output.job_id = jobs.id"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC, id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [self._row_to_job(row, (row["output"] or "") if include_output else None)
+                for row in self._connect().execute(query, params)]
+
+    def page(self, status=None, limit=50, after=None, include_output=False):
+        """
+        One page of jobs, newest first. after is the (created_at, id) of the
+        last job of the previous page; the returned cursor is that of this
+        page's last job, or None when there is nothing more. limit=None
+        returns every remaining job.
+        """
+        query = "SELECT jobs.*{} FROM jobs".format(", job_output.output" if include_output else "")
+        if include_output:
+            query += " LEFT JOIN job_output ON job_output.job_id = jobs.id"
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if after is not None:
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit) + 1)
+        rows = self._connect().execute(query, params).fetchall()
+        if limit is None:
+            limit = len(rows)
+        jobs = [self._row_to_job(row, (row["output"] or "") if include_output else None) for row in rows[:limit]]
+        cursor = (jobs[-1]["created_at"], jobs[-1]["id"]) if len(rows) > limit and jobs else None
+        return jobs, cursor
+
+    def count(self, status=None):
+        if status:
+            return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+        return self._connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def count_by_status(self):
+        """{status: number of jobs}"""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def fail_interrupted(self, statuses=("pending", "running")):
+        """Mark jobs a previous server process left unfinished as failed (they can be resumed)"""
+        interrupted = [job["id"] for status in statuses for job in self.list(status=status)]
+        for job_id in interrupted:
+            self.update(job_id, status="failed", error="Server restarted while the job was running")
+        return interrupted
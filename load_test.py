@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load test for a remote_api_server.py node: how many clients can wait on a
+job at once. Opens N long-pollers (GET /jobs/<id>?wait=30&since_version=...)
+and M log streams (GET /jobs/<id>/logs/stream), and meanwhile times GET
+/health to see whether the node still answers quickly with every long-lived
+connection held open.
+
+    python load_test.py --url http://127.0.0.1:5000 --job job_123 --pollers 500 --streams 100
+
+Without --job a job is created from --manual-path (a file on the node), so
+pollers and streams see real updates. Compare the modes of the server:
+    python remote_api_server.py --port 5000
+    python remote_api_server.py --port 5000 --server gunicorn --workers 4 --threads 64
+    python remote_api_server.py --port 5000 --server gunicorn --worker-class gevent
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+REPORT_INTERVAL = 5
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.health = []
+
+    def add(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def health_latency(self, seconds):
+        with self.lock:
+            self.health.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            counts = dict(self.counts)
+            latencies = sorted(self.health)
+        if latencies:
+            counts["health_p50_ms"] = round(1000 * statistics.median(latencies), 1)
+            counts["health_p95_ms"] = round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1)
+            counts["health_max_ms"] = round(1000 * latencies[-1], 1)
+        return counts
+
+
+def poller(url, job_id, stats, stop):
+    session = requests.Session()
+    version = 0
+    while not stop.is_set():
+        try:
+            response = session.get(f"{url}/jobs/{job_id}", params={"wait": 30, "since_version": version},
+                                   timeout=45)
+            response.raise_for_status()
+            version = response.json().get("version", version)
+            stats.add("poll_responses")
+        except requests.RequestException:
+            stats.add("poll_errors")
+            time.sleep(1)
+
+
+def streamer(url, job_id, stats, stop):
+    session = requests.Session()
+    last_event_id = None
+    while not stop.is_set():
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        try:
+            with session.get(f"{url}/jobs/{job_id}/logs/stream", headers=headers, stream=True,
+                             timeout=(10, 60)) as response:
+                response.raise_for_status()
+                stats.add("streams_opened")
+                for line in response.iter_lines(decode_unicode=True):
+                    if stop.is_set():
+                        return
+                    if line.startswith("id: "):
+                        last_event_id = line[4:]
+                        stats.add("stream_events")
+                    elif line.startswith("event: end"):
+                        break
+            # Job finished: reconnect from the same offset after a pause, like a client reopening the page
+            time.sleep(1)
+        except requests.RequestException:
+            stats.add("stream_errors")
+            time.sleep(1)
+
+
+def prober(url, interval, stats, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.time()
+        try:
+            session.get(f"{url}/health", timeout=30).raise_for_status()
+            stats.health_latency(time.time() - started)
+        except requests.RequestException:
+            stats.add("health_errors")
+        stop.wait(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent long-poll / log stream load test for a node")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Node base URL")
+    parser.add_argument("--job", default=None, help="Job to poll and stream (default: create one)")
+    parser.add_argument("--manual-path", default="input_videos/test.mp4",
+                        help="Input of the job created when --job is not given")
+    parser.add_argument("--pollers", type=int, default=200, help="Concurrent long-poll clients")
+    parser.add_argument("--streams", type=int, default=50, help="Concurrent SSE log streams")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--probe-interval", type=float, default=0.5, help="Seconds between /health probes")
+    args = parser.parse_args()
+    url = args.url.rstrip("/")
+
+    job_id = args.job
+    if job_id is None:
+        response = requests.post(f"{url}/jobs", json={"inputMethod": "manual", "manualPath": args.manual_path},
+                                 timeout=30)
+        response.raise_for_status()
+        job_id = response.json()["id"]
+        print(f"Created job {job_id}")
+
+    stats = Stats()
+    stop = threading.Event()
+    threads = [threading.Thread(target=poller, args=(url, job_id, stats, stop), daemon=True)
+               for _ in range(args.pollers)]
+    threads += [threading.Thread(target=streamer, args=(url, job_id, stats, stop), daemon=True)
+                for _ in range(args.streams)]
+    threads.append(threading.Thread(target=prober, args=(url, args.probe_interval, stats, stop), daemon=True))
+    print(f"{args.pollers} pollers, {args.streams} streams against {url} for {args.duration:g}s")
+    for thread in threads:
+        thread.start()
+
+    deadline = time.time() + args.duration
+    while time.time() < deadline:
+        time.sleep(min(REPORT_INTERVAL, max(deadline - time.time(), 0)))
+        print(f"[{args.duration - max(deadline - time.time(), 0):5.0f}s] {stats.summary()}")
+    stop.set()
+
+    summary = stats.summary()
+    print("\nSummary:")
+    for name, value in sorted(summary.items()):
+        print(f"  {name}: {value}")
+    errors = sum(summary.get(name, 0) for name in ("poll_errors", "stream_errors", "health_errors"))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+VRAM-budgeted registry of resident models.
+Every resident (a torch model we loaded, the flux weights held by ComfyUI,
+memory a Utils stage left cached) is tracked with its footprint and an evict
+callback. Nothing is freed until a new load or a stage reservation would go
+over the budget; then the least-recently-used residents are evicted until it
+fits. Stages that share weights, and jobs run back to back on the warm worker,
+keep their models resident.
+
+The accounting does not touch torch unless asked to measure a model, so it can
+be exercised on CPU with simulated sizes:
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    registry.register("a", size=6 * GB, evict=lambda: None)
+    registry.reserve(5 * GB)   # evicts "a"
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+GB = 1024 ** 3
+
+
+class Resident:
+    def __init__(self, key, obj, size, evict, pinned=False):
+        self.key = key
+        self.obj = obj
+        self.size = size
+        self.evict = evict
+        self.pinned = pinned
+        self.last_used = time.time()
+        self.loads = 1
+
+
+def model_size(obj):
+    """Bytes held by a torch module's parameters and buffers (0 for anything else)"""
+    total = 0
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(obj, attr, None)
+        if not callable(tensors):
+            continue
+        for t in tensors():
+            total += t.numel() * t.element_size()
+    return total
+
+
+def default_budget():
+    """MODEL_VRAM_BUDGET_GB, else 92% of the first GPU, else unlimited"""
+    if os.environ.get("MODEL_VRAM_BUDGET_GB"):
+        return int(float(os.environ["MODEL_VRAM_BUDGET_GB"]) * GB)
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return int(torch.cuda.get_device_properties(0).total_memory * 0.92)
+    except ImportError:
+        pass
+    return float("inf")
+
+
+class ModelRegistry:
+    """LRU set of residents whose sizes must stay within budget_bytes"""
+
+    def __init__(self, budget_bytes=None, sizer=model_size):
+        self.budget_bytes = default_budget() if budget_bytes is None else budget_bytes
+        self.sizer = sizer
+        self._residents = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return sum(r.size for r in self._residents.values())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._residents
+
+    def touch(self, key):
+        with self._lock:
+            resident = self._residents.get(key)
+            if resident is not None:
+                resident.last_used = time.time()
+                self._residents.move_to_end(key)
+            return resident
+
+    def get(self, key):
+        resident = self.touch(key)
+        return resident.obj if resident is not None else None
+
+    def get_or_load(self, key, loader, size=None, evict=None, pinned=False):
+        """
+        Return the resident for key, loading it with loader() if needed.
+        size is the expected footprint used to make room before loading;
+        without it the loaded object is measured with the sizer afterwards.
+        """
+        with self._lock:
+            resident = self.touch(key)
+            if resident is not None:
+                self.hits += 1
+                return resident.obj
+            self.misses += 1
+            if size is not None:
+                self.reserve(size)
+            obj = loader()
+            actual = size if size is not None else self.sizer(obj)
+            self.register(key, actual, evict=evict, obj=obj, pinned=pinned)
+            return obj
+
+    def register(self, key, size, evict=None, obj=None, pinned=False):
+        """Track a resident loaded elsewhere (or update its size if already tracked)"""
+        with self._lock:
+            resident = self._residents.get(key)
+            if resident is not None:
+                resident.size = size
+                resident.obj = obj if obj is not None else resident.obj
+                resident.evict = evict or resident.evict
+                resident.loads += 1
+                self.touch(key)
+            else:
+                self._residents[key] = Resident(key, obj, size, evict, pinned)
+            self._make_room(0, keep={key})
+            return self._residents[key]
+
+    def reserve(self, nbytes, keep=()):
+        """Evict LRU residents (except keep) until nbytes more fit in the budget"""
+        with self._lock:
+            return self._make_room(nbytes, keep=set(keep))
+
+    def _make_room(self, nbytes, keep):
+        evicted = []
+        for key in list(self._residents):
+            if self.used_bytes + nbytes <= self.budget_bytes:
+                break
+            resident = self._residents[key]
+            if resident.pinned or key in keep:
+                continue
+            self.release(key)
+            evicted.append(key)
+        if self.used_bytes + nbytes > self.budget_bytes:
+            print(f"⚠️ VRAM budget exceeded: {(self.used_bytes + nbytes) / GB:.1f}GB needed, "
+                  f"{self.budget_bytes / GB:.1f}GB budget")
+        return evicted
+
+    def release(self, key):
+        """Evict one resident now"""
+        with self._lock:
+            resident = self._residents.pop(key, None)
+        if resident is None:
+            return False
+        print(f"♻️ Evicting {key} ({resident.size / GB:.1f}GB)")
+        self.evictions += 1
+        if resident.evict is not None:
+            resident.evict()
+        resident.obj = None
+        return True
+
+    def clear(self):
+        for key in list(self._residents):
+            self.release(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_gb": None if self.budget_bytes == float("inf") else round(self.budget_bytes / GB, 2),
+                "used_gb": round(self.used_bytes / GB, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "residents": {k: round(r.size / GB, 2) for k, r in self._residents.items()},
+            }
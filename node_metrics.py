@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics for remote_api_server.py.
+Counters, histograms and last-value gauges are kept in a small WAL-mode
+SQLite file next to the job store, so every process of a node (gunicorn
+workers, the executor) adds to the same numbers and a scrape can land on
+any of them. Live values (queue depth, GPU memory, ComfyUI up) are read at
+scrape time by the server; facts that do not change while the node runs
+(Python version, GPUs) are collected once at startup by node_info().
+
+    metrics = Metrics("/workspace/metrics.db")
+    metrics.inc("pipeline_upload_bytes_total", 1024)
+    text = render(metrics.samples())
+"""
+
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+# Stage wall times range from seconds (scene split) to hours (colorizing a film)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+GPU_QUERY_TTL = 5.0
+
+# name -> (type, help); render() prints families in this order
+METRICS = {
+    "pipeline_node_info": ("gauge", "Static facts about the node, collected at startup"),
+    "pipeline_jobs": ("gauge", "Jobs in the job store by status"),
+    "pipeline_jobs_deduplicated_total": ("counter", "Job requests answered with an identical existing job"),
+    "pipeline_queue_depth": ("gauge", "Jobs waiting for a slot"),
+    "pipeline_jobs_running": ("gauge", "Jobs holding a slot"),
+    "pipeline_scheduler_slots": ("gauge", "Jobs the node runs at once"),
+    "pipeline_scheduler_free_slots": ("gauge", "Slots not running a job"),
+    "pipeline_scheduler_vram_reserved_gb": ("gauge", "VRAM estimate of the running jobs"),
+    "pipeline_scheduler_vram_budget_gb": ("gauge", "VRAM shared by running jobs"),
+    "pipeline_backlog_seconds": ("gauge", "Estimated seconds of work left in running and queued jobs"),
+    "pipeline_stage_duration_seconds": ("histogram", "Wall time of computed pipeline stages"),
+    "pipeline_stage_frames_total": ("counter", "Frames produced by computed pipeline stages"),
+    "pipeline_stage_fps": ("gauge", "Frames/sec of the last computed run of each stage"),
+    "pipeline_upload_bytes_total": ("counter", "Bytes received by uploads"),
+    "pipeline_download_bytes_total": ("counter", "Bytes served by downloads"),
+    "pipeline_gpu_memory_used_bytes": ("gauge", "GPU memory in use"),
+    "pipeline_gpu_memory_total_bytes": ("gauge", "GPU memory"),
+    "pipeline_comfyui_up": ("gauge", "1 if the ComfyUI server of a slot answers"),
+}
+
+
+def _label_key(labels):
+    return json.dumps({k: str(v) for k, v in labels.items()}, sort_keys=True)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(samples):
+    """Prometheus text format (0.0.4) of (name, labels, value) samples"""
+    families = {}
+    for name, labels, value in samples:
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and METRICS.get(base, ("",))[0] == "histogram":
+                family = base
+        families.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families, key=lambda f: list(METRICS).index(f) if f in METRICS else len(METRICS)):
+        kind, help_text = METRICS.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for name, labels, value in families[family]:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """Counters and gauges shared by every process using the same file"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.pid != os.getpid():
+            db = None  # inherited through fork: never share a connection
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _add(self, db, name, labels, amount):
+        db.execute("INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+                   "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                   (name, _label_key(labels), amount))
+
+    def inc(self, name, amount=1, **labels):
+        if amount:
+            self._add(self._connect(), name, labels, amount)
+
+    def set(self, name, value, **labels):
+        self._connect().execute("INSERT OR REPLACE INTO samples (name, labels, value) VALUES (?, ?, ?)",
+                                (name, _label_key(labels), value))
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """Add value to histogram name (cumulative _bucket counts, _sum and _count)"""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for bound in buckets:
+                if value <= bound:
+                    self._add(db, f"{name}_bucket", dict(labels, le=_format_value(bound)), 1)
+            self._add(db, f"{name}_bucket", dict(labels, le="+Inf"), 1)
+            self._add(db, f"{name}_sum", labels, value)
+            self._add(db, f"{name}_count", labels, 1)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def record_event(self, event):
+        """Stage durations and frame rates from a pipeline telemetry event (telemetry.py)"""
+        if event.get("event") != "stage_end" or event.get("source") not in ("computed", "cache_miss"):
+            return  # cache hits and resumed stages did no work
+        stage = event.get("stage")
+        if event.get("wall_seconds") is not None:
+            self.observe("pipeline_stage_duration_seconds", event["wall_seconds"], stage=stage)
+        if event.get("frames"):
+            self.inc("pipeline_stage_frames_total", event["frames"], stage=stage)
+        if event.get("fps"):
+            self.set("pipeline_stage_fps", event["fps"], stage=stage)
+
+    def samples(self):
+        """Stored (name, labels, value) samples, histogram buckets in bound order"""
+        rows = self._connect().execute("SELECT name, labels, value FROM samples ORDER BY name, labels").fetchall()
+        samples = [(name, json.loads(key), value) for name, key, value in rows]
+
+        def order(sample):
+            name, labels, _ = sample
+            le = labels.get("le")
+            bound = float("inf") if le == "+Inf" else float(le) if le is not None else 0.0
+            return (name, _label_key({k: v for k, v in labels.items() if k != "le"}), bound)
+        return sorted(samples, key=order)
+
+
+def _nvidia_smi(fields):
+    out = subprocess.run(["nvidia-smi", f"--query-gpu={fields}", "--format=csv,noheader,nounits"],
+                         capture_output=True, text=True, timeout=10, check=True).stdout
+    return [[value.strip() for value in line.split(",")] for line in out.splitlines() if line.strip()]
+
+
+def node_info(workspace):
+    """Facts that do not change while the server runs"""
+    try:
+        python = subprocess.check_output(["python", "--version"], stderr=subprocess.STDOUT,
+                                         timeout=10).decode().strip()
+    except (OSError, subprocess.SubprocessError):
+        python = f"Python {platform.python_version()} (server)"
+    try:
+        gpus = [{"index": int(index), "name": name, "memory_total_bytes": int(float(total) * 1024 * 1024)}
+                for index, name, total in _nvidia_smi("index,name,memory.total")]
+    except (OSError, subprocess.SubprocessError, ValueError):
+        gpus = []
+    return {
+        "hostname": socket.gethostname(),
+        "python": python,
+        "cpu_count": os.cpu_count(),
+        "gpus": gpus,
+        "pipeline_py": os.path.exists(os.path.join(workspace, "pipeline.py")),
+        "pipeline_wrapper_py": os.path.exists(os.path.join(workspace, "pipeline_wrapper.py")),
+        "started_at": time.time(),
+    }
+
+
+_gpu_cache = {"at": 0.0, "value": []}
+_gpu_lock = threading.Lock()
+
+
+def gpu_memory():
+    """[(index, used_bytes, total_bytes)] per GPU, re-read at most every GPU_QUERY_TTL seconds"""
+    with _gpu_lock:
+        if time.time() - _gpu_cache["at"] >= GPU_QUERY_TTL:
+            try:
+                _gpu_cache["value"] = [(int(index), int(float(used) * 1024 * 1024), int(float(total) * 1024 * 1024))
+                                       for index, used, total in _nvidia_smi("index,memory.used,memory.total")]
+            except (OSError, subprocess.SubprocessError, ValueError):
+                _gpu_cache["value"] = []
+            _gpu_cache["at"] = time.time()
+        return _gpu_cache["value"]
@@ -1,884 +1,607 @@
 # -*- coding: utf-8 -*-
 
 import sys
-
 import os
-
+import threading
+import time
 import torch, gc
+from pathlib import Path
 
-from pathlib import Path 
-
-
-
-# ------------------------
-
-# Take input video path as command-line argument
-
-# ------------------------
-
-if len(sys.argv) > 1:
-
-    input_video_path = sys.argv[1]
-
-    unet_flag = sys.argv[2].strip().lower() in ['true', '1', 'yes', 'y']
-
-    face_restore_flag = sys.argv[3].strip().lower() in ['true', '1', 'yes', 'y']
-
-    upscale_flag = sys.argv[4].strip().lower() in ['true', '1', 'yes', 'y']
-
-    try:
-
-        upscale_value = float(sys.argv[5])
-
-        if not (1.0 <= upscale_value <= 4.0):
-
-            raise ValueError("Upscale value must be between 1.0 and 4.0")
-
-    except ValueError as ve:
-
-        raise ValueError(f"Invalid upscale value: {ve}")
-
-    clahe_flag = sys.argv[6].strip().lower() in ['true', '1', 'yes', 'y']
-
-else:
-
-    raise ValueError("Usage: pipeline.py <input_video_path>")
-
+from comfyui_supervisor import get_supervisor
+from model_registry import ModelRegistry, GB
+from stage_cache import StageCache
+from stage_manifest import StageManifest
+import telemetry
+from stage_graph import Stage, StageGraph, GPU, CPU, IO, DEFAULT_LIMITS
 
 
 # ------------------------
-
 # Utility to clear GPU memory
-
 # ------------------------
-
 def clear_gpu():
-
     torch.cuda.synchronize()
-
     torch.cuda.empty_cache()
-
     gc.collect()
 
 
+# One supervisor per node port: started once, probed for readiness and left
+# warm for every flux stage and for the next job on this node.
+comfyui = get_supervisor()
+
+# Resident models on this process's GPU. Survives across jobs on the warm worker.
+registry = ModelRegistry()
+
+# Rough peak VRAM of each GPU stage, used to make room before it runs
+STAGE_VRAM_GB = {
+    "restore": 6,
+    "face_restore": 6,
+    "background_upscale": 8,
+    "restore_enhance_upscale": 16,
+    "scene_split": 2,
+    "flux": 24,
+    "flux_concat": 24,
+    "flux_prev": 24,
+    "colorize_prev": 10,
+    "mask_merge": 6,
+    "colorize": 10,
+}
+COMFYUI_RESIDENT_GB = float(os.environ.get("COMFYUI_RESIDENT_GB", "22"))
+# The Utils flux helpers have their ComfyUI address built in
+UTILS_COMFYUI_PORT = 8188
+FLUX_STAGES = ("flux", "flux_concat", "flux_prev")
 
 
+# ------------------------
+# Stage parameters (part of every stage's cache key)
+# ------------------------
+FLUX_SETTINGS = {
+    "flux_concat_prompt": "restore and colorize this, no warm/cool tint in entire image, color background, natural and pale skintones, ornaments on people with gold color",
+    "flux_concat_seed": 2^24,
+    "flux_concat_steps": 20,
+    "flux_concat_guidance": 2.5,
+    "flux_concat_images_per_row": 2,
+    "flux_concat_images_per_combined": 6,
+    "flux_prev_prompt": "Restore and colorize this,  No warm/cool tint in entire image, color background, natural skintones",
+    "flux_prev_seed": 2^24,
+    "flux_prev_steps": 20,
+    "flux_prev_guidance": 5,
+    "flux_cfg": 1.0,
+}
+# Keyword arguments for postprocess_videos_cached (Task 7); empty keeps the helper's defaults
+POSTPROCESS_PARAMS = ["postprocess_settings"]
 
 
+TRUE_VALUES = ['true', '1', 'yes', 'y']
 
-import sys
-
-import os
-
-import torch, gc
-
-from pathlib import Path 
-
-import subprocess
-
-import time
-
-import signal
-
-
-
-def start_comfyui():
-
-    print("🚀 Starting ComfyUI on port 8188...")
-
-    log_file = open("/workspace/comfyui_runtime.log", "w")
-
-    process = subprocess.Popen(
-
-        ["python", "/opt/comfyui/main.py", "--listen", "0.0.0.0", "--port", "8188"],
-
-        stdout=log_file,
-
-        stderr=log_file,
-
-        preexec_fn=os.setsid  # start new process group (so we can kill easily)
-
-    )
-
-    time.sleep(120)  # wait for it to initialize
-
-    print(f"✅ ComfyUI started with PID {process.pid}")
-
-    return process
-
-
-
-def stop_comfyui(process):
-
-    if process:
-
-        print(f"🛑 Stopping ComfyUI (PID: {process.pid})...")
-
-        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-
-        process.wait()
-
-        print("✅ ComfyUI stopped.")
-
-
-
-def stop_comfyui(process):
-
-    if process:
-
-        print(f"🛑 Stopping ComfyUI (PID: {process.pid})...")
-
-        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-
-        process.wait(timeout=300)
-
-        time.sleep(120)  # give it time to release GPU and port
-
-        print("✅ ComfyUI stopped and cleaned.")
-
-
-
-
-
-
-
-
-
-
-
-import requests
-
-
-
-def wait_for_comfyui(port=8188, timeout=600):
-
-    print(f"⏳ Waiting for ComfyUI to start on port {port}...")
-
-    start_time = time.time()
-
-    while time.time() - start_time < timeout:
-
-        try:
-
-            r = requests.get(f"http://127.0.0.1:{port}")
-
-            if r.status_code == 200:
-
-                print("✅ ComfyUI is ready!")
-
-                return True
-
-        except requests.exceptions.ConnectionError:
-
-            pass
-
-        time.sleep(5)
-
-    raise TimeoutError("❌ ComfyUI failed to start within timeout")
-
-
-
-
-
-
-
-restored_video_path= None
-
-faces_upscaled_video_path= None
-
-background_upscaled_video_path = None
-
-scene_split_preview_video_path = None
-
-scene_split_preview_upscaled_video_path = None
-
-deoldify_video_path = None
-
-unet_video_path = None
-
-flux_path = None
-
-colorized_final_video_path = None
-
-post_processed_video_path = None
 
-final_video_path = None
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
 
-final_postprocessed_video_path =None
 
+# ------------------------
+# Take input video path as command-line argument
+# ------------------------
+def parse_args(argv):
+    """
+    Build a run_pipeline() config from
+    `pipeline.py <input> [unet] [face] [upscale] [value] [clahe] [--manifest PATH] [--resume]`
+    """
+    argv = list(argv)
+    options = {}
+    if "--resume" in argv:
+        argv.remove("--resume")
+        options["resume"] = True
+    if "--manifest" in argv:
+        i = argv.index("--manifest")
+        options["manifest_path"] = argv[i + 1]
+        del argv[i:i + 2]
+    if len(argv) < 1:
+        raise ValueError("Usage: pipeline.py <input_video_path> [unet_flag] [face_restore_flag] "
+                         "[upscale_flag] [upscale_value] [clahe_flag] [--manifest PATH] [--resume]")
+    names = ["input_video_path", "unet_flag", "face_restore_flag", "upscale_flag", "upscale_value", "clahe_flag"]
+    config = dict(zip(names, argv))
+    config.update(options)
+    return config
+
+
+def normalize_config(config):
+    """Validate a config dict and coerce flags/values to their real types"""
+    if not config.get("input_video_path"):
+        raise ValueError("input_video_path is required")
+    try:
+        upscale_value = float(config.get("upscale_value", 2.0))
+        if not (1.0 <= upscale_value <= 4.0):
+            raise ValueError("Upscale value must be between 1.0 and 4.0")
+    except ValueError as ve:
+        raise ValueError(f"Invalid upscale value: {ve}")
+    normalized = dict(FLUX_SETTINGS)
+    normalized.update(config)
+    normalized["upscale_value"] = upscale_value
+    for flag in ("unet_flag", "face_restore_flag", "upscale_flag", "clahe_flag"):
+        normalized[flag] = _flag(config.get(flag, False))
+    normalized["streaming_flag"] = _flag(config.get("streaming_flag", os.environ.get("PIPELINE_STREAMING", "0")))
+    normalized["scene_shard_flag"] = _flag(config.get("scene_shard_flag", os.environ.get("PIPELINE_SCENE_SHARDS", "0")))
+    normalized["scene_workers"] = int(config.get("scene_workers", os.environ.get("PIPELINE_SCENE_WORKERS", "2")))
+    normalized["scene_shard_min_seconds"] = float(
+        config.get("scene_shard_min_seconds", os.environ.get("PIPELINE_SCENE_SHARD_SECONDS", "30")))
+    normalized["postprocess_settings"] = dict(config.get("postprocess_settings") or {})
+    return normalized
 
 
 # ------------------------
-
 # Task 1: Restore B&W Film
-
 # ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import restore_bw_film_cached
-
-input_path = input_video_path
-
-restored_video_path = restore_bw_film_cached(input_path, input_video_path)
-
-print(f"Restored video available at: {restored_video_path}")
-
+def restore(ctx):
+    from Utils.main_utils import restore_bw_film_cached
+    restored_video_path = restore_bw_film_cached(ctx["input_video_path"], ctx["input_video_path"])
+    print(f"Restored video available at: {restored_video_path}")
+    return restored_video_path
 
 
 # ------------------------
-
 # Task 2: Face Enhancement
-
 # ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import upscale_faces_cached
-
-# import io
-
-# import contextlib
-
-input_path = restored_video_path or input_video_path
-
-if(face_restore_flag):
-
-    #with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
-
-    faces_upscaled_video_path = upscale_faces_cached(input_path, input_video_path)
-
+def face_restore(ctx):
+    from Utils.main_utils import upscale_faces_cached
+    input_path = ctx["restored_video_path"] or ctx["input_video_path"]
+    faces_upscaled_video_path = upscale_faces_cached(input_path, ctx["input_video_path"])
     print("Face-enhanced video available at:", faces_upscaled_video_path)
-
+    return faces_upscaled_video_path
 
 
 # ------------------------
-
 # Task 3: Backgroung upscaling
-
 # ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import background_upscale_video_onnx_cached, downscale_video_in_place, resize_video_in_place
-
-input_path = faces_upscaled_video_path or input_path
-
-if(upscale_flag):
-
-    #downscale_video_in_place(input_path, 2)
-
+def background_upscale(ctx):
+    from Utils.main_utils import background_upscale_video_onnx_cached
+    input_path = ctx["faces_upscaled_video_path"] or ctx["restored_video_path"] or ctx["input_video_path"]
     model = 'models/Real-ESRGAN-General-x4v3.onnx'
-
-    background_upscaled_video_path = background_upscale_video_onnx_cached(input_path, input_video_path, clahe_flag, scale = int(upscale_value), model_path=model)
-
-    #resize_video_in_place(background_upscaled_video_path, input_video_path)
-
+    background_upscaled_video_path = background_upscale_video_onnx_cached(
+        input_path, ctx["input_video_path"], ctx["clahe_flag"],
+        scale=int(ctx["upscale_value"]), model_path=model)
     print("Background Upscaled video at:", background_upscaled_video_path)
+    return background_upscaled_video_path
 
 
-
-
-
+# ------------------------
+# Tasks 1-3 fused: frames stream restore -> face enhance -> upscale
+# ------------------------
+def _frame_processor(name, factory, vram_gb):
+    # Frame processors are loaded once per worker process and evicted like any other model
+    return registry.get_or_load(f"frame:{name}", factory, size=int(vram_gb * GB))
+
+
+def streaming_supported(ctx):
+    """True when Utils exposes frame-level processors for every enabled step"""
+    import Utils.main_utils as main_utils
+    needed = ["restore_bw_frame_processor"]
+    if ctx["face_restore_flag"]:
+        needed.append("upscale_faces_frame_processor")
+    missing = [name for name in needed if not hasattr(main_utils, name)]
+    if missing:
+        print(f"⚠️ Streaming mode unavailable, Utils.main_utils lacks {', '.join(missing)}; using staged tasks 1-3")
+    return not missing
+
+
+def restore_enhance_upscale(ctx):
+    import Utils.main_utils as main_utils
+    from frame_stream import stream_video, OnnxUpscaler
+    processors = [("restore", _frame_processor(
+        "restore", main_utils.restore_bw_frame_processor, STAGE_VRAM_GB["restore"]))]
+    settings = ["restore"]
+    last_output = "restored_video_path"
+    if ctx["face_restore_flag"]:
+        processors.append(("face_restore", _frame_processor(
+            "face_restore", main_utils.upscale_faces_frame_processor, STAGE_VRAM_GB["face_restore"])))
+        settings.append("face_restore")
+        last_output = "faces_upscaled_video_path"
+    if ctx["upscale_flag"]:
+        model = 'models/Real-ESRGAN-General-x4v3.onnx'
+        scale, clahe = int(ctx["upscale_value"]), ctx["clahe_flag"]
+        upscale = f"background_upscale_x{scale}{'_clahe' if clahe else ''}"
+        processors.append(("background_upscale", _frame_processor(
+            upscale, lambda: OnnxUpscaler(model, scale=scale, clahe=clahe), STAGE_VRAM_GB["background_upscale"])))
+        settings.append(upscale)
+        last_output = "background_upscaled_video_path"
+    # Named by every setting that shapes the frames and written into the job's own directory,
+    # so jobs on the same input with other settings never share the file
+    stem = os.path.splitext(os.path.basename(ctx["input_video_path"]))[0]
+    output_dir = os.environ.get("PIPELINE_JOB_DIR") or os.getcwd()
+    output_path = os.path.join(output_dir, f"{stem}_{'_'.join(settings)}_streamed.mp4")
+    stats = stream_video(ctx["input_video_path"], output_path, processors)
+    print(f"Streamed {' -> '.join(name for name, _ in processors)}: {stats}")
+    print(f"Streamed video available at: {output_path}")
+    outputs = dict.fromkeys(["restored_video_path", "faces_upscaled_video_path", "background_upscaled_video_path"])
+    outputs[last_output] = output_path
+    return outputs
 
 
 # ------------------------
-
 # Task 4: Scene Split
-
 # ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import run_scene_split_cached
-
-
-
-#input_path = faces_upscaled_video_path or restored_video_path or input_video_path
-
-input_path = background_upscaled_video_path or input_path
-
-scene_split_input_path = input_path
-
-scene_split_preview_video_path = run_scene_split_cached(input_path, input_video_path, scale = int(upscale_value))
-
-print("Scene split preview video available at:", scene_split_preview_video_path)
-
-
-
-
-
-
-
-############################################# prev
-
-# bw_path = Path(scene_split_preview_video_path)
-
-# renamed_dir = bw_path.parent.parent / f"{bw_path.stem.replace('_bw','')}_images_prev"
-
-# scene_refs_prev_name = f"{bw_path.stem.replace('_bw','')}_prevscene.mp4"
-
-# scene_split_prevscene_video_path = os.path.join(renamed_dir, scene_refs_prev_name)
-
-
-
-# print("Scene split PrevScene video available at:", scene_split_prevscene_video_path)
-
-
-
-from pathlib import Path
-
-import os
-
-
-
-bw_path = Path(scene_split_preview_video_path)
-
-
-
-# Replace "_images" with "_images_prev" in the parent folder name
-
-renamed_dir = bw_path.parent.with_name(bw_path.parent.name.replace("_images", "_images_prev"))
-
-
-
-# Remove ONLY the last "_bw" occurrence and append "_prevscene.mp4"
-
-if bw_path.stem.endswith("_bw"):
-
-    base_name = bw_path.stem[:-3]  # remove the last 3 characters "_bw"
-
-else:
-
-    base_name = bw_path.stem
-
-
-
-scene_refs_prev_name = f"{base_name}_prevscene.mp4"
-
-
-
-# Combine directory and filename
-
-scene_split_prevscene_video_path = os.path.join(renamed_dir, scene_refs_prev_name)
-
-
-
-print("Scene split PrevScene video available at:", scene_split_prevscene_video_path)
-
-
-
-
-
-
-
-
-
+def scene_split(ctx):
+    from Utils.main_utils import run_scene_split_cached
+    input_path = (ctx["background_upscaled_video_path"] or ctx["faces_upscaled_video_path"]
+                  or ctx["restored_video_path"] or ctx["input_video_path"])
+    scene_split_preview_video_path = run_scene_split_cached(
+        input_path, ctx["input_video_path"], scale=int(ctx["upscale_value"]))
+    print("Scene split preview video available at:", scene_split_preview_video_path)
+    return {
+        "scene_split_input_path": input_path,
+        "scene_split_preview_video_path": scene_split_preview_video_path,
+    }
+
+
+def prevscene_path(ctx):
+    bw_path = Path(ctx["scene_split_preview_video_path"])
+    # Replace "_images" with "_images_prev" in the parent folder name
+    renamed_dir = bw_path.parent.with_name(bw_path.parent.name.replace("_images", "_images_prev"))
+    # Remove ONLY the last "_bw" occurrence and append "_prevscene.mp4"
+    if bw_path.stem.endswith("_bw"):
+        base_name = bw_path.stem[:-3]
+    else:
+        base_name = bw_path.stem
+    scene_split_prevscene_video_path = os.path.join(renamed_dir, f"{base_name}_prevscene.mp4")
+    print("Scene split PrevScene video available at:", scene_split_prevscene_video_path)
+    return scene_split_prevscene_video_path
 
 
 # ------------------------
-
-# Task 5: Colorize Scenes Using Deoldify
-
+# Task 5: Colorize Scenes Using Flux (ComfyUI)
 # ------------------------
-
-# clear_gpu()
-
-# if not unet_flag:
-
-#     from Utils.main_utils import deoldify_cached
-
-#     #input_path = preview_video_path  or preview_upscaled_video
-
-#     input_path = preview_upscaled_video or preview_video_path 
-
-#     deoldify_video = deoldify_cached(input_path, input_video_path)
-
-#     print("deoldify colored video at:", deoldify_video)
-
+def _use_comfy_client():
+    # Pipelined websocket client when an API-format workflow is configured
+    return bool(os.environ.get("COMFYFLUX_WORKFLOW"))
+
+
+def _flux_concat_job(ctx):
+    from flux_colorize import FluxJob, output_path_for
+    input_path = ctx["scene_split_prevscene_video_path"]
+    return FluxJob(input_path, output_path_for(input_path, "_flux_concat.mp4"), ctx["flux_concat_prompt"],
+                   seed=ctx["flux_concat_seed"], steps=ctx["flux_concat_steps"], cfg=ctx["flux_cfg"],
+                   guidance=ctx["flux_concat_guidance"], images_per_row=ctx["flux_concat_images_per_row"],
+                   images_per_combined=ctx["flux_concat_images_per_combined"])
+
+
+def _flux_prev_job(ctx):
+    from flux_colorize import FluxJob, output_path_for
+    input_path = ctx["scene_split_prevscene_video_path"]
+    return FluxJob(input_path, output_path_for(input_path, "_flux_prev.mp4"), ctx["flux_prev_prompt"],
+                   seed=ctx["flux_prev_seed"], steps=ctx["flux_prev_steps"], cfg=ctx["flux_cfg"],
+                   guidance=ctx["flux_prev_guidance"])
+
+
+def flux(ctx):
+    # Both passes as one interleaved queue on a single ComfyUI instance
+    comfyui.ensure_running()
+    from flux_colorize import colorize_videos
+    flux_path, flux_prev_path = colorize_videos([_flux_concat_job(ctx), _flux_prev_job(ctx)],
+                                                base_url=comfyui.base_url)
+    print("flux colorized video available at:", flux_path)
+    print("flux colorized video available at:", flux_prev_path)
+    return {"flux_path": flux_path, "flux_prev_path": flux_prev_path}
+
+
+def flux_concat(ctx):
+    comfyui.ensure_running()
+    from Utils.main_utils import comfyflux_colorize_video_concat_scene_batch_cached
+    flux_path = comfyflux_colorize_video_concat_scene_batch_cached(
+        ctx["scene_split_prevscene_video_path"],
+        ctx["input_video_path"],
+        ctx["flux_concat_prompt"],
+        seed=ctx["flux_concat_seed"],
+        steps=ctx["flux_concat_steps"],
+        cfg=ctx["flux_cfg"],
+        flux_guidance=ctx["flux_concat_guidance"],
+        images_per_row=ctx["flux_concat_images_per_row"],
+        total_images_per_combined=ctx["flux_concat_images_per_combined"]
+    )
+    print("flux colorized video available at:", flux_path)
+    return flux_path
 
 
+def flux_prev(ctx):
+    comfyui.ensure_running()
+    from Utils.main_utils import comfyflux_colorize_video_cached
+    input_path = ctx["scene_split_prevscene_video_path"]
+    print("prev input path", input_path)
+    flux_prev_path = comfyflux_colorize_video_cached(
+        input_path, ctx["input_video_path"], prompt_text=ctx["flux_prev_prompt"], seed=ctx["flux_prev_seed"],
+        steps=ctx["flux_prev_steps"], cfg=ctx["flux_cfg"], flux_guidance=ctx["flux_prev_guidance"])
+    print("flux colorized video available at:", flux_prev_path)
+    return flux_prev_path
 
 
 # ------------------------
-
-# Task 5: Colorize Scenes Using Generator
-
+# Task 6: Scene-wise Colorization Merge
 # ------------------------
-
-clear_gpu()
-
-import subprocess
-
+def _deepex_path():
+    for path in ("/opt/deepex", "/workspace"):
+        if path not in sys.path:
+            sys.path.insert(0, path)
 
 
-input_path = scene_split_preview_video_path 
+def colorize_prev(ctx):
+    _deepex_path()
+    from Utils.main_utils import colorize_scenes_prev_cached
+    colorized_final_video_prev_path = colorize_scenes_prev_cached(
+        ctx["scene_split_prevscene_video_path"], ctx["scene_split_input_path"],
+        ctx["flux_prev_path"], ctx["input_video_path"])
+    print("Colorized prev final video at:", colorized_final_video_prev_path)
+    return colorized_final_video_prev_path
 
-# if unet_flag:   
 
-#     generator_weights = "models/best_weights_epoch_0004.weights.h5"
+def mask_merge(ctx):
+    # yolo mask replace
+    from Utils.main_utils import replace_masked_regions_between_videos
+    return replace_masked_regions_between_videos(
+        ctx["flux_path"], ctx["colorized_final_video_prev_path"], output_suffix="_maskedmerge.mp4")
 
-#     from Utils.main_utils import run_unet_colorization_cached_subprocess
 
-    
+def colorize(ctx):
+    _deepex_path()
+    from Utils.main_utils import colorize_scenes_cached
+    colorized_final_video_path = colorize_scenes_cached(
+        ctx["scene_split_preview_video_path"], ctx["scene_split_input_path"],
+        ctx["merged_flux_path"], ctx["input_video_path"])
+    print("Colorized final video at:", colorized_final_video_path)
+    return colorized_final_video_path
 
-#     unet_video_path = run_unet_colorization_cached_subprocess(
-
-#         input_bw_video=input_path,
-
-#         unet_weights=generator_weights,
-
-#         first_path=input_video_path
-
-#     )
-
-
-
-comfy_process = start_comfyui()
-
-wait_for_comfyui()
-
-clear_gpu()
-
-from Utils.main_utils import comfyflux_colorize_video_cached, comfyflux_colorize_video_concat_cached, comfyflux_colorize_video_concat_scene_batch_cached
-
-# import io
-
-# import contextlib
-
-input_path = scene_split_preview_video_path 
-
-#prompt_ = "restore and colorize this without change in content, no warm/cool tint in entire image, color background, natural skintones"
-
-prompt = "Restore and colorize. No warm/cool tint. Very Strictly Consistent color across dress or clothes per person. Natural skintones, color background."
-
-flux_guidance=2.5
-
-seed=2^24
-
-#prompt_1 = "Restore and colorize with vivid colors, skin tones should be Natural, realistic. No warm/cool tint"
-
-prompt_1 = "Restore and colorize this,  No warm/cool tint in entire image, color background, natural skintones"
-
-flux_guidance=2.5
-
-#flux_guidance=3.5
-
-#flux_guidance=5
-
-seed=469366467564800
-
-#flux_path = comfyflux_colorize_video_cached(input_path, input_video_path, prompt_text = prompt_1, seed=seed, steps=10, cfg=1.0, flux_guidance=flux_guidance)
-
-########concat_flux
-
-# flux_guidance=5
-
-# seed=2^24
-
-# prompt_1 = "restore and colorize this, natural (light) skintones only, medium blue dresses only, no warm/cool tint in entire image, color background"
-
-# flux_path  = comfyflux_colorize_video_concat_cached(
-
-#     input_path,
-
-#     input_video_path,
-
-#     prompt_1,
-
-#     seed=seed,
-
-#     steps=10,
-
-#     cfg=1.0,
-
-#     flux_guidance=flux_guidance,
-
-#     images_per_row=2,
-
-#     total_images_per_combined=6
-
-# )
-
-########concat_flux_scene_batch
-
-input_path = scene_split_prevscene_video_path
-
-prompt_1 = "restore and colorize this, no warm/cool tint in entire image, color background, natural skintones"
-
-prompt_1 = "restore and colorize this, no warm/cool tint in entire image, color background, natural and pale skintones"
-
-prompt_1 = "restore and colorize this, no warm/cool tint in entire image, color background, natural and pale skintones, ornaments on people with gold color"
-
-seed=2^24
-
-flux_guidance = 2.5
-
-flux_path  = comfyflux_colorize_video_concat_scene_batch_cached(
-
-    input_path,
-
-    input_video_path,
-
-    prompt_1,
-
-    seed=seed,
-
-    steps=20,
-
-    cfg=1.0,
-
-    flux_guidance=flux_guidance,
-
-    images_per_row=2,
-
-    total_images_per_combined=6
-
-)
-
-print("flux colorized video available at:", flux_path)
-
-annotated_path = None
-
-stop_comfyui(comfy_process)
-
-
-
-
-
-
-
-#######prev for background
-
-comfy_process = start_comfyui()
-
-wait_for_comfyui()
-
-clear_gpu()
-
-from Utils.main_utils import comfyflux_colorize_video_cached
-
-# import io
-
-# import contextlib
-
-input_path = scene_split_prevscene_video_path
-
-print("prev input path", scene_split_prevscene_video_path)
-
-#prompt_ = "restore and colorize this without change in content, no warm/cool tint in entire image, color background, natural skintones"
-
-prompt = "Restore and colorize. No warm/cool tint. Very Strictly Consistent color across dress or clothes per person. Natural skintones, color background."
-
-flux_guidance=2.5
-
-seed=2^24
-
-prompt_1 = "Restore and colorize with vivid colors, skin tones should be Natural, realistic. No warm/cool tint"
-
-prompt_1 = "Restore and colorize this,  No warm/cool tint in entire image, color background, natural skintones"
-
-# prompt_1 = "restore and colorize this, no warm/cool tint in entire image, color background, natural skintones, each person's dress differently (different color, natural, light, vivid)"
-
-
-
-
-
-flux_guidance=3.5
-
-flux_guidance=5
-
-seed=469366467564800
-
-seed=2^24
-
-flux_prev_path = comfyflux_colorize_video_cached(input_path, input_video_path, prompt_text = prompt_1, seed=seed, steps=20, cfg=1.0, flux_guidance=flux_guidance)
-
-print("flux colorized video available at:", flux_prev_path)
-
-stop_comfyui(comfy_process)
-
-
-
-#qwen
-
-
-
-prompt_1 = (
-
-    "restore and colorize with vivid colors, "
-
-    "skin tones should be natural, realistic, "
-
-    "and no warm or cool tint in the entire image"
-
-)
-
-
-
-
-
-############################################# prev
-
-clear_gpu()
-
-from Utils.main_utils import colorize_scenes_prev_cached
-
-import sys
-
-sys.path.insert(0, "/opt/deepex")
-
-import sys
-
-sys.path.insert(0, "/workspace")
-
-input_path =  flux_prev_path 
-
-colorized_final_video_prev_path =  colorize_scenes_prev_cached(scene_split_prevscene_video_path,  scene_split_input_path , input_path, input_video_path)
-
-print("Colorized prev final video at:", colorized_final_video_prev_path)
-
-org_flux_path = flux_path
-
-flux_path = colorized_final_video_prev_path
-
-
-
-
-
-#yolo mask replace
-
-from Utils.main_utils import replace_masked_regions_between_videos
-
-flux_path = replace_masked_regions_between_videos(org_flux_path, flux_path, output_suffix="_maskedmerge.mp4")
-
-############################################# 
-
-
-
-
-
-################
-
-
-
-
-
-
-
-
-
-# from Utils.yolo_sam_deoldify_4_masks import process_video_cached
-
-# input_path = flux_path 
-
-# annotated_path =None
-
-# # # Simple pipeline use (only main file returned)
-
-# # output_path = run_deoldify_yolo_cached("input_videos/flux_video.mp4")
-
-# # print("Main output:", output_path)
-
-
-
-# # If you also want the YOLO debug file
-
-# annotated_path =  process_video_cached(input_path)
-
-# print("Main output:", annotated_path)
-
-
-
-
-
-
-
-
-
-# from Utils.yolo_deoldify import run_deoldify_yolo_cached, run_deoldify_yolo
-
-# input_path = flux_path 
-
-# annotated_path =None
-
-# # # Simple pipeline use (only main file returned)
-
-# # output_path = run_deoldify_yolo_cached("input_videos/flix_video.mp4")
-
-# # print("Main output:", output_path)
-
-
-
-# # If you also want the YOLO debug file
-
-# annotated_path = run_deoldify_yolo_cached(input_path)
-
-# print("Main output:", annotated_path)
-
-# #print("YOLO debug:", yolo_debug)
-
-
-
-
-
-# clear_gpu()
-
-# input_path = unet_video_path
-
-# from Utils.main_utils import enhance_unet_cached
-
-# enhanced_unet_path = enhance_unet_cached(input_path, input_video_path)
-
-# print("Diffusion enhanced video available at:", enhanced_unet_path)
-
-
-
-# import subprocess
-
-# import os
-
-
-
-# env = os.environ.copy()
-
-# input_path = unet_video_path or scene_split_preview_video_path
-
-# env["CUSTOM_INPUT_PATH"] = input_path          # or .mp4
-
-
-
-# # Generate output path based on input
-
-# base_dir = os.path.dirname(input_path)
-
-# base_name = os.path.basename(input_path)
-
-# output_name = "output_ge5_500_1_" + base_name
-
-# output_path = os.path.join(base_dir, output_name)
-
-
-
-# env["CUSTOM_OUTPUT_PATH"] = output_path                    # folder to save final result
-
-# env["CUSTOM_PROMPT"] = "Colorize each person's dress differently (different color, natural, light, vivid), consistent per dress, natural skin tones, light vivid colors in background, no warm/cool tint"
-
-# #env["CUSTOM_PROMPT"] = "turn image into anime style"
-
-# env["CUSTOM_PROMPT"] = "restore and colorize this, no warm/cool tint in entire image, color background, natural skintones, each person's dress differently (different color, natural, light, vivid)"
-
-
-
-# # env["CUSTOM_PROMPT"]  = "restore and colorize this, no warm/cool tint in entire image, color background, natural skintones, each person's dress (different color per person,  consistently same color entire dress, natural, light, vivid)"
-
-
-
-# #env["CUSTOM_PROMPT"] = "colorize this with natural colors"
-
-# #subprocess.run(["python", "/opt/comfyui/workflow_api.py"], env=env)
-
-# unet_video_path = output_path
-
-# #"Colorize with cinematic tones, not warm or cool" 
 
+# ------------------------
+# Tasks 4-6 per scene shard
+# ------------------------
+SCENE_SHARD_PARAMS = ["upscale_value", "scene_workers", "scene_shard_min_seconds"]
+
+
+def scene_shards(ctx):
+    # Each shard runs scene split through colorize as its own video; the Utils
+    # helpers are keyed on their input path, so shards never share outputs
+    from scene_shards import run_sharded
+    source_path = (ctx["background_upscaled_video_path"] or ctx["faces_upscaled_video_path"]
+                   or ctx["restored_video_path"] or ctx["input_video_path"])
+    stem, _ = os.path.splitext(source_path)
+    output_path = f"{stem}_scenes_colorized.mp4"
+    # One GPU limit for all shards together, not one per shard graph
+    gpu = threading.BoundedSemaphore(DEFAULT_LIMITS[GPU])
+
+    def run_shard(shard_path, index):
+        shard_ctx = dict(ctx, input_video_path=shard_path, restored_video_path=None,
+                         faces_upscaled_video_path=None, background_upscaled_video_path=None)
+        StageGraph(scene_chain_stages(shard_ctx)).run(shard_ctx, before_stage=before_stage,
+                                                      after_stage=after_stage, cache=get_cache(),
+                                                      resource_locks={GPU: gpu})
+        return shard_ctx["colorized_final_video_path"]
+
+    plan = run_sharded(source_path, output_path, run_shard, workers=ctx["scene_workers"],
+                       min_seconds=ctx["scene_shard_min_seconds"])
+    print(f"Colorized final video at: {output_path} ({len(plan['shards'])} shards, {plan['frames']} frames)")
+    return output_path
 
 
+# ------------------------
+# Task 7: Postprocess Videos
+# ------------------------
+def postprocess(ctx):
+    from Utils.main_utils import postprocess_videos_cached
+    post_processed_video_path = postprocess_videos_cached(ctx["colorized_final_video_path"], ctx["input_video_path"],
+                                                          **ctx["postprocess_settings"])
+    print("postprocessed video at:", post_processed_video_path)
+    return post_processed_video_path
 
 
 # ------------------------
-
-# Task 6: Final Scene-wise Colorization Merge
-
-# ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import colorize_scenes_cached
-
-import sys
-
-sys.path.insert(0, "/opt/deepex")
-
-import sys
-
-sys.path.insert(0, "/workspace")
-
-input_path =  annotated_path or flux_path or unet_video_path
-
-colorized_final_video_path =  colorize_scenes_cached(scene_split_preview_video_path,  scene_split_input_path , input_path, input_video_path)
-
-print("Colorized final video at:", colorized_final_video_path)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-# ------------------------
-
-# Task 7: Postprocess Videos
-
-# ------------------------
-
-
-
-
-
-clear_gpu()
-
-from Utils.main_utils import postprocess_videos_cached
-
-input_path = colorized_final_video_path
-
-post_processed_video_path = postprocess_videos_cached(input_path, input_video_path)
-
-print("postprocessed video at:", post_processed_video_path)
-
-
-
-# ------------------------
-
 # Task 8: Remix
-
 # ------------------------
-
-clear_gpu()
-
-from Utils.main_utils import remix_audio_cached
-
-input_path = post_processed_video_path
-
-final_postprocessed_video_path = remix_audio_cached(input_path, input_video_path, "final_post_process")
-
-print("final postprocessed video at:", final_postprocessed_video_path)
-
-
-
-
-
-
-
-
-
-clear_gpu()
-
-
-
-input_path = colorized_final_video_path
-
-final_video_path = remix_audio_cached(input_path , input_video_path, "final_without_post_process")
-
-print("final video at:", final_video_path)
-
+def remix_postprocessed(ctx):
+    from Utils.main_utils import remix_audio_cached
+    final_postprocessed_video_path = remix_audio_cached(
+        ctx["post_processed_video_path"], ctx["input_video_path"], "final_post_process")
+    print("final postprocessed video at:", final_postprocessed_video_path)
+    return final_postprocessed_video_path
+
+
+def remix_final(ctx):
+    from Utils.main_utils import remix_audio_cached
+    final_video_path = remix_audio_cached(
+        ctx["colorized_final_video_path"], ctx["input_video_path"], "final_without_post_process")
+    print("final video at:", final_video_path)
+    return final_video_path
+
+
+FLUX_CONCAT_PARAMS = ["flux_concat_prompt", "flux_concat_seed", "flux_concat_steps", "flux_concat_guidance",
+                      "flux_concat_images_per_row", "flux_concat_images_per_combined", "flux_cfg"]
+FLUX_PREV_PARAMS = ["flux_prev_prompt", "flux_prev_seed", "flux_prev_steps", "flux_prev_guidance", "flux_cfg"]
+
+
+def scene_chain_stages(ctx):
+    """Scene split through colorize: the part of the graph that scene shards run per shard"""
+    first = ["input_video_path"]
+    if _use_comfy_client():
+        flux_stages = [
+            Stage("flux", flux, inputs=first + ["scene_split_prevscene_video_path"] + FLUX_CONCAT_PARAMS
+                  + [p for p in FLUX_PREV_PARAMS if p not in FLUX_CONCAT_PARAMS],
+                  outputs=["flux_path", "flux_prev_path"]),
+        ]
+        flux_after = []
+    else:
+        flux_stages = [
+            Stage("flux_concat", flux_concat,
+                  inputs=first + ["scene_split_prevscene_video_path"] + FLUX_CONCAT_PARAMS, outputs=["flux_path"]),
+            Stage("flux_prev", flux_prev,
+                  inputs=first + ["scene_split_prevscene_video_path"] + FLUX_PREV_PARAMS, outputs=["flux_prev_path"]),
+        ]
+        flux_after = ["flux_concat"]
+    return [
+        Stage("scene_split", scene_split, cacheable=False,
+              inputs=first + ["restored_video_path", "faces_upscaled_video_path",
+                              "background_upscaled_video_path", "upscale_value"],
+              outputs=["scene_split_input_path", "scene_split_preview_video_path"]),
+        Stage("prevscene_path", prevscene_path, resource=CPU, cacheable=False,
+              inputs=["scene_split_preview_video_path"], outputs=["scene_split_prevscene_video_path"]),
+    ] + flux_stages + [
+        Stage("colorize_prev", colorize_prev, after=flux_after,
+              inputs=first + ["scene_split_prevscene_video_path", "scene_split_input_path", "flux_prev_path"],
+              outputs=["colorized_final_video_prev_path"]),
+        Stage("mask_merge", mask_merge,
+              inputs=["flux_path", "colorized_final_video_prev_path"], outputs=["merged_flux_path"]),
+        Stage("colorize", colorize,
+              inputs=first + ["scene_split_preview_video_path", "scene_split_input_path", "merged_flux_path"],
+              outputs=["colorized_final_video_path"]),
+    ]
+
+
+def build_graph(ctx):
+    # Every key a stage function reads is declared as an input: the stage result
+    # cache keys on exactly these. scene_split also writes the *_images_prev
+    # sibling folder behind the graph's back, so it (and the path-only and
+    # side-effect stages) stays out of the cache.
+    first = ["input_video_path"]
+    if ctx.get("streaming_flag") and streaming_supported(ctx):
+        front = [
+            Stage("restore_enhance_upscale", restore_enhance_upscale,
+                  inputs=first + ["face_restore_flag", "upscale_flag", "clahe_flag", "upscale_value"],
+                  outputs=["restored_video_path", "faces_upscaled_video_path", "background_upscaled_video_path"]),
+        ]
+    else:
+        front = [
+            Stage("restore", restore,
+                  inputs=first, outputs=["restored_video_path"]),
+            Stage("face_restore", face_restore,
+                  inputs=first + ["restored_video_path"], outputs=["faces_upscaled_video_path"],
+                  flags=["face_restore_flag"]),
+            Stage("background_upscale", background_upscale,
+                  inputs=first + ["restored_video_path", "faces_upscaled_video_path", "clahe_flag", "upscale_value"],
+                  outputs=["background_upscaled_video_path"],
+                  flags=["upscale_flag"]),
+        ]
+    if ctx.get("scene_shard_flag"):
+        # Not cached and not a GPU slot itself: the stages inside every shard
+        # go through the stage cache and reserve GPU memory one by one
+        middle = [
+            Stage("scene_shards", scene_shards, resource=CPU, cacheable=False,
+                  inputs=first + ["restored_video_path", "faces_upscaled_video_path",
+                                  "background_upscaled_video_path"] + SCENE_SHARD_PARAMS + FLUX_CONCAT_PARAMS
+                  + [p for p in FLUX_PREV_PARAMS if p not in FLUX_CONCAT_PARAMS],
+                  outputs=["colorized_final_video_path"]),
+        ]
+    else:
+        middle = scene_chain_stages(ctx)
+    return StageGraph(front + middle + [
+        Stage("postprocess", postprocess, resource=CPU,
+              inputs=first + ["colorized_final_video_path"] + POSTPROCESS_PARAMS,
+              outputs=["post_processed_video_path"]),
+        Stage("remix_postprocessed", remix_postprocessed, resource=IO,
+              inputs=first + ["post_processed_video_path"], outputs=["final_postprocessed_video_path"]),
+        Stage("remix_final", remix_final, resource=IO,
+              inputs=first + ["colorized_final_video_path"], outputs=["final_video_path"]),
+    ])
+
+
+# Allocated GPU memory before each running stage, by (thread, stage): before_stage
+# and after_stage of one run happen on its graph thread, and shards reuse stage names
+_allocated_before = {}
+
+
+def _torch_cache_bytes():
+    return torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+
+
+def before_stage(stage):
+    # Make room only when this stage would not fit next to what is already resident
+    if stage.resource != GPU:
+        return
+    need_gb = STAGE_VRAM_GB.get(stage.name, 4)
+    keep = ()
+    if stage.name in FLUX_STAGES:
+        keep = ("comfyui",)
+        if "comfyui" in registry:
+            need_gb = max(0, need_gb - COMFYUI_RESIDENT_GB)
+    if torch.cuda.is_available():
+        registry.register("torch_cache", _torch_cache_bytes(), evict=torch.cuda.empty_cache)
+        _allocated_before[(threading.get_ident(), stage.name)] = torch.cuda.memory_allocated()
+    registry.reserve(int(need_gb * GB), keep=keep)
+
+
+def after_stage(stage, outputs):
+    if stage.resource != GPU:
+        return
+    if stage.name in FLUX_STAGES:
+        # ComfyUI keeps the flux weights loaded; unload them only if a later stage needs the room
+        registry.register("comfyui", int(COMFYUI_RESIDENT_GB * GB), evict=comfyui.release_vram)
+    elif torch.cuda.is_available():
+        # Whatever the stage left allocated (module-level model caches in Utils) stays warm until evicted
+        left = torch.cuda.memory_allocated() - _allocated_before.pop((threading.get_ident(), stage.name), 0)
+        if left > 0:
+            registry.register(f"stage:{stage.name}", left, evict=clear_gpu)
+
+
+# Reported with job_end so the server (and a coordinator) can find the results
+FINAL_OUTPUTS = ["colorized_final_video_path", "post_processed_video_path",
+                 "final_video_path", "final_postprocessed_video_path"]
+
+_cache = None
+
+
+def get_cache():
+    """Stage cache shared by every run in this process (None when STAGE_CACHE=0)"""
+    global _cache
+    if _cache is None and os.environ.get("STAGE_CACHE", "1") != "0":
+        _cache = StageCache()
+    return _cache
+
+
+def run_pipeline(config):
+    """
+    Run the whole pipeline for one input and return the final stage context.
+    config holds input_video_path, the unet/face_restore/upscale/clahe flags,
+    upscale_value, optional FLUX_SETTINGS overrides and postprocess_settings.
+    Safe to call repeatedly from one process: imports, the ComfyUI server and
+    the stage cache stay warm.
+
+    With manifest_path every completed stage is checkpointed there; resume=True
+    restarts from the first stage the manifest does not cover.
+    """
+    config = dict(config)
+    manifest_path = config.pop("manifest_path", None) or os.environ.get("PIPELINE_MANIFEST")
+    resume = _flag(config.pop("resume", False))
+    ctx = normalize_config(config)
+    if not _use_comfy_client() and comfyui.port != UTILS_COMFYUI_PORT:
+        # Fail now rather than after the restore stages: the flux stages would drive another slot's ComfyUI
+        raise RuntimeError(f"ComfyUI runs on port {comfyui.port}, but the Utils flux helpers only use "
+                           f"{UTILS_COMFYUI_PORT}; set COMFYFLUX_WORKFLOW to run this slot")
+    manifest = None
+    if manifest_path:
+        manifest = StageManifest(manifest_path)
+        manifest.set_config(ctx)
+        if resume:
+            print(f"⏩ Resuming from manifest {manifest_path}: {manifest.summary()}")
+    cache = get_cache()
+    started = time.time()
+    graph = build_graph(ctx)
+    telemetry.emit("job_start",
+                   input=telemetry.video_frames(ctx["input_video_path"]),
+                   stages=[name for name, stage in graph.stages.items() if stage.enabled(ctx)],
+                   flags={key: ctx[key] for key in ("unet_flag", "face_restore_flag", "upscale_flag",
+                                                    "clahe_flag", "streaming_flag", "scene_shard_flag")},
+                   upscale_value=ctx["upscale_value"],
+                   resume=resume)
+    observer = telemetry.StageTelemetry()
+    try:
+        graph.run(ctx, before_stage=before_stage, after_stage=after_stage, cache=cache,
+                  manifest=manifest, resume=resume, observer=observer)
+    except Exception as e:
+        telemetry.emit("job_end", status="failed", error=str(e), wall_seconds=round(time.time() - started, 3))
+        raise
+    finally:
+        observer.close()
+    telemetry.emit("job_end", status="completed", wall_seconds=round(time.time() - started, 3),
+                   outputs={key: ctx.get(key) for key in FINAL_OUTPUTS},
+                   cache=cache.stats() if cache is not None else None, models=registry.stats())
+    return ctx
+
+
+if __name__ == "__main__":
+    run_pipeline(parse_args(sys.argv[1:]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stand-in for pipeline_wrapper.py for testing servers and the coordinator on
+localhost without GPUs, models or Utils. Takes the same arguments, prints the
+same telemetry events, sleeps through a few fake stages and "produces" the
+final video by copying the input, so frame counts line up exactly.
+
+    python remote_api_server.py --port 5001 --execution subprocess \\
+        --pipeline-script /path/to/pipeline_stub.py
+
+Environment:
+    STUB_PIPELINE_SECONDS    total run time (default 3)
+    STUB_PIPELINE_FAIL_RATE  probability of exiting with an error (default 0)
+"""
+
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import telemetry
+
+STAGES = ["restore", "scene_split", "flux", "colorize", "remix_final"]
+
+
+def main():
+    argv = [a for a in sys.argv[1:] if a != "--resume"]
+    if "--manifest" in argv:
+        i = argv.index("--manifest")
+        del argv[i:i + 2]
+    if not argv:
+        print("Usage: pipeline_stub.py <manual_path> [flags...] [--manifest PATH] [--resume]")
+        sys.exit(1)
+    input_path = os.path.abspath(argv[0])
+    if not os.path.isfile(input_path):
+        print(f"Video path not found: {input_path}", file=sys.stderr)
+        sys.exit(1)
+
+    seconds = float(os.environ.get("STUB_PIPELINE_SECONDS", "3"))
+    fail_rate = float(os.environ.get("STUB_PIPELINE_FAIL_RATE", "0"))
+    started = time.time()
+    telemetry.emit("job_start", input=telemetry.video_frames(input_path), flags={}, stages=STAGES,
+                   resume=False)
+    fail_at = random.randrange(len(STAGES)) if random.random() < fail_rate else None
+    for index, name in enumerate(STAGES):
+        telemetry.emit("stage_start", stage=name, resource="gpu")
+        print(f"Task {index + 1}/{len(STAGES)}: {name}")
+        time.sleep(seconds / len(STAGES))
+        if index == fail_at:
+            telemetry.emit("stage_error", stage=name, error="stub failure")
+            telemetry.emit("job_end", status="failed", error="stub failure",
+                           wall_seconds=round(time.time() - started, 3))
+            print(f"Stub pipeline failed in {name}", file=sys.stderr)
+            sys.exit(1)
+        telemetry.emit("stage_end", stage=name, resource="gpu", source="computed",
+                       wall_seconds=round(seconds / len(STAGES), 3))
+
+    output_dir = os.path.join(os.getcwd(), "outputs")
+    os.makedirs(output_dir, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    final_path = os.path.join(output_dir, f"{stem}_final_without_post_process{ext}")
+    shutil.copyfile(input_path, final_path)
+    print("final video at:", final_path)
+    telemetry.emit("job_end", status="completed", wall_seconds=round(time.time() - started, 3),
+                   outputs={"colorized_final_video_path": final_path, "final_video_path": final_path})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Warm pipeline worker owned by remote_api_server.py.
+A long-lived child process imports pipeline.py once (torch, CUDA context,
+Utils, loaded models) and then takes jobs from a local queue, so a job no
+longer pays for interpreter start-up and cold imports. Everything the job
+writes to stdout/stderr, including output of ffmpeg and other subprocesses,
+is streamed back to the server line by line.
+"""
+
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from comfyui_supervisor import kill_process_group
+
+
+# Written to the output pipe around every job, so lines are tagged by their place in the stream
+JOB_MARKER = "\x1e@@pipeline-worker-job "
+
+
+def _forward_output(read_fd, events):
+    """
+    Worker side: turn raw fd 1/2 output into ('line', job_id, text) events.
+    The job a line belongs to follows from the start/end markers that come
+    through the same pipe; the end marker becomes the job's exit event, so
+    it never overtakes the job's last lines.
+    """
+    job_id = None
+    with os.fdopen(read_fd, "r", encoding="utf-8", errors="replace") as stream:
+        for line in stream:
+            index = line.find(JOB_MARKER)
+            if index < 0:
+                events.put(("line", job_id, line))
+                continue
+            if index > 0:
+                events.put(("line", job_id, line[:index] + "\n"))  # unterminated output before the marker
+            kind, marked_job, code = line[index + len(JOB_MARKER):].split()
+            if kind == "start":
+                job_id = marked_job
+            else:
+                events.put(("exit", marked_job, int(code)))
+                job_id = None
+
+
+def _worker_main(jobs, events, workspace, env):
+    # Own process group, so a cancelled job can be killed with everything it started
+    os.setsid()
+    os.environ.update(env)
+    os.chdir(workspace)
+    for path in (workspace, "/opt/deepex"):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    # Route fd 1/2 (print, tracebacks and child processes) through a pipe
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    sys.stdout = os.fdopen(1, "w", buffering=1, encoding="utf-8", closefd=False)
+    sys.stderr = os.fdopen(2, "w", buffering=1, encoding="utf-8", closefd=False)
+    threading.Thread(target=_forward_output, args=(read_fd, events), daemon=True).start()
+
+    started = time.time()
+    import pipeline
+    from pipeline_wrapper import resolve_input
+    events.put(("ready", None, time.time() - started))
+
+    while True:
+        item = jobs.get()
+        if item is None:
+            break
+        job_id, config = item
+        sys.stdout.write(f"{JOB_MARKER}start {job_id} 0\n")
+        code = 0
+        try:
+            config = dict(config)
+            # Each job writes relative paths into its own scratch directory
+            job_dir = config.pop("work_dir", workspace)
+            os.chdir(job_dir)
+            os.environ["PIPELINE_JOB_DIR"] = job_dir
+            config["input_video_path"] = resolve_input(config.pop("input"))
+            pipeline.run_pipeline(config)
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Error in pipeline worker: {e}")
+            code = 1
+        sys.stderr.flush()
+        # Queued behind everything the job wrote; the forwarder reports the exit when it gets here
+        sys.stdout.write(f"{JOB_MARKER}end {job_id} {code}\n")
+        sys.stdout.flush()
+
+
+class PipelineWorker:
+    """Parent-side handle on the warm worker process"""
+
+    def __init__(self, workspace, env=None):
+        self.workspace = workspace
+        self.env = dict(env or {})
+        self._mp = multiprocessing.get_context("spawn")
+        self.process = None
+        self.jobs = None
+        self.events = None
+        self.ready = threading.Event()
+        self.warmup_seconds = None
+        self._job_lock = threading.Lock()
+        self._listeners = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                return
+            self.ready.clear()
+            self.jobs = self._mp.Queue()
+            self.events = self._mp.Queue()
+            self.process = self._mp.Process(
+                target=_worker_main, args=(self.jobs, self.events, self.workspace, self.env), daemon=True)
+            self.process.start()
+            print(f"[Worker] Started warm pipeline worker (PID {self.process.pid})")
+            threading.Thread(target=self._dispatch, args=(self.process, self.events), daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                self.jobs.put(None)
+                self.process.join(timeout=10)
+                if self.process.is_alive():
+                    self.process.terminate()
+            self.process = None
+
+    def kill(self, grace=10):
+        """Kill the worker and its child processes (SIGTERM, then SIGKILL after grace); False if it was not running"""
+        with self._lock:
+            process = self.process
+        if process is None or not process.is_alive():
+            return False
+        print(f"[Worker] Killing pipeline worker (PID {process.pid})")
+        kill_process_group(process.pid, grace=grace)
+        process.join(timeout=5)
+        return True
+
+    def _dispatch(self, process, events):
+        while True:
+            try:
+                kind, job_id, payload = events.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+                continue
+            if kind == "ready":
+                self.warmup_seconds = payload
+                self.ready.set()
+                print(f"[Worker] Pipeline worker warm after {payload:.1f}s")
+                continue
+            # Output between jobs (job_id None) goes to the server log, never to a job
+            listener = self._listeners.get(job_id)
+            if listener is not None:
+                listener.put((kind, payload))
+            elif kind == "line":
+                print(f"[Worker] {payload.rstrip()}")
+        # Worker died: fail whatever it was running so the caller does not hang
+        if self._current is not None and self._current in self._listeners:
+            self._listeners[self._current].put(("exit", -1))
+        print(f"[Worker] Pipeline worker exited with code {process.exitcode}")
+
+    def run(self, job_id, config, on_line):
+        """Run one job on the worker, calling on_line(text) per output line; returns the exit code"""
+        with self._job_lock:
+            self.start()
+            deadline = time.time() + 600
+            while not self.ready.wait(timeout=1):
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Pipeline worker died during warm-up (exit code {self.process.exitcode})")
+                if time.time() > deadline:
+                    raise RuntimeError("Pipeline worker did not become ready")
+            events = queue.Queue()
+            self._listeners[job_id] = events
+            self._current = job_id
+            try:
+                self.jobs.put((job_id, config))
+                while True:
+                    kind, payload = events.get()
+                    if kind == "line":
+                        on_line(payload)
+                    elif kind == "exit":
+                        return payload
+            finally:
+                self._current = None
+                self._listeners.pop(job_id, None)
@@ -14,41 +14,239 @@ import subprocess
 import threading
 import json
 import time
+import gzip
+import base64
+import hashlib
+import importlib.util
+import shlex
+import uuid
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
+from urllib.parse import urlparse, parse_qs
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header, http_date
 import argparse
+import requests
+from pipeline_worker import PipelineWorker
+from coordinator import Coordinator
+from job_store import JobStore
+from job_logs import JobLogs
+from upload_sessions import UploadSessions, UploadError
+from job_scheduler import JobScheduler, DEFAULT_JOB_VRAM_GB
+from comfyui_supervisor import ComfyUISupervisor, kill_process_group, probe, COMFYUI_HOST, COMFYUI_PORT
+from node_metrics import Metrics, render, node_info, gpu_memory
+from stage_estimates import StageEstimator
+from telemetry import parse_event, apply_event, stage_summary
 
 app = Flask(__name__)
 CORS(app)
+# Behind nginx/lighttpd, let the proxy send files itself (zero-copy, with Range support)
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE', '0') == '1'
 
 # Configuration
-WORKSPACE_DIR = '/workspace'
+WORKSPACE_DIR = os.environ.get('PIPELINE_WORKSPACE', '/workspace')
 INPUT_VIDEOS_DIR = os.path.join(WORKSPACE_DIR, 'input_videos')
+UPLOADS_DIR = os.path.join(WORKSPACE_DIR, 'uploads')
+MANIFESTS_DIR = os.path.join(WORKSPACE_DIR, 'manifests')
+JOBS_DIR = os.path.join(WORKSPACE_DIR, 'jobs')
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+JOBS_PAGE_SIZE = 50
+JOBS_MAX_PAGE_SIZE = 500
+GZIP_MIN_BYTES = 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 * 1024  # default chunk of a download manifest
+OUTPUT_TAIL_BYTES = 64 * 1024  # log tail kept in the job's 'output' field
+LONG_POLL_MAX = 30  # longest ?wait= a request may be held for
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_TIMEOUT = 10
+SSE_KEEPALIVE = 15
+EXECUTOR_POLL = 1.0  # how often the executor picks up jobs queued or cancelled by API processes
+ESTIMATE_REFRESH = 10  # seconds between progress/ETA updates of a running stage
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+# Parameters that change a job's result; with the input content they make up its fingerprint
+FINGERPRINT_PARAMS = ('unet_flag', 'face_restore_flag', 'upscale_flag', 'upscale_value', 'clahe_flag')
+DEDUPE_STATUSES = ('queued', 'running', 'completed')
+CANCEL_GRACE = float(os.environ.get('CANCEL_GRACE_SECONDS', '10'))  # SIGTERM -> SIGKILL
+# Read-only workspace entries linked into every job's working directory
+SHARED_ASSETS = [name.strip() for name in
+                 os.environ.get('JOB_SHARED_ASSETS', 'models,Utils,weights,checkpoints,input_videos').split(',')
+                 if name.strip()]
 
-# Job status storage (in-memory, can be replaced with database)
-jobs = {}
-job_lock = threading.Lock()
+# Job status storage (SQLite in WAL mode, survives restarts)
+JOB_DB_PATH = os.environ.get('JOB_DB', os.path.join(WORKSPACE_DIR, 'jobs.db'))
+job_store = JobStore(JOB_DB_PATH)
+
+# Queue snapshot the executor process writes for API processes
+EXECUTOR_STATUS_PATH = os.path.join(WORKSPACE_DIR, 'executor.json')
+
+# Counters and histograms for /metrics, shared by every process of the node
+metrics = Metrics(os.environ.get('METRICS_DB', os.path.join(WORKSPACE_DIR, 'metrics.db')))
+
+# Stage durations of past jobs, for stage-weighted progress and ETAs
+stage_estimator = StageEstimator(job_store)
+
+# Warm pipeline workers, one per scheduler slot (empty = run every job as a pipeline_wrapper.py subprocess)
+pipeline_workers = []
+
+# Job queue: admits queued jobs onto slots within the node's VRAM budget.
+# None in an API-only process (gunicorn workers): jobs are left queued in the
+# job store for the executor process to pick up.
+scheduler = None
+
+# Process (pid or warm worker) of every running job, for cancellation
+running_jobs = {}
+running_jobs_lock = threading.Lock()
+
+# Estimated seconds of work left on the node as of the last executor sync (/health, /metrics)
+executor_backlog = None
+
+# Script run per job in subprocess mode (pipeline_stub.py for local testing)
+PIPELINE_SCRIPT = 'pipeline_wrapper.py'
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Coordinator mode: jobs are split into scene segments and run on these nodes
+coordinator = None
+
+# GPU of every slot, handed out in turn (empty: slot processes see every GPU)
+SLOT_GPUS = []
 
 # Ensure directories exist
 os.makedirs(INPUT_VIDEOS_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+os.makedirs(MANIFESTS_DIR, exist_ok=True)
+
+# Python version, GPUs, pipeline files: looked up once, not on every /status
+NODE_INFO = node_info(WORKSPACE_DIR)
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def manifest_path(job_id):
+    return os.path.join(job_dir(job_id), 'manifest.json')
+
+
+def log_path(job_id):
+    return os.path.join(job_dir(job_id), 'output.log')
+
+
+def work_dir(job_id):
+    return os.path.join(job_dir(job_id), 'work')
+
+
+def prepare_work_dir(job_id):
+    """
+    Create the job's scratch directory (its working directory while it runs)
+    with the shared assets of the workspace symlinked in, not copied.
+    """
+    path = work_dir(job_id)
+    os.makedirs(path, exist_ok=True)
+    for name in SHARED_ASSETS:
+        source = os.path.join(WORKSPACE_DIR, name)
+        link = os.path.join(path, name)
+        if os.path.exists(source) and not os.path.lexists(link):
+            os.symlink(source, link)
+    return path
+
+
+def resolve_pipeline_script(script):
+    """
+    Absolute path of the subprocess-mode script: jobs run inside their own
+    work directory, so a relative name is looked up in the workspace, then
+    next to this server.
+    """
+    if os.path.isabs(script):
+        return script
+    for base in (WORKSPACE_DIR, SERVER_DIR):
+        candidate = os.path.join(base, script)
+        if os.path.isfile(candidate):
+            return candidate
+    return os.path.abspath(script)
+
+
+def comfyui_port(slot):
+    """Every scheduler slot runs its own ComfyUI server"""
+    return COMFYUI_PORT + slot
+
+
+def slot_env(slot):
+    """Environment of the pipeline processes running on a slot (and of the ComfyUI server they start)"""
+    port = comfyui_port(slot)
+    env = {
+        'COMFYUI_PORT': str(port),
+        'COMFYUI_LOG': os.path.join(WORKSPACE_DIR, 'logs', f'comfyui_{port}.log'),
+    }
+    if SLOT_GPUS:
+        env['CUDA_VISIBLE_DEVICES'] = SLOT_GPUS[slot % len(SLOT_GPUS)]
+    return env
+
+
+# Pipeline output of every job, streamed to jobs/<id>/output.log
+job_logs = JobLogs(log_path)
+
+# Resumable chunked uploads into input_videos/
+upload_sessions = UploadSessions(UPLOADS_DIR, INPUT_VIDEOS_DIR)
+
+
+def json_response(payload, etag=None):
+    """JSON response, gzipped when the client accepts it, with a weak ETag honouring If-None-Match"""
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    body = json.dumps(payload, default=str).encode('utf-8')
+    response = app.response_class(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    created_at, job_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return float(created_at), str(job_id)
+
+
+def scheduler_snapshot():
+    """Queue of this node, read from the executor process when jobs do not run here"""
+    if scheduler is None:
+        return read_executor_status()
+    return dict(scheduler.snapshot(), backlog_seconds=executor_backlog)
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Health check endpoint, with the node's current load"""
+    snapshot = scheduler_snapshot()
     return jsonify({
         'status': 'ok',
         'workspace': WORKSPACE_DIR,
         'input_videos': INPUT_VIDEOS_DIR,
         'python_version': sys.version,
+        'load': {
+            'queued': len(snapshot['queued']),
+            'running': len(snapshot['running']),
+            'slots': snapshot['slots'],
+            'free_slots': snapshot['free_slots'],
+            'vram_reserved_gb': snapshot['vram_reserved_gb'],
+            'vram_budget_gb': snapshot['vram_budget_gb'],
+            'backlog_seconds': snapshot.get('backlog_seconds')
+        } if snapshot else None,
         'timestamp': time.time()
     })
 
@@ -58,17 +256,11 @@ def status():
     """Get server status and workspace info"""
     workspace_exists = os.path.exists(WORKSPACE_DIR)
     input_videos_exists = os.path.exists(INPUT_VIDEOS_DIR)
-    pipeline_exists = os.path.exists(os.path.join(WORKSPACE_DIR, 'pipeline.py'))
-    wrapper_exists = os.path.exists(os.path.join(WORKSPACE_DIR, 'pipeline_wrapper.py'))
-    
-    # Check Python
-    try:
-        python_version = subprocess.check_output(['python', '--version'], stderr=subprocess.STDOUT).decode().strip()
-    except:
-        python_version = 'Unknown'
     
     return jsonify({
         'status': 'online',
+        'scheduler': scheduler_snapshot(),
+        'node': NODE_INFO,
         'workspace': {
             'path': WORKSPACE_DIR,
             'exists': workspace_exists
@@ -78,14 +270,52 @@ def status():
             'exists': input_videos_exists
         },
         'files': {
-            'pipeline_py': pipeline_exists,
-            'pipeline_wrapper_py': wrapper_exists
+            'pipeline_py': NODE_INFO['pipeline_py'],
+            'pipeline_wrapper_py': NODE_INFO['pipeline_wrapper_py']
         },
-        'python': python_version,
+        'python': NODE_INFO['python'],
         'timestamp': time.time()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format: load, stage timings, transfer bytes, GPU memory, ComfyUI up"""
+    samples = [('pipeline_node_info', {
+        'hostname': NODE_INFO['hostname'],
+        'python': NODE_INFO['python'],
+        'gpus': ','.join(gpu['name'] for gpu in NODE_INFO['gpus'])
+    }, 1)]
+    for job_status, count in sorted(job_store.count_by_status().items()):
+        samples.append(('pipeline_jobs', {'status': job_status}, count))
+    
+    snapshot = scheduler_snapshot()
+    if snapshot:
+        samples += [
+            ('pipeline_queue_depth', {}, len(snapshot['queued'])),
+            ('pipeline_jobs_running', {}, len(snapshot['running'])),
+            ('pipeline_scheduler_slots', {}, snapshot['slots']),
+            ('pipeline_scheduler_free_slots', {}, snapshot['free_slots']),
+            ('pipeline_scheduler_vram_reserved_gb', {}, snapshot['vram_reserved_gb'])
+        ]
+        if snapshot['vram_budget_gb'] is not None:
+            samples.append(('pipeline_scheduler_vram_budget_gb', {}, snapshot['vram_budget_gb']))
+        backlog = snapshot.get('backlog_seconds')
+        if backlog is not None:
+            samples.append(('pipeline_backlog_seconds', {}, backlog))
+    
+    for index, used, total in gpu_memory():
+        samples.append(('pipeline_gpu_memory_used_bytes', {'gpu': index}, used))
+        samples.append(('pipeline_gpu_memory_total_bytes', {'gpu': index}, total))
+    
+    for slot in range(snapshot['slots'] if snapshot else 1):
+        port = comfyui_port(slot)
+        samples.append(('pipeline_comfyui_up', {'port': port}, int(probe(COMFYUI_HOST, port, timeout=1.0))))
+    
+    samples += metrics.samples()
+    return Response(render(samples), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Upload video file"""
@@ -100,12 +330,25 @@ def upload_file():
         return jsonify({'error': 'Invalid file type. Allowed: ' + ', '.join(ALLOWED_EXTENSIONS)}), 400
     
     try:
-        filename = secure_filename(file.filename)
+        # Hash while saving, so a job on this file never has to read it again for its fingerprint
+        hasher = hashlib.sha256()
+        part_path = os.path.join(INPUT_VIDEOS_DIR, f'.upload-{os.getpid()}-{threading.get_ident()}.part')
+        try:
+            with open(part_path, 'wb') as out:
+                for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+                    out.write(block)
+                    hasher.update(block)
+            # Never replaces a file with the same name, a queued or running job may be reading it
+            filename = upload_sessions.place(part_path, secure_filename(file.filename), hasher.hexdigest())
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
         filepath = os.path.join(INPUT_VIDEOS_DIR, filename)
-        file.save(filepath)
+        upload_sessions.remember_digest(filepath, hasher.hexdigest())
         
         # Get file size
         file_size = os.path.getsize(filepath)
+        metrics.inc('pipeline_upload_bytes_total', file_size)
         
         return jsonify({
             'success': True,
@@ -113,29 +356,272 @@ def upload_file():
             'path': f'input_videos/{filename}',
             'full_path': filepath,
             'size': file_size,
+            'sha256': hasher.hexdigest(),
             'message': 'File uploaded successfully'
         })
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
 
+def uploaded_file_response(filename, **extra):
+    """Same shape as the /upload response"""
+    filepath = os.path.join(INPUT_VIDEOS_DIR, filename)
+    return dict({
+        'success': True,
+        'filename': filename,
+        'path': f'input_videos/{filename}',
+        'full_path': filepath,
+        'size': os.path.getsize(filepath),
+        'message': 'File uploaded successfully'
+    }, **extra)
+
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload: {"filename", "size", "sha256" (optional, checked at finalize)}.
+    Content the node already has is recognised at finalize, once its hash was computed here.
+    """
+    data = request.json or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type. Allowed: ' + ', '.join(ALLOWED_EXTENSIONS)}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size is required'}), 400
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        return jsonify({'error': f'size must be between 1 and {MAX_UPLOAD_SIZE} bytes'}), 400
+    
+    digest = (data.get('sha256') or '').lower() or None
+    session = upload_sessions.create(filename, size, digest)
+    print(f"[API] Upload session {session.id} for {filename} ({size} bytes)")
+    return jsonify(session.summary()), 201
+
+
+@app.route('/uploads/<session_id>', methods=['GET'])
+def get_upload(session_id):
+    """Committed offset of an upload (resume from here)"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    response = jsonify(session.summary())
+    response.headers['Upload-Offset'] = str(session.offset)
+    return response
+
+
+@app.route('/uploads/<session_id>', methods=['PUT'])
+def put_upload_chunk(session_id):
+    """Write the request body at the range given by Content-Range: bytes <start>-<end>/<size>"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes' or content_range.start is None:
+        return jsonify({'error': 'Content-Range: bytes <start>-<end>/<size> is required'}), 400
+    if content_range.length not in (None, session.state['size']):
+        return jsonify({'error': 'Content-Range size does not match the upload'}), 400
+    length = content_range.stop - content_range.start
+    if request.content_length is not None and request.content_length != length:
+        return jsonify({'error': 'Content-Length does not match Content-Range'}), 400
+    
+    if not session.lock.acquire(blocking=False):
+        return jsonify({'error': 'Another chunk of this upload is being written'}), 409
+    committed = session.offset
+    try:
+        session.write(content_range.start, request.stream, length)
+    except UploadError as e:
+        response = jsonify({'error': str(e), 'offset': session.offset})
+        response.headers['Upload-Offset'] = str(session.offset)
+        return response, e.status
+    finally:
+        session.lock.release()
+        metrics.inc('pipeline_upload_bytes_total', max(session.offset - committed, 0))
+    response = jsonify(session.summary())
+    response.headers['Upload-Offset'] = str(session.offset)
+    return response
+
+
+@app.route('/uploads/<session_id>/finalize', methods=['POST'])
+def finalize_upload(session_id):
+    """Verify a complete upload and move it into input_videos/"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    with session.lock:
+        try:
+            filename, digest, deduplicated = upload_sessions.finalize(session)
+        except UploadError as e:
+            return jsonify({'error': str(e), 'offset': session.offset}), e.status
+    print(f"[API] Upload {session_id} finalized as {filename}{' (deduplicated)' if deduplicated else ''}")
+    return jsonify(uploaded_file_response(filename, sha256=digest, deduplicated=deduplicated))
+
+
+@app.route('/uploads/<session_id>', methods=['DELETE'])
+def abort_upload(session_id):
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    upload_sessions.discard(session)
+    return jsonify({'success': True})
+
+
 @app.route('/jobs', methods=['GET'])
 def list_jobs():
-    """List all jobs"""
-    with job_lock:
-        return jsonify({
-            'jobs': list(jobs.values()),
-            'count': len(jobs)
-        })
+    """
+    List jobs newest first. Without ?limit or ?cursor every job is returned, as before
+    pagination; with them one page: ?limit=N (default 50), ?cursor=<next_cursor of the
+    previous page>. ?status=running, ?fields=id,status,progress (default: everything but
+    output; fields=all includes output), ?total=1 counts all matching jobs.
+    """
+    paged = 'limit' in request.args or 'cursor' in request.args
+    try:
+        limit = min(max(int(request.args.get('limit', JOBS_PAGE_SIZE)), 1), JOBS_MAX_PAGE_SIZE) if paged else None
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    status_filter = request.args.get('status') or None
+    fields_arg = request.args.get('fields', '')
+    fields = None
+    if fields_arg and fields_arg != 'all':
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+    include_output = fields_arg == 'all' or (fields is not None and 'output' in fields)
+    
+    page, cursor = job_store.page(status=status_filter, limit=limit, after=after, include_output=include_output)
+    # COUNT(*) grows with the history, so a page poll only pays for it when asked
+    if not paged:
+        total = len(page)
+    elif request.args.get('total') in ('1', 'true'):
+        total = job_store.count(status_filter)
+    else:
+        total = None
+    next_cursor = encode_cursor(cursor) if cursor else None
+    
+    # Versions change on every job update, so this only matches an unchanged page
+    tag_source = json.dumps([[job['id'], job['version']] for job in page] + [total, next_cursor, fields_arg, status_filter])
+    etag = hashlib.sha1(tag_source.encode()).hexdigest()
+    
+    if fields is not None:
+        page = [{key: job.get(key) for key in ['id'] + fields} for job in page]
+    return json_response({
+        'jobs': page,
+        'count': len(page),
+        'total': total,
+        'next_cursor': next_cursor
+    }, etag=etag)
 
 
 @app.route('/jobs/<job_id>', methods=['GET'])
 def get_job(job_id):
-    """Get job status"""
-    with job_lock:
-        if job_id not in jobs:
-            return jsonify({'error': 'Job not found'}), 404
-        return jsonify(jobs[job_id])
+    """
+    Get job status. With ?wait=S&since_version=N the request is held (up to
+    30s) until the job's version passes N, so clients can long-poll.
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX)
+        since_version = int(request.args.get('since_version', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid wait or since_version'}), 400
+    if wait > 0 and job_store.wait(job_id, since_version, wait) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/stages', methods=['GET'])
+def get_job_stages(job_id):
+    """Per-stage timeline of a job built from pipeline telemetry events"""
+    job = job_store.get(job_id, include_output=False)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'id': job_id,
+        'status': job['status'],
+        'current_stage': job.get('current_stage'),
+        'input_info': job.get('input_info'),
+        'stages': job.get('stages', []),
+        'summary': stage_summary(job),
+        'estimate': stage_estimator.estimate(job, wait=False) if job['status'] == 'running' else None
+    })
+
+
+def open_job_log(job):
+    # Pending and running jobs share the live log so readers are woken by new lines;
+    # without a local executor the log is written by another process and read from its file
+    if job['status'] in FINISHED_STATUSES or scheduler is None:
+        return job_logs.reader(job['id'])
+    return job_logs.get(job['id'])
+
+
+@app.route('/jobs/<job_id>/logs', methods=['GET'])
+def get_job_logs(job_id):
+    """
+    Log bytes after ?offset=N (or the last ?tail=N bytes), at most ?limit=N bytes.
+    With ?wait=S (max 30) an up-to-date reader is held until new output arrives.
+    """
+    job = job_store.get(job_id, include_output=False)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    log = open_job_log(job)
+    try:
+        limit = max(int(request.args.get('limit', 1024 * 1024)), 1)
+        offset = log.tail(int(request.args['tail'])) if 'tail' in request.args else int(request.args.get('offset', 0))
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX)
+    except ValueError:
+        return jsonify({'error': 'Invalid offset, tail, limit or wait'}), 400
+    if wait > 0 and offset >= log.size and job['status'] not in FINISHED_STATUSES:
+        log.wait(offset, wait)
+        job = job_store.get(job_id, include_output=False)
+    data, next_offset = log.read(offset, limit)
+    return json_response({
+        'id': job_id,
+        'status': job['status'],
+        'offset': offset,
+        'next_offset': next_offset,
+        'size': log.size,
+        'data': data.decode('utf-8', errors='replace'),
+        'complete': job['status'] in FINISHED_STATUSES and next_offset >= log.size
+    })
+
+
+@app.route('/jobs/<job_id>/logs/stream', methods=['GET'])
+def stream_job_logs(job_id):
+    """Server-Sent Events: one 'data' event per log line (id = byte offset after it), then 'end'"""
+    job = job_store.get(job_id, include_output=False)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    log = open_job_log(job)
+    try:
+        if request.headers.get('Last-Event-ID'):
+            offset = int(request.headers['Last-Event-ID'])
+        elif 'tail' in request.args:
+            offset = log.tail(int(request.args['tail']))
+        else:
+            offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset'}), 400
+    
+    def events():
+        position = offset
+        while True:
+            data, next_offset = log.read(position)
+            if data:
+                for line in data.splitlines(keepends=True):
+                    position += len(line)
+                    text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+                    yield f"id: {position}\ndata: {text}\n\n"
+                continue
+            status = job_store.get(job_id, include_output=False)['status']
+            if status in FINISHED_STATUSES and position >= log.size:
+                yield f"event: end\ndata: {status}\n\n"
+                return
+            if not log.wait(position, SSE_KEEPALIVE) and not log.closed:
+                yield ": keepalive\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/jobs', methods=['POST'])
@@ -146,12 +632,26 @@ def create_job():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        job_id = f"job_{int(time.time() * 1000)}"
+        webhook_url = data.get('webhookUrl') or data.get('webhook_url')
+        if webhook_url and not webhook_url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'webhookUrl must be an http(s) URL'}), 400
+        # "dedupe": false runs the pipeline again even if an identical job exists
+        dedupe = str(data.get('dedupe', True)).lower() not in ('false', '0', 'no')
+        try:
+            priority = int(data.get('priority', 0))
+            vram_gb = float(data.get('vramGb') or data.get('vram_gb') or default_vram_gb())
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority and vramGb must be numbers'}), 400
+        
+        # Several gunicorn workers can create jobs in the same millisecond
+        job_id = f"job_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
         
         job = {
             'id': job_id,
-            'status': 'pending',
+            'status': 'queued',
             'progress': 0,
+            'priority': priority,
+            'vram_gb': vram_gb,
             'input_method': data.get('inputMethod') or data.get('input_method'),
             'youtube_url': data.get('youtubeUrl') or data.get('youtube_url'),
             'manual_path': data.get('manualPath') or data.get('manual_path'),
@@ -160,21 +660,36 @@ def create_job():
             'upscale_flag': data.get('upscaleFlag') if 'upscaleFlag' in data else data.get('upscale_flag', False),
             'upscale_value': float(data.get('upscaleValue') if 'upscaleValue' in data else data.get('upscale_value', 2.0)),
             'clahe_flag': data.get('claheFlag') if 'claheFlag' in data else data.get('clahe_flag', False),
+            'webhook_url': webhook_url,
+            'eta_seconds': None,
+            'eta_at': None,
             'created_at': time.time(),
             'updated_at': time.time(),
             'output': '',
             'error': None
         }
         
+        # Typical run time of jobs with the same flags, until the pipeline reports its stages
+        job['estimated_total_seconds'] = stage_estimator.estimate_queued(job)
+        
+        # Same input content and parameters as a finished or unfinished job: hand that one out
+        job['fingerprint'] = job_fingerprint(job) if dedupe else None
+        
         print(f"[API] Creating job {job_id} with data: {job}")
         
-        with job_lock:
-            jobs[job_id] = job
+        if job['fingerprint']:
+            job, created = job_store.create_or_find(job, DEDUPE_STATUSES, accept=reusable_job)
+            if not created:
+                return jsonify(join_job(job, webhook_url))
+        else:
+            job = job_store.create(job)
+            if dedupe and job.get('input_method') != 'youtube':
+                # Input not hashed yet: hash it off the request, so later duplicates of this job are found
+                threading.Thread(target=fingerprint_later, args=(job_id,), daemon=True).start()
         
-        # Execute job in background
-        thread = threading.Thread(target=execute_job, args=(job_id, job))
-        thread.daemon = True
-        thread.start()
+        # Wait for a slot and enough VRAM (the executor process picks it up when not running here)
+        if scheduler is not None:
+            job['queue_position'] = scheduler.submit(job_id, priority, vram_gb)
         
         return jsonify(job), 201
     except Exception as e:
@@ -184,106 +699,422 @@ def create_job():
         return jsonify({'error': str(e)}), 500
 
 
-def execute_job(job_id, job):
+def youtube_video_id(url):
+    """Video id of a YouTube URL, so every URL form of one video matches; else the URL itself"""
+    url = url.strip()
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().split(':')[0]
+    parts = [part for part in parsed.path.split('/') if part]
+    if host.endswith('youtu.be') and parts:
+        return parts[0]
+    if host.endswith('youtube.com'):
+        video_id = parse_qs(parsed.query).get('v')
+        if video_id:
+            return video_id[0]
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return parts[1]
+    return url
+
+
+def job_fingerprint(job, hash_input=False):
+    """
+    sha256 of a job's input and result-changing parameters: the content hash
+    of a manual input file (remembered per file until it changes), or the
+    video id of a YouTube input (not downloaded yet, and immutable).
+    A manual input is only hashed with hash_input; otherwise its hash must
+    already be known (uploads hash while receiving). None if the input cannot
+    be resolved or is not hashed yet, so the job just runs.
+    """
+    try:
+        source = resolve_job_input(job)
+        if job.get('input_method') == 'youtube':
+            source = f"youtube:{youtube_video_id(source)}"
+        elif os.path.isfile(source):
+            digest = upload_sessions.file_digest(source) if hash_input else upload_sessions.cached_digest(source)
+            if digest is None:
+                return None
+            source = f"sha256:{digest}"
+        else:
+            return None
+        params = {key: str(job.get(key)).lower() in ('1', 'true', 'yes', 'on')
+                  for key in FINGERPRINT_PARAMS if key != 'upscale_value'}
+        params['upscale_value'] = float(job.get('upscale_value') or 2.0)
+    except (OSError, ValueError) as e:
+        print(f"[API] Cannot fingerprint job {job['id']}: {e}")
+        return None
+    return hashlib.sha256(json.dumps({'input': source, 'params': params}, sort_keys=True).encode()).hexdigest()
+
+
+def fingerprint_later(job_id):
+    """Hash a new job's input in the background and record its fingerprint for later duplicates"""
+    job = job_store.get(job_id, include_output=False)
+    fingerprint = job_fingerprint(job, hash_input=True) if job is not None else None
+    if fingerprint is None:
+        return
+    
+    def set_fingerprint(stored):
+        if stored.get('fingerprint'):
+            return False
+        stored['fingerprint'] = fingerprint
+    job_store.mutate(job_id, set_fingerprint)
+
+
+def reusable_job(job):
+    """An unfinished duplicate is always joined; a completed one only while its output is on disk"""
+    if job['status'] != 'completed':
+        return True
+    for path in (job.get('outputs') or {}).values():
+        if isinstance(path, str) and path:
+            if not os.path.isabs(path):
+                path = os.path.join(job.get('work_dir') or WORKSPACE_DIR, path)
+            if os.path.isfile(path):
+                return True
+    return False
+
+
+def join_job(job, webhook_url=None):
+    """Answer a duplicate POST /jobs with the matching job, and notify its webhook too"""
+    def join(stored):
+        stored['duplicate_requests'] = stored.get('duplicate_requests', 0) + 1
+        if webhook_url and stored['status'] not in FINISHED_STATUSES:
+            stored['extra_webhook_urls'] = stored.get('extra_webhook_urls', []) + [webhook_url]
+    job = job_store.mutate(job['id'], join)
+    if webhook_url and job['status'] in FINISHED_STATUSES:
+        send_webhook(job['id'], urls=[webhook_url])
+    metrics.inc('pipeline_jobs_deduplicated_total', status=job['status'])
+    print(f"[API] Duplicate job request answered with {job['status']} job {job['id']}")
+    job.pop('output', None)
+    return dict(job, deduplicated=True)
+
+
+def default_vram_gb():
+    """VRAM estimate for jobs that bring none (distributed jobs hold none locally)"""
+    return 0.0 if coordinator is not None else DEFAULT_JOB_VRAM_GB
+
+
+def run_scheduled_job(job_id, slot):
+    """Scheduler callback: run a job admitted onto a slot"""
+    job = job_store.get(job_id, include_output=False)
+    if job is None or job['status'] != 'queued':
+        return  # cancelled while queued
+    execute_job(job_id, job, resume=bool(job.get('resume_requested')), slot=slot)
+
+
+def update_queue_positions(positions):
+    for job_id, position in positions.items():
+        def set_position(job):
+            if job['status'] != 'queued':
+                return False
+            job['queue_position'] = position
+        job_store.mutate(job_id, set_position)
+
+
+def execute_job(job_id, job, resume=False, slot=0):
     """Execute pipeline job"""
+    if coordinator is not None:
+        return execute_distributed_job(job_id, job)
+    
+    def start(stored):
+        if stored['status'] == 'cancelled':
+            return False
+        stored.update(status='running', progress=5, log_path=log_path(job_id), work_dir=work_dir(job_id),
+                      slot=slot, comfyui_port=comfyui_port(slot), queue_position=None,
+                      resume_requested=False, started_at=time.time())
+    
+    if job_store.mutate(job_id, start)['status'] != 'running':
+        return
+    running = {'started': time.time(), 'slot': slot, 'pid': None, 'worker': None}
+    with running_jobs_lock:
+        running_jobs[job_id] = running
     try:
-        print(f"[API] Starting job execution: {job_id}")
-        with job_lock:
-            jobs[job_id]['status'] = 'running'
-            jobs[job_id]['progress'] = 5
-            jobs[job_id]['updated_at'] = time.time()
-        
-        # Build command
-        command = build_pipeline_command(job)
-        
-        # Change to workspace directory
-        original_cwd = os.getcwd()
-        os.chdir(WORKSPACE_DIR)
-        print(f"[API] Changed to workspace: {WORKSPACE_DIR}")
-        
-        # Execute pipeline
-        print(f"[API] Executing command: {command}")
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1,
-            cwd=WORKSPACE_DIR
-        )
+        print(f"[API] Starting job execution: {job_id} on slot {slot}{' (resume)' if resume else ''}")
+        cwd = prepare_work_dir(job_id)
         
-        output_lines = []
+        log = job_logs.get(job_id)
         last_progress_update = time.time()
+        current_progress = 5
+        stage_progress = False
         
-        for line in process.stdout:
-            output_lines.append(line)
+        def handle_line(line):
+            nonlocal last_progress_update, current_progress, stage_progress
+            event = parse_event(line)
+            if event is not None:
+                job_store.mutate(job_id, lambda stored: apply_event(stored, event))
+                metrics.record_event(event)
+                stage_progress = update_estimate(job_id) or stage_progress
+                return
+            log.append(line)
             print(f"[Job {job_id}] {line.strip()}")
+            if stage_progress:
+                return  # progress follows the stages (a pipeline without telemetry falls back to parsing)
             
             # Update progress (simple parsing)
             progress = parse_progress(line)
             current_time = time.time()
             if progress is not None:
-                with job_lock:
-                    jobs[job_id]['progress'] = min(progress, 95)  # Keep at 95% until complete
-                    jobs[job_id]['updated_at'] = current_time
-                    last_progress_update = current_time
+                current_progress = min(progress, 95)  # Keep at 95% until complete
+                job_store.update(job_id, progress=current_progress)
+                last_progress_update = current_time
             elif current_time - last_progress_update > 10:
                 # Increment progress slowly if no progress detected
-                with job_lock:
-                    current_progress = jobs[job_id].get('progress', 5)
-                    if current_progress < 90:
-                        jobs[job_id]['progress'] = min(current_progress + 1, 90)
-                        jobs[job_id]['updated_at'] = current_time
-                        last_progress_update = current_time
+                if current_progress < 90:
+                    current_progress = min(current_progress + 1, 90)
+                    job_store.update(job_id, progress=current_progress)
+                    last_progress_update = current_time
         
-        process.wait()
-        os.chdir(original_cwd)
+        if pipeline_workers:
+            print(f"[API] Submitting job {job_id} to warm pipeline worker {slot}")
+            running['worker'] = pipeline_workers[slot]
+            config = dict(build_pipeline_config(job, resume), work_dir=cwd)
+            returncode = pipeline_workers[slot].run(job_id, config, handle_line)
+        else:
+            # Build command
+            command = build_pipeline_command(job, resume)
+            print(f"[API] Executing command: {command}")
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1,
+                cwd=cwd,
+                env=dict(os.environ, PIPELINE_JOB_DIR=cwd, **slot_env(slot)),
+                start_new_session=True  # own process group, killed as a whole on cancel
+            )
+            running['pid'] = process.pid
+            if job_store.get(job_id, include_output=False)['status'] == 'cancelled':
+                kill_process_group(process.pid, grace=CANCEL_GRACE)
+            for line in process.stdout:
+                handle_line(line)
+            process.wait()
+            returncode = process.returncode
         
-        with job_lock:
-            jobs[job_id]['output'] = ''.join(output_lines)
-            jobs[job_id]['updated_at'] = time.time()
-            
-            if process.returncode == 0:
-                jobs[job_id]['status'] = 'completed'
-                jobs[job_id]['progress'] = 100
-                print(f"[API] Job {job_id} completed successfully")
-            else:
-                jobs[job_id]['status'] = 'failed'
-                jobs[job_id]['error'] = f'Pipeline failed with exit code {process.returncode}'
-                print(f"[API] Job {job_id} failed with exit code {process.returncode}")
+        # The full log stays in the file; the job record keeps its tail
+        output = log.read(log.tail(OUTPUT_TAIL_BYTES), OUTPUT_TAIL_BYTES)[0].decode('utf-8', errors='replace')
+        job_store.update(job_id, output=output)
+        if returncode == 0:
+            finish_job(job_id, status='completed', progress=100, eta_seconds=0, eta_at=time.time())
+            stage_estimator.invalidate()
+            print(f"[API] Job {job_id} completed successfully")
+        else:
+            finish_job(job_id, status='failed', error=f'Pipeline failed with exit code {returncode}')
+            print(f"[API] Job {job_id} exited with code {returncode}")
                 
     except Exception as e:
         print(f"[API] Error executing job {job_id}: {e}")
         import traceback
         traceback.print_exc()
-        with job_lock:
-            jobs[job_id]['status'] = 'failed'
-            jobs[job_id]['error'] = str(e)
-            jobs[job_id]['updated_at'] = time.time()
+        finish_job(job_id, status='failed', error=str(e))
+    finally:
+        with running_jobs_lock:
+            running_jobs.pop(job_id, None)
+        job_logs.release(job_id)
+        send_webhook(job_id)
 
 
-def build_pipeline_command(job):
-    """Build pipeline command"""
-    parts = ['python', 'pipeline_wrapper.py']
+def update_estimate(job_id):
+    """
+    Set a running job's progress and ETA from its stages and the durations of
+    past jobs; False if nothing is known about its stages yet.
+    """
+    job = job_store.get(job_id, include_output=False)
+    estimate = stage_estimator.estimate(job) if job is not None else None
+    if estimate is None:
+        return False
+    now = time.time()
+    
+    def apply(stored):
+        if stored['status'] != 'running':
+            return False
+        # Estimates move as stages finish; progress never goes backwards
+        stored['progress'] = max(stored.get('progress') or 0, min(5 + int(90 * estimate['progress']), 95))
+        stored['eta_seconds'] = estimate['eta_seconds']
+        stored['eta_at'] = now + estimate['eta_seconds'] if estimate['eta_seconds'] is not None else None
+        stored['estimated_total_seconds'] = estimate['estimated_total_seconds']
+    job_store.mutate(job_id, apply)
+    with running_jobs_lock:
+        if job_id in running_jobs:
+            running_jobs[job_id]['estimated_at'] = now
+    return True
+
+
+def backlog_seconds(snapshot):
+    """Estimated GPU-seconds of work left in the node's running and queued jobs (None if unknown)"""
+    total = None
+    for entry in snapshot['running'] + snapshot['queued']:
+        job = job_store.get(entry['id'], include_output=False)
+        if job is None:
+            continue
+        left = job.get('eta_seconds') if job['status'] == 'running' else job.get('estimated_total_seconds')
+        if left is not None:
+            total = (total or 0.0) + left
+    return round(total, 1) if total is not None else None
+
+
+def finish_job(job_id, **fields):
+    """Record a job's final state unless it was cancelled in the meantime"""
+    def finish(stored):
+        if stored['status'] == 'cancelled':
+            return False
+        stored.update(fields)
+    job_store.mutate(job_id, finish)
+
+
+def terminate_job(job_id, progress):
+    """
+    Kill a running job's process group (SIGTERM, SIGKILL after CANCEL_GRACE),
+    then the ComfyUI server of its slot. Returns what was reclaimed, or None
+    if the job has no process on this server.
+    """
+    with running_jobs_lock:
+        running = running_jobs.get(job_id)
+        if running is None or running.get('terminating'):
+            return None
+        running['terminating'] = True
+    started = time.time()
+    if running['worker'] is not None:
+        # The job runs inside the warm worker: kill it and warm up a fresh one
+        running['worker'].kill(grace=CANCEL_GRACE)
+        running['worker'].start()
+    elif running['pid'] is not None:
+        kill_process_group(running['pid'], grace=CANCEL_GRACE)
+    
+    comfyui = ComfyUISupervisor(port=comfyui_port(running['slot']))
+    if comfyui.is_ready():
+        comfyui.stop(grace=CANCEL_GRACE)
+    comfyui_running = comfyui.is_ready()
+    if comfyui_running:
+        print(f"[API] ComfyUI on port {comfyui.port} is still running (not started by the pipeline?)")
+    
+    # Estimated time the job would still have held the GPU, from its progress so far
+    elapsed = started - running['started']
+    remaining = elapsed * (100 - progress) / progress if 0 < progress < 100 else 0.0
+    return {
+        'gpu_seconds_used': round(elapsed, 1),
+        'gpu_seconds_reclaimed': round(remaining, 1),
+        'kill_seconds': round(time.time() - started, 2),
+        'comfyui_running': comfyui_running
+    }
+
+
+def execute_distributed_job(job_id, job):
+    """Run a job as scene segments on the coordinator's nodes"""
+    def start(stored):
+        if stored['status'] == 'cancelled':
+            return False
+        stored.update(status='running', progress=5, queue_position=None, resume_requested=False,
+                      started_at=time.time())
+    
+    if job_store.mutate(job_id, start)['status'] != 'running':
+        return
+    try:
+        print(f"[API] Starting distributed job {job_id} on {len(coordinator.nodes)} nodes")
+        
+        input_path = resolve_job_input(job)
+        if job.get('input_method') == 'youtube':
+            from pipeline_wrapper import resolve_input
+            input_path = resolve_input(input_path)
+        
+        def on_update(summary):
+            job_store.update(job_id, segments=summary['segments'],
+                             progress=5 + int(90 * summary['completed'] / max(summary['total'], 1)))
+        
+        def cancelled():
+            return job_store.get(job_id, include_output=False)['status'] == 'cancelled'
+        
+        params = {key: job.get(key) for key in
+                  ('unet_flag', 'face_restore_flag', 'upscale_flag', 'upscale_value', 'clahe_flag')}
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = os.path.join(job_dir(job_id), f"{stem}_distributed.mp4")
+        coordinator.run(input_path, output_path, params, job_id, os.path.join(job_dir(job_id), 'segments'),
+                        on_update=on_update, cancelled=cancelled)
+        
+        finish_job(job_id, status='completed', progress=100, outputs={'final_video_path': output_path})
+        print(f"[API] Distributed job {job_id} completed: {output_path}")
+    except Exception as e:
+        print(f"[API] Error executing distributed job {job_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        def mark_failed(stored):
+            if stored['status'] == 'cancelled':
+                return False
+            stored['status'] = 'failed'
+            stored['error'] = str(e)
+        job_store.mutate(job_id, mark_failed)
+    finally:
+        send_webhook(job_id)
+
+
+def send_webhook(job_id, urls=None):
+    """
+    POST a finished job (without its log) to the job's webhook_url and those
+    of requests that joined it (or only to urls), in the background
+    """
+    job = job_store.get(job_id, include_output=False)
+    if job is None or job['status'] not in FINISHED_STATUSES:
+        return
+    if urls is None:
+        urls = [url for url in [job.get('webhook_url')] + job.get('extra_webhook_urls', []) if url]
     
+    def deliver(url):
+        for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+            try:
+                requests.post(url, json=job, timeout=WEBHOOK_TIMEOUT).raise_for_status()
+                print(f"[API] Webhook for job {job_id} delivered ({job['status']})")
+                return
+            except requests.RequestException as e:
+                print(f"[API] Webhook for job {job_id} failed (attempt {attempt}/{WEBHOOK_ATTEMPTS}): {e}")
+                if attempt < WEBHOOK_ATTEMPTS:
+                    time.sleep(5 * attempt)
+    
+    for url in urls:
+        threading.Thread(target=deliver, args=(url,), daemon=True).start()
+
+
+def resolve_job_input(job):
+    """YouTube URL or absolute manual path for a job"""
     input_method = job.get('input_method', 'manual')
     
     if input_method == 'youtube':
         youtube_url = job.get('youtube_url') or job.get('youtubeUrl')
-        if youtube_url:
-            parts.append(f'"{youtube_url}"')
-        else:
+        if not youtube_url:
             raise ValueError('YouTube URL is required for youtube input method')
+        return youtube_url
+    
+    # Resolve manual path
+    manual_path = job.get('manual_path') or job.get('manualPath')
+    if not manual_path:
+        raise ValueError('Manual path is required for manual input method')
+    
+    if not manual_path.startswith('/'):
+        manual_path = os.path.join(WORKSPACE_DIR, manual_path)
+    return manual_path
+
+
+def build_pipeline_config(job, resume=False):
+    """Build run_pipeline() config for the warm worker"""
+    return {
+        'input': resolve_job_input(job),
+        'manifest_path': manifest_path(job['id']),
+        'resume': resume,
+        'unet_flag': bool(job.get('unet_flag') or job.get('unetFlag')),
+        'face_restore_flag': bool(job.get('face_restore_flag') or job.get('faceRestoreFlag')),
+        'upscale_flag': bool(job.get('upscale_flag') or job.get('upscaleFlag')),
+        'upscale_value': float(job.get('upscale_value') or job.get('upscaleValue', 2.0)),
+        'clahe_flag': bool(job.get('clahe_flag') or job.get('claheFlag')),
+    }
+
+
+def build_pipeline_command(job, resume=False):
+    """Build pipeline command"""
+    parts = ['python', shlex.quote(resolve_pipeline_script(PIPELINE_SCRIPT))]
+    
+    job_input = resolve_job_input(job)
+    if job.get('input_method', 'manual') == 'youtube':
+        parts.append(f'"{job_input}"')
     else:
-        # Resolve manual path
-        manual_path = job.get('manual_path') or job.get('manualPath')
-        if not manual_path:
-            raise ValueError('Manual path is required for manual input method')
-        
-        if not manual_path.startswith('/'):
-            manual_path = os.path.join(WORKSPACE_DIR, manual_path)
-        parts.append(manual_path)
+        parts.append(job_input)
     
     # Add flags (handle both camelCase and snake_case)
     parts.append('true' if job.get('unet_flag') or job.get('unetFlag') else 'false')
@@ -291,6 +1122,9 @@ def build_pipeline_command(job):
     parts.append('true' if job.get('upscale_flag') or job.get('upscaleFlag') else 'false')
     parts.append(str(job.get('upscale_value') or job.get('upscaleValue', 2.0)))
     parts.append('true' if job.get('clahe_flag') or job.get('claheFlag') else 'false')
+    parts.extend(['--manifest', manifest_path(job['id'])])
+    if resume:
+        parts.append('--resume')
     
     command = ' '.join(parts)
     print(f"[API] Built command: {command}")
@@ -318,17 +1152,78 @@ def parse_progress(line):
 @app.route('/jobs/<job_id>/cancel', methods=['POST'])
 def cancel_job(job_id):
     """Cancel a job"""
-    with job_lock:
-        if job_id not in jobs:
-            return jsonify({'error': 'Job not found'}), 404
-        
-        if jobs[job_id]['status'] in ['completed', 'failed', 'cancelled']:
-            return jsonify({'error': 'Job cannot be cancelled'}), 400
-        
-        jobs[job_id]['status'] = 'cancelled'
-        jobs[job_id]['updated_at'] = time.time()
-        
-        return jsonify(jobs[job_id])
+    previous = {}
+    
+    def cancel(job):
+        previous['status'] = job['status']
+        if job['status'] in ['completed', 'failed', 'cancelled']:
+            return False
+        job['status'] = 'cancelled'
+        job['queue_position'] = None
+    
+    job = job_store.mutate(job_id, cancel)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if previous['status'] in ['completed', 'failed', 'cancelled']:
+        return jsonify({'error': 'Job cannot be cancelled'}), 400
+    
+    if scheduler is None:
+        # The executor process sees the cancelled status and stops the job
+        return jsonify(job), 202 if previous['status'] == 'running' else 200
+    
+    if previous['status'] == 'queued' and scheduler.remove(job_id):
+        # Never started, so no job thread will close its log or report it
+        job_logs.release(job_id)
+        send_webhook(job_id)
+    
+    with running_jobs_lock:
+        running_here = job_id in running_jobs
+    if running_here:
+        # SIGTERM -> SIGKILL can take up to 2 x CANCEL_GRACE; the job's cancellation field reports the outcome
+        threading.Thread(target=stop_cancelled_job, args=(job_id, job.get('progress') or 0), daemon=True).start()
+        return jsonify(job), 202
+    return jsonify(job)
+
+
+def stop_cancelled_job(job_id, progress):
+    """Terminate a cancelled job running here and record what it freed"""
+    reclaimed = terminate_job(job_id, progress)
+    if reclaimed is not None:
+        print(f"[API] Job {job_id} killed in {reclaimed['kill_seconds']}s, "
+              f"~{reclaimed['gpu_seconds_reclaimed']} GPU-seconds reclaimed")
+        job_store.update(job_id, cancellation=reclaimed)
+    return reclaimed
+
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Restart a failed or cancelled job from its first incomplete stage"""
+    previous = {}
+    
+    def resume(job):
+        previous['status'] = job['status']
+        if job['status'] not in ['failed', 'cancelled']:
+            return False
+        job['status'] = 'queued'
+        job['error'] = None
+        job['resume_requested'] = True
+        job['resumed_count'] = job.get('resumed_count', 0) + 1
+    
+    snapshot = job_store.mutate(job_id, resume)
+    if snapshot is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if previous['status'] not in ['failed', 'cancelled']:
+        return jsonify({'error': f"Job is {previous['status']}, only failed or cancelled jobs can be resumed"}), 400
+    
+    has_manifest = os.path.exists(manifest_path(job_id))
+    print(f"[API] Resuming job {job_id} ({'from manifest' if has_manifest else 'no manifest, starting over'})")
+    if scheduler is not None:
+        snapshot['queue_position'] = scheduler.submit(job_id, snapshot.get('priority', 0),
+                                                      snapshot.get('vram_gb', default_vram_gb()))
+    
+    return jsonify(snapshot)
 
 
 @app.route('/files', methods=['GET'])
@@ -351,38 +1246,307 @@ def list_files():
         return jsonify({'error': str(e)}), 500
 
 
+def workspace_file(relative_path):
+    """(full path, error response) for a file path relative to the workspace"""
+    if not relative_path:
+        return None, (jsonify({'error': 'Path parameter is required'}), 400)
+    
+    normalized_path = os.path.normpath(relative_path).lstrip('/\\')
+    full_path = os.path.join(WORKSPACE_DIR, normalized_path)
+    full_path = os.path.normpath(full_path)
+    
+    if not full_path.startswith(os.path.normpath(WORKSPACE_DIR)):
+        return None, (jsonify({'error': 'Invalid path'}), 400)
+    
+    if not os.path.isfile(full_path):
+        return None, (jsonify({'error': 'File not found'}), 404)
+    return full_path, None
+
+
 @app.route('/download', methods=['GET'])
 def download_file():
-    """Download a file from the workspace"""
+    """
+    Download a file from the workspace. Honours Range (206 Partial Content)
+    and If-Range/If-None-Match, so interrupted downloads can resume and
+    segments can be fetched in parallel. Whole files go out through the
+    server's wsgi.file_wrapper (sendfile under gunicorn) or X-Sendfile.
+    """
     try:
-        relative_path = request.args.get('path')
-        if not relative_path:
-            return jsonify({'error': 'Path parameter is required'}), 400
-
-        normalized_path = os.path.normpath(relative_path).lstrip('/\\')
-        full_path = os.path.join(WORKSPACE_DIR, normalized_path)
-        full_path = os.path.normpath(full_path)
-
-        if not full_path.startswith(os.path.normpath(WORKSPACE_DIR)):
-            return jsonify({'error': 'Invalid path'}), 400
-
-        if not os.path.isfile(full_path):
-            return jsonify({'error': 'File not found'}), 404
+        full_path, error = workspace_file(request.args.get('path'))
+        if error is not None:
+            return error
 
         filename = os.path.basename(full_path)
-        return send_file(full_path, as_attachment=True, download_name=filename)
+        response = send_file(full_path, as_attachment=True, download_name=filename, conditional=True, max_age=0)
+        if response.status_code in (200, 206):
+            metrics.inc('pipeline_download_bytes_total', response.content_length or 0)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def build_manifest(full_path, chunk_size):
+    """Size and sha256 of a file and of each chunk_size piece, cached until the file changes"""
+    st = os.stat(full_path)
+    key = hashlib.sha1(f"{full_path}:{chunk_size}".encode()).hexdigest()
+    cache_path = os.path.join(MANIFESTS_DIR, f"{key}.json")
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached['size'] == st.st_size and cached['mtime_ns'] == st.st_mtime_ns:
+            return cached
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    whole = hashlib.sha256()
+    chunks = []
+    with open(full_path, 'rb') as f:
+        offset = 0
+        while offset < st.st_size:
+            chunk = hashlib.sha256()
+            length = min(chunk_size, st.st_size - offset)
+            remaining = length
+            while remaining:
+                block = f.read(min(4 * 1024 * 1024, remaining))
+                if not block:
+                    raise IOError(f"{full_path} shrank while hashing")
+                chunk.update(block)
+                whole.update(block)
+                remaining -= len(block)
+            chunks.append({'index': len(chunks), 'offset': offset, 'length': length, 'sha256': chunk.hexdigest()})
+            offset += length
+    manifest = {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'last_modified': http_date(st.st_mtime),
+        'chunk_size': chunk_size,
+        'sha256': whole.hexdigest(),
+        'chunks': chunks
+    }
+    tmp = f"{cache_path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, cache_path)
+    return manifest
+
+
+@app.route('/download/manifest', methods=['GET'])
+def download_manifest():
+    """
+    Size, Last-Modified and sha256 (whole file and per ?chunk_size= piece,
+    default 64MB) of a workspace file, for parallel ranged downloads that
+    verify every piece. Send last_modified as If-Range with each Range request.
+    """
+    full_path, error = workspace_file(request.args.get('path'))
+    if error is not None:
+        return error
+    try:
+        chunk_size = int(request.args.get('chunk_size', DOWNLOAD_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid chunk_size'}), 400
+    if not 1024 * 1024 <= chunk_size <= 1024 ** 3:
+        return jsonify({'error': 'chunk_size must be between 1MB and 1GB'}), 400
+    manifest = dict(build_manifest(full_path, chunk_size), path=request.args.get('path'))
+    manifest.pop('mtime_ns', None)
+    return json_response(manifest)
+
+
+def sync_executor():
+    """
+    Bring the local scheduler in line with the job store: queue jobs that an
+    API process (or an earlier server run) left queued, and stop jobs that
+    were cancelled through an API process.
+    """
+    global executor_backlog
+    for job in sorted(job_store.list(status='queued'), key=lambda j: j['created_at']):
+        if job['id'] not in scheduler:
+            try:
+                scheduler.submit(job['id'], job.get('priority', 0), job.get('vram_gb', default_vram_gb()))
+            except ValueError:
+                pass  # submitted by a request thread in the meantime
+    
+    for entry in scheduler.snapshot()['queued']:
+        job = job_store.get(entry['id'], include_output=False)
+        if (job is None or job['status'] != 'queued') and scheduler.remove(entry['id']):
+            job_logs.release(entry['id'])
+            send_webhook(entry['id'])
+    
+    with running_jobs_lock:
+        running = [job_id for job_id, entry in running_jobs.items() if not entry.get('terminating')]
+        # Progress of a long stage moves with its elapsed time, not only when a stage ends
+        stale = [job_id for job_id, entry in running_jobs.items()
+                 if 'estimated_at' in entry and time.time() - entry['estimated_at'] >= ESTIMATE_REFRESH]
+    for job_id in stale:
+        update_estimate(job_id)
+    for job_id in running:
+        job = job_store.get(job_id, include_output=False)
+        if job is not None and job['status'] == 'cancelled':
+            threading.Thread(target=stop_cancelled_job, args=(job_id, job.get('progress') or 0),
+                             daemon=True).start()
+    
+    # Reads every queued job, so it is summed here once per sync, never per /health probe
+    snapshot = scheduler.snapshot()
+    executor_backlog = backlog_seconds(snapshot)
+    
+    # For /status of API processes, which have no scheduler of their own
+    tmp = f"{EXECUTOR_STATUS_PATH}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(dict(snapshot, backlog_seconds=executor_backlog, pid=os.getpid(), updated_at=time.time()), f)
+    os.replace(tmp, EXECUTOR_STATUS_PATH)
+
+
+def run_executor():
+    while True:
+        try:
+            sync_executor()
+        except Exception as e:
+            print(f"[API] Executor sync failed: {e}")
+        time.sleep(EXECUTOR_POLL)
+
+
+def read_executor_status():
+    """Scheduler snapshot last written by the executor process (None if there is none)"""
+    try:
+        with open(EXECUTOR_STATUS_PATH) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    snapshot['stale'] = time.time() - snapshot.get('updated_at', 0) > 10 * EXECUTOR_POLL
+    return snapshot
+
+
+def start_executor(args):
+    """Scheduler, warm workers (or coordinator) and the executor loop of this process"""
+    global scheduler, coordinator, pipeline_workers
+    interrupted = job_store.fail_interrupted()
+    if interrupted:
+        print(f"[API] Marked {len(interrupted)} interrupted job(s) as failed: {', '.join(interrupted)}")
+    
+    scheduler = JobScheduler(run_scheduled_job, slots=args.max_concurrent_jobs,
+                             vram_budget_gb=args.vram_budget_gb, on_positions=update_queue_positions)
+    print(f"Scheduler: {scheduler.slots} slot(s), VRAM budget {scheduler.vram_budget_gb:g} GB")
+    if SLOT_GPUS:
+        print(f"Slot GPUs: {', '.join(slot_env(slot)['CUDA_VISIBLE_DEVICES'] for slot in range(scheduler.slots))}")
+        if scheduler.slots > len(SLOT_GPUS):
+            print(f"[API] Warning: {scheduler.slots} slots on {len(SLOT_GPUS)} GPU(s), slots share GPUs")
+    if scheduler.slots > 1 and not args.coordinator and not os.environ.get('COMFYFLUX_WORKFLOW'):
+        # The Utils flux helpers always talk to port 8188, so pipeline.py refuses to run on other slots
+        message = "without COMFYFLUX_WORKFLOW only slot 0 can run the flux stages (Utils uses port 8188)"
+        if args.execution == 'worker':
+            raise SystemExit(f"[API] {scheduler.slots} slots need COMFYFLUX_WORKFLOW: {message}")
+        print(f"[API] Warning: {message}; jobs on other slots fail unless {PIPELINE_SCRIPT} avoids them")
+    
+    if args.coordinator:
+        coordinator = Coordinator([url.strip() for url in args.coordinator.split(',') if url.strip()])
+        print(f"Coordinator for nodes: {', '.join(node.url for node in coordinator.nodes)}")
+    elif args.execution == 'worker':
+        # Warm up imports and CUDA before the first job arrives; each slot gets its own worker
+        worker_env = {}
+        if scheduler.slots > 1 and scheduler.vram_budget_gb != float('inf'):
+            worker_env['MODEL_VRAM_BUDGET_GB'] = str(scheduler.vram_budget_gb / scheduler.slots)
+        pipeline_workers = [PipelineWorker(WORKSPACE_DIR, env=dict(worker_env, **slot_env(slot)))
+                            for slot in range(scheduler.slots)]
+        for worker in pipeline_workers:
+            worker.start()
+    
+    # Jobs still queued when the server stopped never started; the first sync queues them again in order
+    threading.Thread(target=run_executor, daemon=True).start()
+
+
+GUNICORN_AVAILABLE = importlib.util.find_spec('gunicorn') is not None
+
+
+def serve_gunicorn(args):
+    """Serve the routes from gunicorn worker processes (threads or gevent per worker)"""
+    from gunicorn.app.base import BaseApplication
+    
+    class APIServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{args.host}:{args.port}")
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('worker_class', args.worker_class)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_connections', args.worker_connections)
+            # Long-polls and SSE streams are held open; workers keep heartbeating meanwhile
+            self.cfg.set('timeout', 120)
+            self.cfg.set('graceful_timeout', LONG_POLL_MAX + 5)
+            self.cfg.set('keepalive', 5)
+        
+        def load(self):
+            # Imported fresh in every worker (after gevent patching) as an API-only process
+            from remote_api_server import app as api_app
+            return api_app
+    
+    APIServer().run()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Remote API Server for Video Pipeline')
     parser.add_argument('--port', type=int, default=5000, help='Port to run server on')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to bind to')
+    parser.add_argument('--role', choices=['all', 'api', 'executor'], default='all',
+                        help='Serve the API and run jobs (all), only serve the API (api), or only run '
+                             'the jobs queued in the job store (executor); api and executor share the workspace')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'],
+                        default=os.environ.get('API_SERVER') or ('gunicorn' if GUNICORN_AVAILABLE else 'werkzeug'),
+                        help='HTTP server: gunicorn worker processes (default when installed, or API_SERVER) '
+                             'or werkzeug, the development server with one thread per request')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('API_WORKERS', '4')),
+                        help='gunicorn worker processes (default 4, or API_WORKERS)')
+    parser.add_argument('--worker-class', choices=['gthread', 'gevent'], default='gthread',
+                        help='gunicorn worker type: gthread (--threads per worker) or gevent (needs gevent)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('API_THREADS', '128')),
+                        help='Threads per gthread worker, i.e. concurrent long-polls/streams per worker '
+                             '(default 128, or API_THREADS; keep workers x threads well above waiting clients)')
+    parser.add_argument('--worker-connections', type=int, default=1000,
+                        help='Concurrent connections per gevent worker')
+    parser.add_argument('--execution', choices=['worker', 'subprocess'], default='worker',
+                        help='Run jobs on a warm pipeline worker or as one pipeline_wrapper.py process per job')
+    parser.add_argument('--pipeline-script', type=str, default=PIPELINE_SCRIPT,
+                        help='Script run per job in subprocess mode (e.g. pipeline_stub.py for testing)')
+    parser.add_argument('--coordinator', type=str, default=None, metavar='URLS',
+                        help='Comma-separated node URLs: split every job into scene segments and run them there')
+    parser.add_argument('--max-concurrent-jobs', type=int, default=int(os.environ.get('MAX_CONCURRENT_JOBS', '1')),
+                        help='Jobs allowed to run at once (default 1, or MAX_CONCURRENT_JOBS)')
+    parser.add_argument('--gpus', type=str, default=os.environ.get('NODE_GPUS'),
+                        help='Comma-separated GPU indices handed to slots in turn as CUDA_VISIBLE_DEVICES '
+                             '(default NODE_GPUS, else every GPU nvidia-smi reports)')
+    parser.add_argument('--vram-budget-gb', type=float, default=None,
+                        help='VRAM shared by running jobs (default NODE_VRAM_GB, else detected with nvidia-smi)')
     args = parser.parse_args()
+    PIPELINE_SCRIPT = resolve_pipeline_script(args.pipeline_script)
+    if args.gpus is not None:
+        SLOT_GPUS = [gpu.strip() for gpu in args.gpus.split(',') if gpu.strip()]
+    else:
+        SLOT_GPUS = [str(gpu['index']) for gpu in NODE_INFO['gpus']]
     
-    print(f"Starting Remote API Server on {args.host}:{args.port}")
     print(f"Workspace: {WORKSPACE_DIR}")
     print(f"Input Videos: {INPUT_VIDEOS_DIR}")
+    print(f"Job store: {JOB_DB_PATH}")
+    
+    if args.role == 'executor':
+        print("Starting job executor (no HTTP server)")
+        start_executor(args)
+        while True:
+            time.sleep(3600)
     
-    app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    print(f"Starting Remote API Server on {args.host}:{args.port} ({args.role}, {args.server})")
+    if args.server == 'werkzeug' and not GUNICORN_AVAILABLE:
+        print("[API] gunicorn is not installed: serving from Flask's development server, "
+              "which runs out of threads under many long-polls and log streams (pip install gunicorn)")
+    if args.server == 'gunicorn':
+        # Jobs run in a separate executor process, never in the workers serving requests
+        executor = None
+        if args.role == 'all':
+            executor = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + sys.argv[1:] +
+                                        ['--role', 'executor'])
+        try:
+            serve_gunicorn(args)
+        finally:
+            if executor is not None:
+                executor.terminate()
+                executor.wait()
+    else:
+        if args.role == 'all':
+            start_executor(args)
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
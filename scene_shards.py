@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scene-sharded execution of the colorization chain.
+Scene cuts are found with ffmpeg's scene score, neighbouring scenes are
+grouped into shards of at least min_seconds, and all shards are cut out
+frame-exactly in one pass (decoded once and split by frame number, never by
+seek time).
+Every shard is then an independent video that goes through the chain on its
+own. Shards run on a bounded worker pool and the results are concatenated
+in order. Frame counts are checked for every shard and for the final video,
+so a misaligned shard fails the stage instead of drifting the audio.
+"""
+
+import json
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_stream import probe_video
+
+SCENE_THRESHOLD = float(os.environ.get("SCENE_SHARD_THRESHOLD", "0.4"))
+SHARD_CRF = os.environ.get("SCENE_SHARD_CRF", "12")
+
+_PTS_TIME = re.compile(r"pts_time:([0-9.]+)")
+
+
+def count_frames(path):
+    """Exact number of decoded video frames (decodes the whole stream)"""
+    out = subprocess.check_output([
+        "ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+        "-show_entries", "stream=nb_read_frames", "-of", "json", path,
+    ])
+    return int(json.loads(out)["streams"][0]["nb_read_frames"])
+
+
+def detect_scene_cuts(path, fps, threshold=SCENE_THRESHOLD):
+    """Frame numbers at which a new scene starts (never 0)"""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-an",
+         "-vf", f"select='gt(scene,{threshold})',showinfo", "-f", "null", "-"],
+        stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, check=True,
+    )
+    cuts = set()
+    for line in result.stderr.splitlines():
+        if "Parsed_showinfo" not in line:
+            continue
+        match = _PTS_TIME.search(line)
+        if match:
+            frame = int(round(float(match.group(1)) * fps))
+            if frame > 0:
+                cuts.add(frame)
+    return sorted(cuts)
+
+
+def plan_shards(cuts, total_frames, fps, min_seconds=30.0):
+    """
+    Group scenes into [start, end) frame ranges of at least min_seconds.
+    Shards only ever split at scene cuts; a short tail joins the previous shard.
+    """
+    min_frames = max(1, int(min_seconds * fps))
+    shards = []
+    start = 0
+    for cut in [c for c in cuts if 0 < c < total_frames] + [total_frames]:
+        if cut - start >= min_frames or cut == total_frames:
+            shards.append([start, cut])
+            start = cut
+    if len(shards) > 1 and shards[-1][1] - shards[-1][0] < min_frames:
+        tail = shards.pop()
+        shards[-1][1] = tail[1]
+    return [tuple(s) for s in shards]
+
+
+def cut_shards(path, shards, pattern, fps):
+    """
+    Frames [start, end) of every shard as their own video, named pattern % index.
+    One decode of path writes them all: frames are renumbered at the constant
+    frame rate, a keyframe is forced at every shard start and the segment muxer
+    splits there, so the cut stays frame-exact without seeking.
+    """
+    starts = [start for start, _ in shards[1:]]
+    command = ["ffmpeg", "-v", "error", "-y", "-i", path, "-an",
+               "-vf", "setpts=N/FRAME_RATE/TB", "-r", str(fps),
+               "-c:v", "libx264", "-crf", SHARD_CRF, "-pix_fmt", "yuv420p"]
+    if starts:
+        command += ["-force_key_frames", "expr:" + "+".join(f"eq(n,{start})" for start in starts),
+                    "-f", "segment", "-segment_frames", ",".join(str(start) for start in starts),
+                    "-segment_format", "mp4", "-reset_timestamps", "1", pattern]
+    else:
+        command.append(pattern % 0)
+    subprocess.run(command, check=True)
+    paths = []
+    for index, (start, end) in enumerate(shards):
+        output_path = pattern % index
+        frames = count_frames(output_path)
+        if frames != end - start:
+            raise RuntimeError(f"Shard {output_path} has {frames} frames, expected {end - start}")
+        paths.append(output_path)
+    return paths
+
+
+def concat_videos(paths, output_path):
+    """Concatenate videos encoded with the same settings without re-encoding"""
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w") as f:
+        for path in paths:
+            f.write("file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")))
+    try:
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+                        "-an", "-c", "copy", output_path], check=True)
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def run_sharded(source_path, output_path, run_shard, workers=2, min_seconds=30.0, shard_dir=None):
+    """
+    Run run_shard(shard_path, index) -> result video for every scene shard of
+    source_path on up to workers threads and concatenate the results into
+    output_path. Returns the shard plan with per-shard frame counts.
+    """
+    info = probe_video(source_path)
+    total = count_frames(source_path)
+    cuts = detect_scene_cuts(source_path, info["fps_value"])
+    shards = plan_shards(cuts, total, info["fps_value"], min_seconds)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    shard_dir = shard_dir or os.path.join(os.path.dirname(source_path), f"{stem}_shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    print(f"🎬 {len(cuts)} scene cuts, {len(shards)} shards of >= {min_seconds:.0f}s, {workers} workers")
+
+    shard_paths = cut_shards(source_path, shards,
+                             os.path.join(shard_dir, f"{stem.replace('%', '%%')}_shard%04d.mp4"), info["fps"])
+
+    def one(index):
+        start, end = shards[index]
+        result = run_shard(shard_paths[index], index)
+        frames = count_frames(result)
+        if frames != end - start:
+            raise RuntimeError(f"Shard {index} produced {frames} frames, expected {end - start}")
+        print(f"🎬 Shard {index + 1}/{len(shards)} done ({end - start} frames)")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(one, range(len(shards))))
+    concat_videos(results, output_path)
+    frames = count_frames(output_path)
+    if frames != total:
+        raise RuntimeError(f"Concatenated video has {frames} frames, source has {total}")
+    return {"frames": total, "shards": [{"start": s, "end": e, "output": r} for (s, e), r in zip(shards, results)]}
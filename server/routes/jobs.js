@@ -145,13 +145,23 @@ router.get('/:id/download', async (req, res) => {
 
     const { RemoteAPIClient } = await import('../services/remoteAPIClient.js')
     const apiClient = new RemoteAPIClient(node)
-    const downloadResponse = await apiClient.downloadFile(job.outputPath)
+    // Pass Range / If-Range through so browsers can resume interrupted downloads
+    const rangeHeaders = {}
+    if (req.headers.range) rangeHeaders.Range = req.headers.range
+    if (req.headers['if-range']) rangeHeaders['If-Range'] = req.headers['if-range']
+    const downloadResponse = await apiClient.downloadFile(job.outputPath, rangeHeaders)
 
     const filename = job.outputPath.split('/').pop() || `${job.id}.mp4`
     const contentType =
       downloadResponse.headers['content-type'] || 'application/octet-stream'
+    res.status(downloadResponse.status)
     res.setHeader('Content-Type', contentType)
     res.setHeader('Content-Disposition', `attachment; filename="${filename}"`)
+    for (const header of ['content-length', 'content-range', 'accept-ranges', 'etag', 'last-modified']) {
+      if (downloadResponse.headers[header]) {
+        res.setHeader(header, downloadResponse.headers[header])
+      }
+    }
 
     downloadResponse.data.pipe(res)
     downloadResponse.data.on('error', (error) => {
@@ -12,7 +12,7 @@ router.get('/', async (req, res) => {
       jobManager.getAllJobs(),
     ])
 
-    const activeStatuses = new Set(['pending', 'running'])
+    const activeStatuses = new Set(['pending', 'queued', 'running'])
     const jobCounts = jobs.reduce((acc, job) => {
       if (job.nodeId && activeStatuses.has(job.status)) {
         acc[job.nodeId] = (acc[job.nodeId] || 0) + 1
@@ -161,35 +161,43 @@ export class JobManager {
     const { RemoteAPIClient } = await import('./remoteAPIClient.js')
     const apiClient = new RemoteAPIClient(node)
     
-    const maxAttempts = 3600 // 1 hour with 1 second intervals
-    let attempts = 0
+    // Long-poll: the node answers as soon as the job changes, or after 30s
+    const deadline = Date.now() + 60 * 60 * 1000 // 1 hour
+    let version
     
-    while (attempts < maxAttempts) {
+    while (Date.now() < deadline) {
       try {
-        const remoteJob = await apiClient.getJob(remoteJobId)
+        const remoteJob = await apiClient.getJob(remoteJobId, { wait: 30, sinceVersion: version })
         
-        // Update local job status
-        const logText = remoteJob.output || ''
-        const updatePayload = {
-          progress: remoteJob.progress || 0,
-          status: remoteJob.status,
-          error: remoteJob.error,
-          logs: logText,
+        if (remoteJob.version === undefined || remoteJob.version !== version) {
+          // Update local job status
+          const logText = remoteJob.output || ''
+          const updatePayload = {
+            progress: remoteJob.progress || 0,
+            status: remoteJob.status,
+            queuePosition: remoteJob.queue_position ?? null,
+            etaAt: remoteJob.eta_at ? new Date(remoteJob.eta_at * 1000).toISOString() : null,
+            estimatedSeconds: remoteJob.estimated_total_seconds ?? null,
+            error: remoteJob.error,
+            logs: logText,
+          }
+          const outputPath = this.extractFinalOutputPath(logText)
+          if (outputPath) {
+            updatePayload.outputPath = outputPath
+          }
+          await this.updateJob(localJobId, updatePayload)
         }
-        const outputPath = this.extractFinalOutputPath(logText)
-        if (outputPath) {
-          updatePayload.outputPath = outputPath
-        }
-        await this.updateJob(localJobId, updatePayload)
         
         // Check if job is complete
         if (remoteJob.status === 'completed' || remoteJob.status === 'failed' || remoteJob.status === 'cancelled') {
           break
         }
         
-        // Wait before next poll
-        await new Promise(resolve => setTimeout(resolve, 2000)) // Poll every 2 seconds
-        attempts++
+        if (remoteJob.version === undefined) {
+          // Node without long-poll support answers at once
+          await new Promise(resolve => setTimeout(resolve, 2000))
+        }
+        version = remoteJob.version
       } catch (error) {
         console.error(`[JobManager] Error polling remote job ${remoteJobId}:`, error.message)
         await this.updateJob(localJobId, {
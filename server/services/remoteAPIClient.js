@@ -1,5 +1,9 @@
 import axios from 'axios'
 import FormData from 'form-data'
+import crypto from 'crypto'
+
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 // 8MB per PUT
+const UPLOAD_MAX_RETRIES = 5
 
 /**
  * Remote API Client
@@ -89,7 +93,65 @@ export class RemoteAPIClient {
     }
   }
 
+  /**
+   * Upload through the node's resumable chunked protocol: a dropped chunk is
+   * resent from the node's committed offset, and the node checks the whole
+   * file against our sha256. Nodes without /uploads get a single multipart POST.
+   */
   async uploadFile(fileBuffer, filename, mimetype, onProgress) {
+    const size = fileBuffer.length
+    const sha256 = crypto.createHash('sha256').update(fileBuffer).digest('hex')
+
+    let session
+    try {
+      const response = await this.client.post('/uploads', { filename, size, sha256 })
+      session = response.data
+    } catch (error) {
+      if (error.response?.status === 404) {
+        return this.uploadFileMultipart(fileBuffer, filename, mimetype, onProgress)
+      }
+      throw new Error(`Upload failed: ${error.response?.data?.error || error.message}`)
+    }
+    let offset = session.offset || 0
+    let retries = 0
+    while (offset < size) {
+      const end = Math.min(offset + UPLOAD_CHUNK_SIZE, size)
+      try {
+        const response = await axios.put(`${this.baseURL}/uploads/${session.id}`, fileBuffer.subarray(offset, end), {
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': `bytes ${offset}-${end - 1}/${size}`,
+          },
+          maxBodyLength: Infinity,
+          timeout: 300000, // 5 mins per chunk
+        })
+        offset = response.data.offset
+        retries = 0
+        if (onProgress) onProgress(Math.round((offset * 100) / size))
+      } catch (error) {
+        if (++retries > UPLOAD_MAX_RETRIES) {
+          console.error(`[RemoteAPI] Upload failed:`, error.message)
+          throw new Error(`Upload failed: ${error.response?.data?.error || error.message}`)
+        }
+        console.warn(`[RemoteAPI] Chunk at ${offset} failed (${error.message}), resuming (retry ${retries})`)
+        await new Promise(resolve => setTimeout(resolve, 1000 * retries))
+        try {
+          offset = (await this.client.get(`/uploads/${session.id}`)).data.offset
+        } catch (statusError) {
+          // Keep the old offset; the next PUT is answered with the real one if it is off
+        }
+      }
+    }
+
+    try {
+      const response = await this.client.post(`/uploads/${session.id}/finalize`, null, { timeout: 300000 })
+      return response.data
+    } catch (error) {
+      throw new Error(`Upload failed: ${error.response?.data?.error || error.message}`)
+    }
+  }
+
+  async uploadFileMultipart(fileBuffer, filename, mimetype, onProgress) {
     const formData = new FormData()
     formData.append('file', fileBuffer, {
       filename: filename,
@@ -133,15 +195,20 @@ export class RemoteAPIClient {
     }
   }
 
-  async getJob(jobId) {
+  /**
+   * Get a job. With { wait, sinceVersion } the node holds the request for up to
+   * `wait` seconds until the job's version passes sinceVersion (long-poll).
+   */
+  async getJob(jobId, { wait = 0, sinceVersion } = {}) {
+    const params = {}
+    if (wait > 0) {
+      params.wait = wait
+      if (sinceVersion !== undefined) params.since_version = sinceVersion
+    }
+    const timeout = wait > 0 ? (wait + 15) * 1000 : 10000
     try {
-<<<<<<< HEAD
-      const response = await this.client.get(`/jobs/${jobId}`)
-      return response.data
-    } catch (error) {
-      throw new Error(`Failed to get job: ${error.message}`)
-=======
       const response = await axios.get(`${this.baseURL}/jobs/${jobId}`, {
+        params,
         timeout,
         validateStatus: (status) => status < 500,
       })
@@ -161,7 +228,6 @@ export class RemoteAPIClient {
       } else {
         throw new Error(`Failed to get job: ${error.message}`)
       }
->>>>>>> f488bffd7b83b0d9f15b8d54cb6e31bd04e3836c
     }
   }
 
@@ -183,11 +249,18 @@ export class RemoteAPIClient {
     }
   }
 
-  async downloadFile(filePath) {
+  /**
+   * Stream a workspace file. headers may carry Range / If-Range, in which case
+   * the node answers 206 with just that part of the file.
+   */
+  async downloadFile(filePath, headers = {}) {
     try {
       const response = await this.client.get('/download', {
         params: { path: filePath },
+        headers,
         responseType: 'stream',
+        timeout: 0, // large outputs: no overall limit
+        validateStatus: (status) => status === 200 || status === 206,
       })
       return response
     } catch (error) {
@@ -203,8 +276,6 @@ export class RemoteAPIClient {
       throw new Error(`Failed to list files: ${error.message}`)
     }
   }
-<<<<<<< HEAD
-=======
 
   async listJobOutputs(jobId) {
     try {
@@ -230,5 +301,4 @@ export class RemoteAPIClient {
   getDownloadUrl(jobId, filename) {
     return `${this.baseURL}/jobs/${jobId}/download/${encodeURIComponent(filename)}`
   }
->>>>>>> f488bffd7b83b0d9f15b8d54cb6e31bd04e3836c
 }
@@ -17,6 +17,7 @@ import { formatDistanceToNow } from 'date-fns'
 
 const statusConfig = {
   pending: { icon: Clock, color: 'text-yellow-600', bg: 'bg-yellow-50', label: 'Pending' },
+  queued: { icon: Clock, color: 'text-yellow-600', bg: 'bg-yellow-50', label: 'Queued' },
   running: { icon: PlayCircle, color: 'text-blue-600', bg: 'bg-blue-50', label: 'Running' },
   completed: { icon: CheckCircle, color: 'text-green-600', bg: 'bg-green-50', label: 'Completed' },
   failed: { icon: XCircle, color: 'text-red-600', bg: 'bg-red-50', label: 'Failed' },
@@ -409,11 +410,19 @@ function Dashboard() {
                   </div>
                   <div>
                     <p className="text-gray-500">Status</p>
-                    <p className="text-gray-900 capitalize">{selectedJob.status}</p>
+                    <p className="text-gray-900 capitalize">
+                      {selectedJob.status}
+                      {selectedJob.status === 'queued' && selectedJob.queuePosition ? ` (#${selectedJob.queuePosition})` : ''}
+                    </p>
                   </div>
                   <div>
                     <p className="text-gray-500">Progress</p>
-                    <p className="text-gray-900">{selectedJob.progress || 0}%</p>
+                    <p className="text-gray-900">
+                      {selectedJob.progress || 0}%
+                      {selectedJob.status === 'running' && selectedJob.etaAt
+                        ? ` (done ${formatDistanceToNow(new Date(selectedJob.etaAt), { addSuffix: true })})`
+                        : ''}
+                    </p>
                   </div>
                 </div>
               </div>
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for stage results.
+A stage result is keyed on the stage name and version plus every declared
+input: files are keyed by a SHA-256 of their content, everything else
+(flags, seeds, prompts, scale values) by its JSON value. Artifacts are
+hard-linked (or copied across filesystems) into the cache directory and
+linked back to their original location on a hit, so downstream helpers that
+derive paths from their inputs keep working. Before a stage recomputes, the
+links for its other cached results are detached so the path-keyed *_cached
+helpers in Utils cannot return (or overwrite) a result for other parameters.
+
+The cache has a disk quota with least-recently-used eviction and keeps
+per-stage hit/miss counters in an SQLite index next to the objects.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+STAGE_CACHE_DIR = os.environ.get("STAGE_CACHE_DIR", "/workspace/stage_cache")
+STAGE_CACHE_QUOTA_GB = float(os.environ.get("STAGE_CACHE_QUOTA_GB", "200"))
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def _is_file(value):
+    return isinstance(value, str) and value != "" and os.path.isfile(value)
+
+
+class StageCache:
+    """Stage result cache under root with a quota in bytes"""
+
+    def __init__(self, root=STAGE_CACHE_DIR, quota_bytes=int(STAGE_CACHE_QUOTA_GB * 1024 ** 3)):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                outputs TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                stage TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self._db.commit()
+
+    # ------------------------
+    # Hashing
+    # ------------------------
+    def file_digest(self, path):
+        """SHA-256 of a file, memoized on (path, size, mtime)"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM file_hashes WHERE path=? AND size=? AND mtime_ns=?",
+                (path, st.st_size, st.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, digest))
+            self._db.commit()
+        return digest
+
+    def key_for(self, stage, ctx):
+        """Key of a stage run: its version plus the content or value of every input"""
+        parts = {"stage": stage.name, "version": stage.version, "inputs": {}}
+        for name in stage.inputs:
+            value = ctx.get(name)
+            if _is_file(value):
+                parts["inputs"][name] = {"sha256": self.file_digest(value)}
+            else:
+                parts["inputs"][name] = {"value": value}
+        blob = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()
+
+    # ------------------------
+    # Lookup / store
+    # ------------------------
+    def _count(self, stage_name, column):
+        self._db.execute("INSERT OR IGNORE INTO stats (stage) VALUES (?)", (stage_name,))
+        self._db.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE stage=?", (stage_name,))
+        self._db.commit()
+
+    def lookup(self, stage, key):
+        """Return the cached outputs for key (restored in place) or None"""
+        with self._lock:
+            row = self._db.execute("SELECT outputs FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self._count(stage.name, "misses")
+                return None
+            outputs = json.loads(row[0])
+            try:
+                restored = {name: self._restore(item) for name, item in outputs.items()}
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Dropping damaged cache entry for {stage.name}: {e}")
+                self._drop(key)
+                self._count(stage.name, "misses")
+                return None
+            self._db.execute("UPDATE entries SET last_access=? WHERE key=?", (time.time(), key))
+            self._count(stage.name, "hits")
+            return restored
+
+    def _restore(self, item):
+        if "value" in item:
+            return item["value"]
+        cached = item["object"]
+        st = os.stat(cached)
+        if st.st_size != item["size"] or (st.st_mtime_ns != item["mtime_ns"]
+                                           and self.file_digest(cached) != item["sha256"]):
+            raise ValueError(f"{cached} changed since it was cached")
+        target = item["path"]
+        if os.path.exists(target):
+            if os.path.samefile(target, cached):
+                return target
+            if os.path.getsize(target) == item["size"] and self.file_digest(target) == item["sha256"]:
+                return target
+            os.remove(target)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        _link_or_copy(cached, target)
+        return target
+
+    def store(self, stage, key, outputs):
+        """Record outputs of a finished stage under key"""
+        entry_dir = os.path.join(self.objects_dir, key[:2], key)
+        os.makedirs(entry_dir, exist_ok=True)
+        record = {}
+        size = 0
+        for name, value in outputs.items():
+            if _is_file(value):
+                cached = os.path.join(entry_dir, f"{name}__{os.path.basename(value)}")
+                if os.path.exists(cached):
+                    os.remove(cached)
+                _link_or_copy(value, cached)
+                st = os.stat(cached)
+                digest = self.file_digest(cached)
+                record[name] = {
+                    "path": os.path.abspath(value),
+                    "object": cached,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "sha256": digest,
+                }
+                size += st.st_size
+            else:
+                record[name] = {"value": value}
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, stage, size, created, last_access, outputs) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage.name, size, now, now, json.dumps(record)))
+            self._db.commit()
+            self.evict(keep=key)
+
+    def detach(self, stage):
+        """
+        Unlink working copies of this stage's cached artifacts before it recomputes.
+        The Utils helpers are keyed on file paths and write their outputs in place:
+        removing the link makes them recompute instead of handing back a result for
+        other parameters, and keeps them from truncating the cached object.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT outputs FROM entries WHERE stage=?", (stage.name,)).fetchall()
+        for (outputs,) in rows:
+            for item in json.loads(outputs).values():
+                path = item.get("path")
+                try:
+                    if path and os.path.exists(path) and os.path.samefile(path, item["object"]):
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    # ------------------------
+    # Eviction / stats
+    # ------------------------
+    def total_size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, keep=None):
+        """Drop least-recently-used entries until the cache fits its quota"""
+        with self._lock:
+            total = self.total_size()
+            if total <= self.quota_bytes:
+                return 0
+            evicted = 0
+            for key, size in self._db.execute(
+                    "SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+                if total <= self.quota_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._drop(key)
+                total -= size
+                evicted += 1
+            return evicted
+
+    def _drop(self, key):
+        shutil.rmtree(os.path.join(self.objects_dir, key[:2], key), ignore_errors=True)
+        self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT stage, hits, misses FROM stats ORDER BY stage").fetchall()
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "stages": {stage: {"hits": hits, "misses": misses} for stage, hits, misses in rows},
+            "hits": sum(r[1] for r in rows),
+            "misses": sum(r[2] for r in rows),
+            "entries": entries,
+            "size_bytes": self.total_size(),
+            "quota_bytes": self.quota_bytes,
+        }
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stage-weighted progress and remaining-time estimates for remote_api_server.py.
+Completed jobs in the job store record how long each pipeline stage took
+(telemetry.py). A stage's cost is modelled as seconds per unit of work,
+where work is input frames times megapixels, so longer and larger inputs
+scale every stage. Upscaling multiplies the pixels that later stages handle,
+so rates from jobs with the same upscale setting are preferred. Which stages
+run at all depends on the flags; the pipeline announces its planned stages
+in job_start and only those carry weight.
+
+Progress is the estimated share of the job's work that is done, with the
+running stage counted by its elapsed time (never past RUNNING_CAP of its
+estimate). A stage without history weighs as much as a typical stage of
+the job; with no history at all every stage weighs the same and there is
+no ETA.
+
+    estimator = StageEstimator(job_store)
+    estimator.estimate(job)  # {"progress": 0.42, "eta_seconds": 610.0, ...}
+
+Request handlers pass wait=False: the history is then reloaded in the
+background and the request is answered from the timings already cached.
+"""
+
+import statistics
+import threading
+import time
+
+HISTORY_JOBS = 200
+REFRESH_SECONDS = 60
+RUNNING_CAP = 0.95
+FLAGS = ("unet_flag", "face_restore_flag", "upscale_flag", "clahe_flag")
+ANY = "*"
+
+
+def _flag(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def job_work(job):
+    """Input frames x megapixels, None if the input was not probed"""
+    info = job.get("input_info") or {}
+    if info.get("frames") and info.get("width") and info.get("height"):
+        return info["frames"] * info["width"] * info["height"] / 1e6
+    return None
+
+
+def upscale_key(job):
+    return str(float(job.get("upscale_value") or 2.0)) if _flag(job.get("upscale_flag")) else "1.0"
+
+
+def flags_key(job):
+    return ",".join(name for name in FLAGS if _flag(job.get(name))) + "@" + upscale_key(job)
+
+
+class StageEstimator:
+    """Per-stage rates learned from the last HISTORY_JOBS completed jobs, reloaded every REFRESH_SECONDS"""
+
+    def __init__(self, job_store):
+        self.job_store = job_store
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._rates = {}    # (stage, upscale_key or ANY) -> seconds per unit of work
+        self._seconds = {}  # stage -> wall seconds (jobs without probed input)
+        self._totals = {}   # flags_key or ANY -> whole-job wall seconds
+        self._order = []    # stage names in run order, for jobs that announce no plan
+        self._refreshing = False
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def refresh(self, wait=True):
+        """
+        Reload the history if it is older than REFRESH_SECONDS. With wait=False
+        the reload runs on a background thread and callers keep getting the
+        cached timings, so a request never reads the job history itself.
+        """
+        with self._lock:
+            if self._refreshing or time.time() - self._loaded_at < REFRESH_SECONDS:
+                return
+            # Stamped before reading, so an invalidate() during the read still forces the next one
+            self._loaded_at = time.time()
+            self._refreshing = True
+        if wait:
+            self._load()
+        else:
+            threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        try:
+            self._read_history()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _read_history(self):
+        rates, seconds, totals, order = {}, {}, {}, []
+        for job in self.job_store.list(status="completed", limit=HISTORY_JOBS):
+            work = job_work(job)
+            wall_total = 0.0
+            for record in job.get("stages", []):
+                name, wall = record["stage"], record.get("wall_seconds")
+                if name not in order and record.get("status") in ("completed", "running"):
+                    order.append(name)
+                if record.get("status") != "completed" or not wall:
+                    continue
+                wall_total += wall
+                if record.get("source") not in ("computed", "cache_miss"):
+                    continue  # cache hits and resumed stages say nothing about the cost
+                seconds.setdefault(name, []).append(wall)
+                if work:
+                    for key in (upscale_key(job), ANY):
+                        rates.setdefault((name, key), []).append(wall / work)
+            total = job.get("pipeline_wall_seconds") or wall_total
+            if total:
+                for key in (flags_key(job), ANY):
+                    totals.setdefault(key, []).append(total)
+        with self._lock:
+            self._rates = {key: statistics.median(v) for key, v in rates.items()}
+            self._seconds = {key: statistics.median(v) for key, v in seconds.items()}
+            self._totals = {key: statistics.median(v) for key, v in totals.items()}
+            self._order = order
+
+    def stage_seconds(self, job, stage):
+        """Expected wall seconds of one stage of job, None without history"""
+        work = job_work(job)
+        with self._lock:
+            if work:
+                for key in (upscale_key(job), ANY):
+                    if (stage, key) in self._rates:
+                        return self._rates[(stage, key)] * work
+            return self._seconds.get(stage)
+
+    def planned_stages(self, job):
+        """Stages the job will run: its announced plan (or the usual order), minus skipped ones"""
+        records = job.get("stages", [])
+        skipped = {r["stage"] for r in records if r.get("status") == "skipped"}
+        with self._lock:
+            planned = list(job.get("planned_stages") or self._order)
+        planned += [r["stage"] for r in records if r["stage"] not in planned]
+        return [name for name in planned if name not in skipped]
+
+    def estimate(self, job, now=None, wait=True):
+        """
+        {"progress" (0..1), "eta_seconds", "estimated_total_seconds", "stages"} for a
+        started job; the times are None without history, the whole result is None
+        when nothing is known about the job's stages. wait=False never blocks on
+        reloading the history (see refresh()).
+        """
+        self.refresh(wait)
+        now = time.time() if now is None else now
+        stages = self.planned_stages(job)
+        if not stages or not (job.get("planned_stages") or self._order):
+            return None
+        records = {r["stage"]: r for r in job.get("stages", [])}
+        expected = {name: self.stage_seconds(job, name) for name in stages}
+        # Stages never seen before weigh as much as a typical known stage
+        known = any(value for value in expected.values())
+        default = statistics.median([v for v in expected.values() if v] or [1.0])
+        done = remaining = total = 0.0
+        summary = []
+        for name in stages:
+            weight = expected[name] or default
+            record = records.get(name, {})
+            status = record.get("status", "pending")
+            total += weight
+            if status in ("completed", "failed"):
+                done += weight
+            elif status == "running":
+                elapsed = max(now - record.get("started_at", now), 0.0)
+                fraction = min(elapsed / weight, RUNNING_CAP) if known else 0.5
+                done += weight * fraction
+                remaining += max(weight - elapsed, weight * (1 - RUNNING_CAP))
+            else:
+                remaining += weight
+            summary.append({"stage": name, "status": status,
+                            "estimated_seconds": round(expected[name], 1) if expected[name] else None})
+        return {
+            "progress": done / total if total else 0.0,
+            "eta_seconds": round(remaining, 1) if known else None,
+            "estimated_total_seconds": round(total, 1) if known else None,
+            "stages": summary,
+        }
+
+    def estimate_queued(self, job, wait=False):
+        """
+        Typical wall seconds of a job with the same flags (before its input is
+        probed), from the cached history unless wait=True
+        """
+        self.refresh(wait)
+        with self._lock:
+            total = self._totals.get(flags_key(job), self._totals.get(ANY))
+        return round(total, 1) if total else None
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Declarative stage graph for pipeline.py.
+Each Stage declares the context keys it reads (inputs) and writes (outputs),
+the flags that must be on for it to run, and the resource class it occupies.
+StageGraph.run() resolves dependencies from those declarations, skips disabled
+stages without calling (or importing) anything, and runs independent stages
+concurrently within per-resource limits.
+
+A stage function only sees its declared inputs, so the declaration is also
+what the stage result cache (stage_cache.py) keys on.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+GPU = "gpu"
+CPU = "cpu"
+IO = "io"
+
+DEFAULT_LIMITS = {
+    GPU: 1,
+    CPU: max(1, (os.cpu_count() or 2) // 2),
+    IO: 4,
+}
+
+
+class Stage:
+    """One unit of pipeline work"""
+
+    def __init__(self, name, func, inputs=(), outputs=(), flags=(), resource=GPU, after=(),
+                 version="1", cacheable=True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.flags = tuple(flags)
+        self.resource = resource
+        self.after = tuple(after)
+        # Bump version when the stage's code changes so old cache entries stop matching
+        self.version = version
+        self.cacheable = cacheable
+
+    def enabled(self, ctx):
+        return all(ctx.get(flag) for flag in self.flags)
+
+    def disabled_by(self, ctx):
+        return [flag for flag in self.flags if not ctx.get(flag)]
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, resource={self.resource!r})"
+
+
+class StageGraphError(Exception):
+    pass
+
+
+class StageGraph:
+    """A set of stages wired together by the context keys they exchange"""
+
+    def __init__(self, stages=()):
+        self.stages = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise StageGraphError(f"Duplicate stage: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def producers(self):
+        produced = {}
+        for stage in self.stages.values():
+            for key in stage.outputs:
+                if key in produced:
+                    raise StageGraphError(
+                        f"Output {key!r} produced by both {produced[key]} and {stage.name}")
+                produced[key] = stage.name
+        return produced
+
+    def dependencies(self, initial_keys=()):
+        """Map stage name -> names of the stages it has to wait for"""
+        produced = self.producers()
+        deps = {}
+        for stage in self.stages.values():
+            needs = set(stage.after)
+            for key in stage.inputs:
+                if key in produced:
+                    needs.add(produced[key])
+                elif key not in initial_keys:
+                    raise StageGraphError(f"Stage {stage.name} needs {key!r} which nothing provides")
+            unknown = needs - set(self.stages)
+            if unknown:
+                raise StageGraphError(f"Stage {stage.name} waits on unknown stages {sorted(unknown)}")
+            deps[stage.name] = needs
+        self._check_acyclic(deps)
+        return deps
+
+    @staticmethod
+    def _check_acyclic(deps):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "active":
+                raise StageGraphError("Cycle: " + " -> ".join(path + [name]))
+            state[name] = "active"
+            for dep in deps[name]:
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in deps:
+            visit(name, [])
+
+    def run(self, ctx, limits=None, before_stage=None, cache=None, after_stage=None,
+            manifest=None, resume=False, observer=None, resource_locks=None):
+        """
+        Run every stage against ctx (a dict) and return it with all outputs filled.
+        Outputs of skipped stages are set to None so downstream fallbacks
+        (`faces_upscaled_video_path or input_path`) keep working.
+        before_stage(stage) is called right before an enabled stage computes and
+        after_stage(stage, outputs) right after; stages answered from cache
+        (a StageCache) skip both. Every finished stage is recorded in manifest
+        (a StageManifest); with resume=True stages whose record is still valid
+        are not run again. observer (a telemetry.StageTelemetry) is told about
+        every stage start, end, skip and error. resource_locks maps a resource to
+        a semaphore shared with graphs running alongside this one (scene shards):
+        a stage holds it while it runs, so all of them together stay within one
+        limit.
+        """
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        deps = self.dependencies(initial_keys=set(ctx))
+        done = set()
+        pending = dict(self.stages)
+        in_use = {resource: 0 for resource in limits}
+        running = {}
+        error = None
+        lock = threading.Lock()
+
+        def call(stage, snapshot):
+            shared = (resource_locks or {}).get(stage.resource)
+            if shared is None:
+                return observed(stage, snapshot)
+            with shared:
+                return observed(stage, snapshot)
+
+        def observed(stage, snapshot):
+            started = time.time()
+            if observer is not None:
+                observer.stage_start(stage)
+            try:
+                outputs, source = execute(stage, snapshot)
+            except Exception as e:
+                if observer is not None:
+                    observer.stage_error(stage, e)
+                raise
+            if observer is not None:
+                observer.stage_end(stage, outputs, source)
+            return outputs, time.time() - started
+
+        def execute(stage, snapshot):
+            if manifest is not None and resume:
+                recorded = manifest.completed(stage, snapshot)
+                if recorded is not None:
+                    print(f"⏩ {stage.name} already completed, resuming past it")
+                    return recorded, "resumed"
+            try:
+                outputs, source = compute(stage, snapshot)
+            except Exception as e:
+                if manifest is not None:
+                    manifest.mark_failed(stage, e)
+                raise
+            if manifest is not None:
+                manifest.record(stage, snapshot, outputs)
+            return outputs, source
+
+        def compute(stage, snapshot):
+            key = None
+            source = "computed"
+            if cache is not None and stage.cacheable:
+                key = cache.key_for(stage, snapshot)
+                cached = cache.lookup(stage, key)
+                if cached is not None:
+                    print(f"💾 Cache hit for {stage.name} ({key[:12]})")
+                    return cached, "cache_hit"
+                source = "cache_miss"
+                cache.detach(stage)
+            if before_stage is not None:
+                before_stage(stage)
+            outputs = self._normalize(stage, stage.func(snapshot))
+            if after_stage is not None:
+                after_stage(stage, outputs)
+            if key is not None:
+                cache.store(stage, key, outputs)
+            return outputs, source
+
+        with ThreadPoolExecutor(max_workers=max(1, sum(limits.values()))) as pool:
+            while pending or running:
+                if error is None:
+                    progressed = True
+                    while progressed:
+                        progressed = False
+                        for name, stage in list(pending.items()):
+                            if not deps[name] <= done:
+                                continue
+                            if not stage.enabled(ctx):
+                                print(f"⏭️ Skipping {name} ({', '.join(stage.disabled_by(ctx))} off)")
+                                if observer is not None:
+                                    observer.stage_skip(stage, stage.disabled_by(ctx))
+                                for key in stage.outputs:
+                                    ctx.setdefault(key, None)
+                                done.add(name)
+                                del pending[name]
+                                progressed = True
+                                continue
+                            if in_use.get(stage.resource, 0) >= limits.get(stage.resource, 1):
+                                continue
+                            in_use[stage.resource] = in_use.get(stage.resource, 0) + 1
+                            with lock:
+                                snapshot = {key: ctx.get(key) for key in stage.inputs}
+                            running[pool.submit(call, stage, snapshot)] = stage
+                            del pending[name]
+                if not running:
+                    if pending and error is None:
+                        raise StageGraphError(f"Stages can never run: {sorted(pending)}")
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    in_use[stage.resource] -= 1
+                    try:
+                        outputs, elapsed = future.result()
+                    except Exception as e:
+                        print(f"❌ Stage {stage.name} failed: {e}")
+                        if error is None:
+                            error = e
+                        continue
+                    with lock:
+                        ctx.update(outputs)
+                    done.add(stage.name)
+                    print(f"✔️ Stage {stage.name} finished in {elapsed:.1f}s")
+        if error is not None:
+            raise error
+        return ctx
+
+    @staticmethod
+    def _normalize(stage, result):
+        if result is None:
+            result = {}
+        elif not isinstance(result, dict):
+            if len(stage.outputs) != 1:
+                raise StageGraphError(
+                    f"Stage {stage.name} returned a bare value but declares {len(stage.outputs)} outputs")
+            result = {stage.outputs[0]: result}
+        missing = set(stage.outputs) - set(result)
+        if missing:
+            raise StageGraphError(f"Stage {stage.name} did not produce {sorted(missing)}")
+        return result
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-job manifest of completed stages.
+After each stage finishes, its inputs, outputs and a SHA-256 of every output
+artifact are written to a JSON manifest (atomically, so a crash never leaves a
+half-written file). A resumed run skips every stage whose record is still
+valid: same inputs, artifacts present and unchanged. It restarts from the
+first stage that is missing or stale.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _is_file(value):
+    return isinstance(value, str) and value != "" and os.path.isfile(value)
+
+
+class StageManifest:
+    """JSON manifest at path, shared by the stage threads of one run"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {"created_at": time.time(), "stages": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def set_config(self, config):
+        with self._lock:
+            self.data["config"] = config
+            self.data["updated_at"] = time.time()
+            self._save()
+
+    def record(self, stage, inputs, outputs):
+        """Mark stage complete with its outputs and artifact checksums"""
+        artifacts = {}
+        for name, value in outputs.items():
+            if _is_file(value):
+                st = os.stat(value)
+                artifacts[name] = {
+                    "path": value,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "sha256": sha256_file(value),
+                }
+        with self._lock:
+            self.data["stages"][stage.name] = {
+                "status": "completed",
+                "version": stage.version,
+                "inputs": inputs,
+                "outputs": outputs,
+                "artifacts": artifacts,
+                "finished_at": time.time(),
+            }
+            self.data["updated_at"] = time.time()
+            self._save()
+
+    def mark_failed(self, stage, error):
+        with self._lock:
+            self.data["stages"][stage.name] = {
+                "status": "failed",
+                "error": str(error),
+                "finished_at": time.time(),
+            }
+            self.data["updated_at"] = time.time()
+            self._save()
+
+    def completed(self, stage, inputs):
+        """Recorded outputs if the stage can be skipped on resume, else None"""
+        with self._lock:
+            entry = self.data["stages"].get(stage.name)
+        if not entry or entry.get("status") != "completed":
+            return None
+        if entry.get("version") != stage.version:
+            return None
+        if json.loads(json.dumps(inputs, default=str)) != entry.get("inputs"):
+            return None
+        for name, artifact in entry.get("artifacts", {}).items():
+            path = artifact["path"]
+            if not os.path.isfile(path):
+                return None
+            st = os.stat(path)
+            if st.st_size != artifact["size"]:
+                return None
+            if st.st_mtime_ns != artifact["mtime_ns"] and sha256_file(path) != artifact["sha256"]:
+                return None
+        return entry["outputs"]
+
+    def summary(self):
+        with self._lock:
+            stages = self.data["stages"]
+            return {name: entry.get("status") for name, entry in stages.items()}
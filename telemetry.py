@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Machine-readable pipeline events.
+pipeline.py prints one line per event: EVENT_PREFIX followed by a JSON
+object. remote_api_server.py picks those lines out of the job output with
+parse_event() instead of scraping free-form prints.
+
+Events:
+    job_start   input video facts (duration, resolution, fps, frames), flags and
+                the stages that will run, in order
+    stage_start stage name and resource class
+    stage_end   wall time, frames processed, frames/sec, peak RSS,
+                peak GPU memory and source (computed / cache_hit / cache_miss / resumed)
+    stage_skip  stage disabled by a flag
+    stage_error stage raised
+    job_end     total wall time, status and the final output paths
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+from stage_graph import GPU
+
+EVENT_PREFIX = "@@pipeline-event "
+RSS_SAMPLE_INTERVAL = 0.5
+
+
+def emit(event, **fields):
+    fields["event"] = event
+    fields.setdefault("ts", time.time())
+    sys.stdout.write(EVENT_PREFIX + json.dumps(fields, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def parse_event(line):
+    """Event dict for an event line, None for ordinary output"""
+    line = line.strip()
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux), 0 elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _cuda():
+    # Only look at the GPU if the pipeline already imported torch
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch
+    return None
+
+
+def video_frames(path):
+    """Frame count and duration of a video output, None if it cannot be probed"""
+    if not (isinstance(path, str) and path.lower().endswith((".mp4", ".mkv", ".mov", ".avi", ".webm"))
+            and os.path.isfile(path)):
+        return None
+    try:
+        from frame_stream import probe_video
+        return probe_video(path)
+    except Exception:
+        return None
+
+
+class StageTelemetry:
+    """StageGraph observer that turns stage lifecycle into events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = {}
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = current_rss()
+            with self._lock:
+                for record in self._running.values():
+                    record["peak_rss"] = max(record["peak_rss"], rss)
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def stage_start(self, stage):
+        self._ensure_sampler()
+        torch = _cuda()
+        if torch is not None and stage.resource == GPU:
+            torch.cuda.reset_peak_memory_stats()
+        with self._lock:
+            self._running[stage.name] = {"started": time.time(), "peak_rss": current_rss()}
+        emit("stage_start", stage=stage.name, resource=stage.resource)
+
+    def stage_end(self, stage, outputs, source="computed"):
+        with self._lock:
+            record = self._running.pop(stage.name, None) or {"started": time.time(), "peak_rss": 0}
+        wall = time.time() - record["started"]
+        fields = {
+            "stage": stage.name,
+            "resource": stage.resource,
+            "source": source,
+            "cache": {"cache_miss": "miss", "cache_hit": "hit"}.get(source),
+            "wall_seconds": round(wall, 3),
+            "peak_rss_bytes": max(record["peak_rss"], current_rss()),
+        }
+        torch = _cuda()
+        if torch is not None and stage.resource == GPU:
+            fields["peak_gpu_bytes"] = torch.cuda.max_memory_allocated()
+        # Frames of the stage's main video output
+        for key in stage.outputs:
+            info = video_frames(outputs.get(key))
+            if info and info.get("frames"):
+                fields["frames"] = info["frames"]
+                fields["fps"] = round(info["frames"] / wall, 3) if wall > 0 and source in ("computed", "cache_miss") else None
+                break
+        emit("stage_end", **fields)
+
+    def stage_skip(self, stage, flags):
+        emit("stage_skip", stage=stage.name, flags=flags)
+
+    def stage_error(self, stage, error):
+        with self._lock:
+            record = self._running.pop(stage.name, None)
+        wall = time.time() - record["started"] if record else None
+        emit("stage_error", stage=stage.name, error=str(error), wall_seconds=wall)
+
+    def close(self):
+        self._stop.set()
+
+
+# ------------------------
+# Server side: fold events into a per-job stage timeline
+# ------------------------
+def apply_event(job, event):
+    """Update job['stages'] (list in start order) and job-level facts from one event"""
+    kind = event.get("event")
+    ts = event.get("ts", time.time())
+    if kind == "job_start":
+        job["input_info"] = event.get("input")
+        job["pipeline_started_at"] = ts
+        if event.get("stages"):
+            job["planned_stages"] = event["stages"]
+        return
+    if kind == "job_end":
+        job["pipeline_wall_seconds"] = event.get("wall_seconds")
+        if event.get("outputs"):
+            job["outputs"] = event["outputs"]
+        job["current_stage"] = None
+        return
+    name = event.get("stage")
+    if not name:
+        return
+    stages = job.setdefault("stages", [])
+    record = next((s for s in stages if s["stage"] == name), None)
+    if record is None:
+        record = {"stage": name}
+        stages.append(record)
+    details = {k: v for k, v in event.items() if k not in ("event", "ts", "stage")}
+    if kind == "stage_start":
+        # A resumed job starts the stage again: drop the previous attempt's numbers
+        record.clear()
+        record.update(stage=name, status="running", started_at=ts, **details)
+        job["current_stage"] = name
+    elif kind == "stage_end":
+        record.update(status="completed", ended_at=ts, **details)
+    elif kind == "stage_skip":
+        record.update(status="skipped", **details)
+    elif kind == "stage_error":
+        record.update(status="failed", ended_at=ts, **details)
+    if kind in ("stage_end", "stage_error"):
+        running = [s["stage"] for s in stages if s.get("status") == "running"]
+        job["current_stage"] = running[-1] if running else None
+
+
+def stage_summary(job):
+    """Totals per stage, including wall seconds per minute of input video"""
+    input_minutes = None
+    info = job.get("input_info") or {}
+    if info.get("duration"):
+        input_minutes = info["duration"] / 60.0
+    summary = []
+    for record in job.get("stages", []):
+        wall = record.get("wall_seconds")
+        summary.append({
+            "stage": record["stage"],
+            "status": record.get("status"),
+            "wall_seconds": wall,
+            "seconds_per_input_minute": round(wall / input_minutes, 3) if wall and input_minutes else None,
+            "cache": record.get("cache"),
+        })
+    return {
+        "input_minutes": round(input_minutes, 3) if input_minutes else None,
+        "total_wall_seconds": round(sum(r.get("wall_seconds") or 0 for r in job.get("stages", [])), 3),
+        "stages": summary,
+    }
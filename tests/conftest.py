@@ -0,0 +1,36 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# The server modules are flat files at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def free_port():
+    """A TCP port nothing listens on right now"""
+    def pick():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+    return pick
+
+
+@pytest.fixture(scope="session")
+def server_module(tmp_path_factory):
+    """remote_api_server imported once, API-only (no executor), on a temporary workspace"""
+    workspace = tmp_path_factory.mktemp("workspace")
+    os.environ["PIPELINE_WORKSPACE"] = str(workspace)
+    import remote_api_server
+    return remote_api_server
+
+
+@pytest.fixture
+def api(server_module):
+    """The server module with an empty job store"""
+    with server_module.job_store._write() as db:
+        db.execute("DELETE FROM job_output")
+        db.execute("DELETE FROM jobs")
+    return server_module
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+import pytest
+
+MB = 1024 * 1024
+DATA = os.urandom(3 * MB + 123)
+
+
+@pytest.fixture
+def client(api):
+    os.makedirs(os.path.join(api.WORKSPACE_DIR, "output"), exist_ok=True)
+    path = os.path.join(api.WORKSPACE_DIR, "output", "result.mp4")
+    with open(path, "wb") as f:
+        f.write(DATA)
+    os.utime(path, (1700000000, 1700000000))
+    return api.app.test_client()
+
+
+def download(client, **headers):
+    return client.get("/download?path=output/result.mp4", headers=headers)
+
+
+def test_ranges_return_partial_content(client):
+    part = download(client, Range="bytes=100-199")
+    assert part.status_code == 206
+    assert part.data == DATA[100:200]
+    assert part.headers["Content-Range"] == f"bytes 100-199/{len(DATA)}"
+
+    suffix = download(client, Range="bytes=-500")
+    assert suffix.status_code == 206
+    assert suffix.data == DATA[-500:]
+    assert suffix.headers["Content-Range"] == f"bytes {len(DATA) - 500}-{len(DATA) - 1}/{len(DATA)}"
+
+
+def test_if_range_resumes_only_the_same_file(client):
+    whole = download(client)
+    assert whole.status_code == 200 and whole.data == DATA
+    etag = whole.headers["ETag"]
+
+    assert download(client, Range="bytes=1000-", **{"If-Range": etag}).data == DATA[1000:]
+    last_modified = whole.headers["Last-Modified"]
+    assert download(client, Range="bytes=1000-", **{"If-Range": last_modified}).status_code == 206
+
+    # The file changed since: the whole new file, not a piece of it
+    stale = download(client, Range="bytes=1000-", **{"If-Range": '"stale-etag"'})
+    assert stale.status_code == 200 and stale.data == DATA
+
+
+def test_manifest_chunks_hash_the_file(client, api):
+    manifest = client.get(f"/download/manifest?path=output/result.mp4&chunk_size={MB}").get_json()
+    assert manifest["size"] == len(DATA)
+    assert manifest["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert [chunk["length"] for chunk in manifest["chunks"]] == [MB, MB, MB, 123]
+    for chunk in manifest["chunks"]:
+        piece = DATA[chunk["offset"]:chunk["offset"] + chunk["length"]]
+        assert chunk["sha256"] == hashlib.sha256(piece).hexdigest()
+
+    # A rewritten file gets a new manifest, not the cached one
+    path = os.path.join(api.WORKSPACE_DIR, "output", "result.mp4")
+    with open(path, "wb") as f:
+        f.write(DATA[:MB])
+    manifest = client.get(f"/download/manifest?path=output/result.mp4&chunk_size={MB}").get_json()
+    assert manifest["size"] == MB and len(manifest["chunks"]) == 1
+
+    assert client.get("/download/manifest?path=output/result.mp4&chunk_size=10").status_code == 400
+    assert client.get("/download?path=../../etc/passwd").status_code == 400
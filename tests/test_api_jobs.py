@@ -0,0 +1,55 @@
+def add_jobs(api, count):
+    for i in range(count):
+        api.job_store.create({"id": f"job_{i:03d}", "status": "completed", "created_at": 1000.0 + i,
+                              "output": f"log {i}"})
+
+
+def test_unpaged_listing_returns_every_job(api):
+    add_jobs(api, 60)
+    body = api.app.test_client().get("/jobs").get_json()
+    assert body["count"] == body["total"] == 60
+    assert [job["id"] for job in body["jobs"]][:2] == ["job_059", "job_058"]
+    assert body["next_cursor"] is None
+    assert "output" not in body["jobs"][0]
+
+
+def test_pages_follow_the_cursor_and_count_only_on_request(api, monkeypatch):
+    add_jobs(api, 60)
+    counted = []
+    count = api.job_store.count
+    monkeypatch.setattr(api.job_store, "count", lambda status=None: counted.append(status) or count(status))
+    client = api.app.test_client()
+
+    first = client.get("/jobs?limit=25&total=1").get_json()
+    assert first["total"] == 60 and first["count"] == 25
+    seen = [job["id"] for job in first["jobs"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = client.get(f"/jobs?limit=25&cursor={cursor}").get_json()
+        assert page["total"] is None
+        seen += [job["id"] for job in page["jobs"]]
+        cursor = page["next_cursor"]
+    assert seen == [f"job_{i:03d}" for i in reversed(range(60))]
+    assert counted == [None]
+
+
+def test_health_serves_the_executor_backlog_without_reading_jobs(api, monkeypatch):
+    snapshot = {"queued": [{"job_id": f"job_{i:03d}"} for i in range(50)], "running": [],
+                "slots": 1, "free_slots": 0, "vram_reserved_gb": 0, "vram_budget_gb": 24,
+                "backlog_seconds": 4200.0, "updated_at": 0}
+    monkeypatch.setattr(api, "read_executor_status", lambda: snapshot)
+
+    def no_reads(*args, **kwargs):
+        raise AssertionError("job store read on /health")
+    monkeypatch.setattr(api.job_store, "get", no_reads)
+
+    load = api.app.test_client().get("/health").get_json()["load"]
+    assert load["queued"] == 50 and load["backlog_seconds"] == 4200.0
+
+
+def test_jobs_created_in_the_same_millisecond_get_their_own_ids(api, monkeypatch):
+    monkeypatch.setattr(api.time, "time", lambda: 1700000000.0)
+    client = api.app.test_client()
+    body = {"inputMethod": "manual", "manualPath": "clip.mp4", "dedupe": False}
+    ids = {client.post("/jobs", json=body).get_json()["id"] for _ in range(3)}
+    assert len(ids) == 3 and all(job_id.startswith("job_1700000000000_") for job_id in ids)
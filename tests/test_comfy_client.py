@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from comfy_client import AsyncComfyClient, ComfyError
+from comfyui_stub import StubComfy
+
+WORKFLOW = {"1": {"class_type": "LoadImage", "inputs": {"image": ""}}}
+
+
+async def start_stub(tmp_path, render_seconds):
+    stub = StubComfy(str(tmp_path), render_seconds=render_seconds)
+    runner = web.AppRunner(stub.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return stub, runner, f"http://{host}:{port}"
+
+
+def run_units(tmp_path, units, max_in_flight, fail=None):
+    """Push units (name -> image bytes) through a stub; returns (results, queued-ahead count, error)"""
+    results = {}
+    queued_ahead = []
+
+    async def main():
+        stub, runner, base_url = await start_stub(tmp_path, render_seconds=0.2)
+        if fail is not None:
+            render = stub.render
+
+            def failing_render(source, target):
+                if source.endswith(fail):
+                    raise RuntimeError(f"render of {fail} failed")
+                render(source, target)
+            stub.render = failing_render
+
+        async def prepare(client, unit):
+            # Prompts queued while nothing has come back yet are in flight together
+            queued_ahead.append(len(results) == 0)
+            name = await client.upload_image(units[unit], unit)
+            return dict(WORKFLOW, **{"1": {"class_type": "LoadImage", "inputs": {"image": name}}})
+
+        def on_result(unit, images):
+            results[unit] = images
+
+        try:
+            async with AsyncComfyClient(base_url, timeout=30) as client:
+                await client.run_pipelined(list(units), prepare, on_result, max_in_flight=max_in_flight)
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+    return results, sum(queued_ahead)
+
+
+def test_run_pipelined_routes_results_to_their_units(tmp_path):
+    units = {f"tile{i}.png": f"image {i}".encode() for i in range(8)}
+    results, queued_ahead = run_units(tmp_path, units, max_in_flight=3)
+    assert queued_ahead >= 3
+    # The stub renders a prompt's LoadImage input unchanged
+    assert results == {unit: [data] for unit, data in units.items()}
+
+
+def test_execution_error_is_raised(tmp_path):
+    units = {f"tile{i}.png": f"image {i}".encode() for i in range(5)}
+    with pytest.raises(ComfyError, match="render of tile2.png failed"):
+        run_units(tmp_path, units, max_in_flight=2, fail="tile2.png")
@@ -0,0 +1,71 @@
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import comfyui_supervisor
+from comfyui_supervisor import ComfyUISupervisor, probe
+
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(comfyui_supervisor, "COMFYUI_RUN_DIR", str(tmp_path))
+    return tmp_path
+
+
+def stub_supervisor(port, tmp_path):
+    command = [sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1"]
+    return ComfyUISupervisor(command=command, port=port, log_path=str(tmp_path / "comfyui.log"),
+                             startup_timeout=30, probe_interval=0.1)
+
+
+def port_free(port):
+    """True if a new server could listen on port (servers set SO_REUSEADDR, so TIME_WAIT is fine)"""
+    with socket.socket() as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def test_adopts_running_server_and_stop_frees_port(tmp_path, free_port):
+    port = free_port()
+    first = stub_supervisor(port, tmp_path)
+    first.ensure_running()
+    assert first.starts == 1
+    try:
+        # A later job on the node gets a fresh supervisor that must not start a second server
+        second = stub_supervisor(port, tmp_path)
+        second.ensure_running()
+        assert second.starts == 0
+        assert second.pid == first.pid
+        second.stop(grace=5)
+    finally:
+        first.stop(grace=5)
+    assert not probe("127.0.0.1", port)
+    assert port_free(port)
+    assert not comfyui_supervisor.os.path.exists(comfyui_supervisor.pidfile_path(port))
+
+
+def test_recorded_pid_ignores_reused_pid(tmp_path, free_port):
+    port = free_port()
+    # The pidfile outlived the server and its PID now belongs to something else
+    other = subprocess.Popen(["sleep", "30"])
+    try:
+        with open(comfyui_supervisor.pidfile_path(port), "w") as f:
+            f.write(str(other.pid))
+        supervisor = stub_supervisor(port, tmp_path)
+        assert supervisor._recorded_pid() is None
+
+        supervisor.ensure_running()
+        assert supervisor.starts == 1
+        assert supervisor.pid != other.pid
+        supervisor.stop(grace=5)
+        assert other.poll() is None
+        assert port_free(port)
+    finally:
+        other.kill()
+        other.wait()
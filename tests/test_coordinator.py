@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+import coordinator
+from coordinator import Attempt, Coordinator, Node, Segment
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+needs_ffmpeg = pytest.mark.skipif(not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+                                  reason="needs ffmpeg and ffprobe")
+
+
+class RecordingNode(Node):
+    def __init__(self):
+        super().__init__("http://node")
+        self.workspace = "/workspace"
+        self.fetched = []
+
+    def download(self, relative, local, workers=None):
+        self.fetched.append(relative)
+        open(local, "wb").close()
+
+
+@pytest.mark.parametrize("reported, expected", [
+    ("/workspace/jobs/job_1/work/outputs/scene_final.mp4", "jobs/job_1/work/outputs/scene_final.mp4"),
+    ("outputs/scene_final.mp4", "jobs/job_1/work/outputs/scene_final.mp4"),
+])
+def test_fetch_resolves_outputs_against_the_sub_job(tmp_path, monkeypatch, reported, expected):
+    monkeypatch.setattr(coordinator, "count_frames", lambda path: 10)
+    node = RecordingNode()
+    attempt = Attempt(Segment(0, 0, 10, 25.0, "seg.mp4"), node)
+    job = {"outputs": {"final_video_path": reported}, "work_dir": "/workspace/jobs/job_1/work"}
+    Coordinator([node.url]).fetch(attempt, job, str(tmp_path))
+    assert node.fetched == [expected]
+
+
+def test_fetch_refuses_outputs_outside_the_workspace(tmp_path):
+    node = RecordingNode()
+    attempt = Attempt(Segment(0, 0, 10, 25.0, "seg.mp4"), node)
+    job = {"outputs": {"final_video_path": "../../../../etc/passwd"}, "work_dir": "/workspace/jobs/job_1/work"}
+    with pytest.raises(RuntimeError, match="outside the node workspace"):
+        Coordinator([node.url]).fetch(attempt, job, str(tmp_path))
+    assert node.fetched == []
+
+
+def start_node(tmp_path, name, port, **env):
+    workspace = tmp_path / name
+    workspace.mkdir()
+    env = dict(os.environ, PIPELINE_WORKSPACE=str(workspace), STUB_PIPELINE_SECONDS="0.5", **env)
+    log = open(tmp_path / f"{name}.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, "remote_api_server.py"), "--port", str(port),
+         "--execution", "subprocess", "--pipeline-script", "pipeline_stub.py"],
+        cwd=str(tmp_path), env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/health", timeout=1).raise_for_status()
+            return process, url
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Node {name} did not start, see {tmp_path / f'{name}.log'}")
+
+
+def make_scenes(path):
+    """Three one-second scenes of flat colour at 10 fps"""
+    colors = ("red", "blue", "green")
+    inputs = []
+    for color in colors:
+        inputs += ["-f", "lavfi", "-i", f"color=c={color}:s=64x64:r=10:d=1"]
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *inputs, "-filter_complex",
+                    "".join(f"[{i}:v]" for i in range(len(colors))) + f"concat=n={len(colors)}:v=1:a=0",
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p", path], check=True)
+
+
+@needs_ffmpeg
+def test_segments_run_on_two_nodes_and_a_failed_segment_is_retried(tmp_path, free_port):
+    source = str(tmp_path / "film.mp4")
+    make_scenes(source)
+    # The first node's pipeline always fails, so whatever it gets has to be retried on the second
+    failing, failing_url = start_node(tmp_path, "n1", free_port(), STUB_PIPELINE_FAIL_RATE="1")
+    working, working_url = start_node(tmp_path, "n2", free_port())
+    updates = []
+    try:
+        runner = Coordinator([failing_url, working_url], poll_interval=0.2, min_segment_seconds=0.5)
+        output = runner.run(source, str(tmp_path / "film_out.mp4"), {}, "job_test", str(tmp_path / "work"),
+                            on_update=updates.append)
+    finally:
+        for process in (failing, working):
+            process.terminate()
+            process.wait(timeout=30)
+
+    assert coordinator.count_frames(output) == coordinator.count_frames(source) == 30
+    segments = updates[-1]["segments"]
+    assert len(segments) == 3 and all(s["status"] == "completed" for s in segments)
+    attempts = [a for s in segments for a in s["attempts"]]
+    assert any(a["node"] == failing_url and a["status"] == "failed" for a in attempts)
+    for segment in segments:
+        assert [a["node"] for a in segment["attempts"] if a["status"] == "completed"] == [working_url]
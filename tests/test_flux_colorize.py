@@ -0,0 +1,141 @@
+import random
+
+import numpy as np
+import pytest
+
+import flux_colorize
+from flux_colorize import FluxJob, FrameSource, iter_tiles
+
+FRAMES = 23
+
+
+class SyntheticVideo:
+    """Frame i is filled with the value i; counts how often frames are decoded"""
+
+    def __init__(self, frames=FRAMES):
+        self.frames = frames
+        self.decoded = 0
+
+    def probe(self, path):
+        return {"width": 6, "height": 4, "fps": "25/1", "fps_value": 25.0, "frames": self.frames}
+
+    def read(self, path, width, height):
+        for i in range(self.frames):
+            self.decoded += 1
+            yield np.full((height, width, 3), i, dtype=np.uint8)
+
+
+class RecordingWriter:
+    written = {}
+
+    def __init__(self, path, fps):
+        self.frames = RecordingWriter.written.setdefault(path, [])
+
+    def write(self, frame):
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def video(monkeypatch):
+    video = SyntheticVideo()
+    monkeypatch.setattr(flux_colorize, "probe_video", video.probe)
+    monkeypatch.setattr(flux_colorize, "read_frames", video.read)
+    monkeypatch.setattr(flux_colorize, "FrameWriter", RecordingWriter)
+    RecordingWriter.written = {}
+    return video
+
+
+def make_job(output, per_tile):
+    return FluxJob("scene.mp4", output, "prompt", 1, 20, 1.0, 3.5,
+                   images_per_row=per_tile, images_per_combined=per_tile)
+
+
+def test_jobs_share_one_decode_and_buffer_shrinks(video):
+    concat, prevscene = make_job("concat.mp4", 2), make_job("prevscene.mp4", 5)
+    source = FrameSource("scene.mp4", [concat, prevscene])
+    buffered, tiles = [], {concat: [], prevscene: []}
+    for tile in iter_tiles([concat, prevscene], {"scene.mp4": source}):
+        tiles[tile.job].append(tile.frame_indices)
+        assert [int(f[0, 0, 0]) for f in tile.frames] == tile.frame_indices
+        buffered.append(len(source._buffer))
+
+    assert video.decoded == FRAMES
+    for job in (concat, prevscene):
+        assert [i for indices in tiles[job] for i in indices] == list(range(FRAMES))
+        assert job.tiles_made == job.expected_tiles
+    # Only the gap between the two jobs is held, never the scene
+    assert max(buffered) <= 5
+    assert any(later < earlier for earlier, later in zip(buffered, buffered[1:]))
+    assert source._base + len(source._buffer) == FRAMES
+
+
+def test_out_of_order_results_are_written_in_frame_order(video):
+    job = make_job("out.mp4", 3)
+    source = FrameSource("scene.mp4", [job])
+    tiles = list(iter_tiles([job], {"scene.mp4": source}))
+    rendered = [(tile, list(tile.frames)) for tile in tiles]
+    random.Random(3).shuffle(rendered)
+
+    for count, (tile, frames) in enumerate(rendered, 1):
+        job.add_result(tile, frames)
+        written = RecordingWriter.written["out.mp4"]
+        # Whatever is written is a gap-free prefix of the video
+        assert written == list(range(len(written)))
+        assert job.tiles_done == count
+    assert job.write() == "out.mp4"
+    assert RecordingWriter.written["out.mp4"] == list(range(FRAMES))
+
+
+def test_write_fails_when_a_tile_never_came_back(video):
+    job = make_job("out.mp4", 4)
+    source = FrameSource("scene.mp4", [job])
+    tiles = list(iter_tiles([job], {"scene.mp4": source}))
+    for tile in tiles[:1] + tiles[2:]:
+        job.add_result(tile, list(tile.frames))
+    assert RecordingWriter.written["out.mp4"] == [0, 1, 2, 3]
+    with pytest.raises(RuntimeError, match="1 of 6 tiles written"):
+        job.write()
+
+
+def test_colorize_videos_through_stub_comfy(video, tmp_path):
+    import asyncio
+    import threading
+
+    from aiohttp import web
+    from comfyui_stub import StubComfy
+
+    started = threading.Event()
+    state = {}
+
+    def serve():
+        async def main():
+            runner = web.AppRunner(StubComfy(str(tmp_path), render_seconds=0.05).app())
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            state["url"] = "http://%s:%d" % runner.addresses[0][:2]
+            state["stop"] = asyncio.Event()
+            started.set()
+            await state["stop"].wait()
+            await runner.cleanup()
+        state["loop"] = asyncio.new_event_loop()
+        state["loop"].run_until_complete(main())
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    assert started.wait(10)
+    try:
+        jobs = [make_job("concat.mp4", 2), make_job("prevscene.mp4", 4)]
+        workflow = {"1": {"class_type": "LoadImage", "inputs": {"image": ""}}}
+        outputs = flux_colorize.colorize_videos(jobs, workflow=workflow, base_url=state["url"], max_in_flight=3)
+    finally:
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        thread.join(10)
+
+    assert outputs == ["concat.mp4", "prevscene.mp4"]
+    assert video.decoded == FRAMES
+    # The stub returns each tile unchanged, so every frame comes back with its own value
+    for path in outputs:
+        assert RecordingWriter.written[path] == list(range(FRAMES))
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def queued(job_id, fingerprint="fp", **fields):
+    return dict({"id": job_id, "status": "queued", "fingerprint": fingerprint}, **fields)
+
+
+def test_create_or_find_joins_a_live_job_with_the_same_fingerprint(store):
+    first, created = store.create_or_find(queued("a"), ("queued", "running"))
+    assert created and first["id"] == "a"
+    found, created = store.create_or_find(queued("b"), ("queued", "running"))
+    assert not created and found["id"] == "a"
+
+    # Refused by accept, or no longer in one of the statuses: a new job
+    _, created = store.create_or_find(queued("c"), ("queued",), accept=lambda job: False)
+    assert created
+    store.update("a", status="failed")
+    store.update("c", status="failed")
+    _, created = store.create_or_find(queued("d"), ("queued", "running"))
+    assert created
+
+
+def test_racing_create_or_find_creates_one_job(store):
+    threads = 8
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def create(i):
+        barrier.wait()
+        results.append(store.create_or_find(queued(f"job_{i}"), ("queued", "running")))
+
+    workers = [threading.Thread(target=create, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sum(created for _, created in results) == 1
+    assert len({job["id"] for job, _ in results}) == 1
+    assert store.count() == 1
+
+
+def test_mutate_rewrites_the_job_and_bumps_its_version(store):
+    store.create(queued("a", attempts=[]))
+    job = store.mutate("a", lambda job: job.update(status="running", attempts=job["attempts"] + ["node-1"]))
+    assert job["version"] == 2
+    stored = store.get("a")
+    assert stored["status"] == "running" and stored["attempts"] == ["node-1"] and stored["version"] == 2
+
+    # Returning False leaves the row untouched
+    store.mutate("a", lambda job: job.update(status="cancelled") or False)
+    assert store.get("a")["status"] == "running" and store.version("a") == 2
+    assert store.mutate("missing", lambda job: None) is None
+
+
+def test_keyset_pages_see_every_job_once(store):
+    # Equal created_at values are ordered by id
+    for i in range(7):
+        store.create({"id": f"job_{i}", "status": "completed", "created_at": 1000.0 + i // 3})
+
+    seen, cursor = [], None
+    while True:
+        jobs, cursor = store.page(limit=3, after=cursor)
+        seen += [job["id"] for job in jobs]
+        if cursor is None:
+            break
+        # A job created while paging does not shift the pages after it
+        store.create({"id": f"new_{len(seen)}", "status": "queued", "created_at": 5000.0 + len(seen)})
+    assert seen == ["job_6", "job_5", "job_4", "job_3", "job_2", "job_1", "job_0"]
+
+    jobs, cursor = store.page(status="completed", limit=None)
+    assert len(jobs) == 7 and cursor is None
+
+
+def test_wait_returns_when_the_job_changes(store):
+    store.create(queued("a"))
+    assert store.wait("a", since_version=0, timeout=5) == 1
+    assert store.wait("missing", since_version=0, timeout=5) is None
+
+    started = time.time()
+    assert store.wait("a", since_version=1, timeout=0.2) == 1
+    assert time.time() - started >= 0.2
+
+    threading.Timer(0.1, store.update, args=("a",), kwargs={"progress": 10}).start()
+    started = time.time()
+    assert store.wait("a", since_version=1, timeout=10) == 2
+    assert time.time() - started < 2
@@ -0,0 +1,89 @@
+import random
+
+from model_registry import GB, ModelRegistry
+
+
+def loader(name, log):
+    def load():
+        log.append(name)
+        return object()
+    return load
+
+
+def test_get_or_load_hits_without_loading_again():
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    loads = []
+    first = registry.get_or_load("a", loader("a", loads), size=2 * GB)
+    assert registry.get_or_load("a", loader("a", loads), size=2 * GB) is first
+    assert loads == ["a"]
+    assert (registry.hits, registry.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_first():
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    evicted = []
+    for key in ("a", "b", "c"):
+        registry.get_or_load(key, object, size=3 * GB, evict=lambda key=key: evicted.append(key))
+    registry.get("a")  # a is now the most recently used
+    registry.get_or_load("d", object, size=3 * GB, evict=lambda: evicted.append("d"))
+    assert evicted == ["b"]
+    registry.reserve(5 * GB)
+    assert evicted == ["b", "c", "a"]
+    assert list(registry.stats()["residents"]) == ["d"]
+
+
+def test_budget_is_never_exceeded():
+    rng = random.Random(7)
+    registry = ModelRegistry(budget_bytes=16 * GB)
+    for step in range(500):
+        key = f"model{rng.randrange(12)}"
+        registry.get_or_load(key, object, size=rng.randint(1, 8) * GB)
+        if step % 7 == 0:
+            registry.reserve(rng.randint(1, 8) * GB)
+        assert registry.used_bytes <= registry.budget_bytes
+
+
+def test_pinned_and_kept_residents_survive_reserve():
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    registry.register("pinned", 4 * GB, pinned=True)
+    registry.register("kept", 4 * GB)
+    registry.register("other", 2 * GB)
+    assert registry.reserve(6 * GB, keep={"kept"}) == ["other"]
+    assert "pinned" in registry and "kept" in registry
+    # Nothing more can go, so the reservation is over budget rather than evicting pinned weights
+    assert registry.reserve(6 * GB, keep={"kept"}) == []
+
+
+def test_size_measured_by_sizer_when_not_given():
+    registry = ModelRegistry(budget_bytes=10 * GB, sizer=lambda obj: 3 * GB)
+    registry.get_or_load("a", object)
+    assert registry.used_bytes == 3 * GB
+
+
+def test_release_and_clear_bookkeeping():
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    calls = []
+    for key in ("a", "b", "c"):
+        registry.register(key, GB, evict=lambda key=key: calls.append(key), obj=object())
+    resident = registry.touch("a")
+    assert registry.release("a") is True
+    assert registry.release("a") is False
+    assert resident.obj is None
+    assert calls == ["a"]
+    assert registry.used_bytes == 2 * GB
+
+    registry.clear()
+    assert sorted(calls) == ["a", "b", "c"]
+    assert registry.used_bytes == 0
+    assert registry.evictions == 3
+    assert registry.stats()["residents"] == {}
+
+
+def test_register_updates_size_of_existing_resident():
+    registry = ModelRegistry(budget_bytes=10 * GB)
+    registry.register("a", 2 * GB)
+    registry.register("b", 2 * GB)
+    registry.register("a", 9 * GB)  # measured bigger than expected: b has to go
+    assert "b" not in registry
+    assert registry.used_bytes == 9 * GB
+    assert registry.touch("a").loads == 2
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+import pipeline
+from stage_cache import StageCache
+
+
+def fake_stages(graph, out_dir):
+    """Swap every stage function for one that writes its inputs into its outputs"""
+    def fake(stage):
+        def run(snapshot):
+            parts = [stage.name]
+            for name in stage.inputs:
+                value = snapshot[name]
+                if isinstance(value, str) and os.path.isfile(value):
+                    with open(value) as f:
+                        parts.append(f.read())
+                else:
+                    parts.append(repr(value))
+            outputs = {}
+            for key in stage.outputs:
+                path = os.path.join(out_dir, f"{key}.txt")
+                with open(path, "w") as f:
+                    f.write("\n".join(parts))
+                outputs[key] = path
+            return outputs
+        return run
+
+    for stage in graph.stages.values():
+        stage.func = fake(stage)
+    return graph
+
+
+def run(tmp_path, cache, postprocess_settings):
+    ctx = pipeline.normalize_config({
+        "input_video_path": str(tmp_path / "input.mp4"),
+        "face_restore_flag": True, "upscale_flag": True,
+        "streaming_flag": False, "scene_shard_flag": False,
+        "postprocess_settings": postprocess_settings,
+    })
+    before = {stage: counts["misses"] for stage, counts in cache.stats()["stages"].items()}
+    graph = fake_stages(pipeline.build_graph(ctx), str(tmp_path / "out"))
+    graph.run(ctx, cache=cache)
+    after = cache.stats()["stages"]
+    return {stage for stage, counts in after.items() if counts["misses"] > before.get(stage, 0)}
+
+
+def test_changing_a_postprocess_setting_reuses_every_upstream_stage(tmp_path, monkeypatch):
+    monkeypatch.delenv("COMFYFLUX_WORKFLOW", raising=False)
+    (tmp_path / "input.mp4").write_bytes(b"frames")
+    (tmp_path / "out").mkdir()
+    cache = StageCache(root=str(tmp_path / "cache"))
+
+    first = run(tmp_path, cache, {"strength": 0.5})
+    assert {"restore", "face_restore", "background_upscale", "colorize", "postprocess"} <= first
+
+    # remix_postprocessed only muxes audio onto the new postprocessed file
+    assert run(tmp_path, cache, {"strength": 0.8}) == {"postprocess", "remix_postprocessed"}
+    assert run(tmp_path, cache, {"strength": 0.8}) == set()
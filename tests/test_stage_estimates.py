@@ -0,0 +1,54 @@
+import threading
+
+from stage_estimates import StageEstimator
+
+
+class SlowStore:
+    """Job store whose history read blocks until released"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.reads = 0
+        self.release = threading.Event()
+        self.reading = threading.Event()
+
+    def list(self, status=None, limit=None):
+        self.reads += 1
+        self.reading.set()
+        assert self.release.wait(10)
+        return self.jobs
+
+
+def completed_job(seconds, **flags):
+    return dict({"status": "completed", "pipeline_wall_seconds": seconds, "stages": []}, **flags)
+
+
+def test_estimate_queued_never_waits_for_the_history():
+    store = SlowStore([completed_job(100.0), completed_job(300.0)])
+    estimator = StageEstimator(store)
+
+    # Nothing cached yet: answered at once, the history loads in the background
+    assert estimator.estimate_queued({"upscale_flag": False}) is None
+    assert store.reading.wait(5)
+    assert estimator.estimate_queued({"upscale_flag": False}) is None
+    assert store.reads == 1
+
+    store.release.set()
+    for _ in range(100):
+        if estimator.estimate_queued({"upscale_flag": False}) is not None:
+            break
+        threading.Event().wait(0.05)
+    assert estimator.estimate_queued({"upscale_flag": False}) == 200.0
+    assert store.reads == 1
+
+
+def test_invalidate_reloads_on_the_next_call():
+    store = SlowStore([completed_job(100.0)])
+    store.release.set()
+    estimator = StageEstimator(store)
+    assert estimator.estimate_queued({}, wait=True) == 100.0
+    store.jobs = [completed_job(100.0), completed_job(200.0), completed_job(400.0)]
+    assert estimator.estimate_queued({}, wait=True) == 100.0
+    estimator.invalidate()
+    assert estimator.estimate_queued({}, wait=True) == 200.0
+    assert store.reads == 2
@@ -0,0 +1,89 @@
+import errno
+import hashlib
+import io
+import os
+
+import pytest
+
+import upload_sessions
+from upload_sessions import UploadSessions, UploadError
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    root, dest = tmp_path / "uploads", tmp_path / "input_videos"
+    root.mkdir()
+    dest.mkdir()
+    return str(root), str(dest)
+
+
+def put(session, start, end):
+    return session.write(start, io.BytesIO(DATA[start:end]), end - start)
+
+
+def test_resent_overlap_is_skipped(dirs):
+    sessions = UploadSessions(*dirs)
+    session = sessions.create("clip.mp4", len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert put(session, 0, 4000) == 4000
+    # The client lost the answer and sends from an older offset
+    assert put(session, 3000, 7000) == 7000
+    assert put(session, 7000, len(DATA)) == len(DATA)
+
+    filename, digest, deduplicated = sessions.finalize(session)
+    assert digest == hashlib.sha256(DATA).hexdigest() and not deduplicated
+    with open(os.path.join(dirs[1], filename), "rb") as f:
+        assert f.read() == DATA
+
+
+def test_gap_and_past_size_are_refused(dirs):
+    session = UploadSessions(*dirs).create("clip.mp4", len(DATA))
+    put(session, 0, 1000)
+    with pytest.raises(UploadError) as gap:
+        put(session, 2000, 3000)
+    assert gap.value.status == 409
+    with pytest.raises(UploadError) as past:
+        session.write(1000, io.BytesIO(b"x" * len(DATA)), len(DATA))
+    assert past.value.status == 416
+    assert session.offset == 1000
+
+
+def test_hash_is_rebuilt_after_a_restart(dirs):
+    session = UploadSessions(*dirs).create("clip.mp4", len(DATA), hashlib.sha256(DATA).hexdigest())
+    put(session, 0, 5000)
+
+    # A new process only has the part file and the session state on disk
+    sessions = UploadSessions(*dirs)
+    resumed = sessions.get(session.id)
+    assert resumed is not session and resumed.offset == 5000
+    put(resumed, 5000, len(DATA))
+    _, digest, _ = sessions.finalize(resumed)
+    assert digest == hashlib.sha256(DATA).hexdigest()
+
+
+def test_finalize_copies_across_filesystems_and_never_replaces(dirs, monkeypatch):
+    root, dest = dirs
+    with open(os.path.join(dest, "clip.mp4"), "wb") as f:
+        f.write(b"a running job reads this")
+
+    link = os.link
+
+    def cross_device_link(src, dst):
+        if os.path.dirname(os.path.abspath(src)) == os.path.abspath(root):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return link(src, dst)
+    monkeypatch.setattr(upload_sessions.os, "link", cross_device_link)
+
+    sessions = UploadSessions(root, dest)
+    session = sessions.create("clip.mp4", len(DATA))
+    put(session, 0, len(DATA))
+    filename, digest, _ = sessions.finalize(session)
+
+    assert filename == f"clip_{digest[:12]}.mp4"
+    with open(os.path.join(dest, filename), "rb") as f:
+        assert f.read() == DATA
+    with open(os.path.join(dest, "clip.mp4"), "rb") as f:
+        assert f.read() == b"a running job reads this"
+    assert sorted(os.listdir(dest)) == ["clip.mp4", filename]
+    assert not [name for name in os.listdir(root) if name.endswith(".part")]
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resumable chunked uploads for remote_api_server.py.
+A client creates a session for a file of known size, then sends the bytes
+in order as PUT requests with a Content-Range. Each chunk is streamed from
+the request straight into the session's part file with pwrite() and fed
+into a running sha256, so nothing is spooled to a temp file first. After a
+dropped connection the client asks for the committed offset and carries on
+from there. Finalizing checks the size (and the expected hash, if one was
+given) and moves the part file into place.
+
+The part file lives under the sessions' root (uploads/), not in the
+destination directory, so an unfinished upload is never seen as an input.
+Finalizing hard-links it into the destination; when the two directories are
+on different filesystems (EXDEV) it is copied over once instead.
+
+Finalized files are indexed by the sha256 the server computed: an upload
+whose content is already on the node is not stored a second time and
+resolves to the existing file. The hash a client sends when it creates a
+session is only checked against the received bytes at finalize, never used
+to look up a file. A finalized upload never replaces a file already in the
+destination directory; it gets a name of its own instead. The sha256 of any
+other file is computed once by file_digest() and remembered until the file
+changes; job deduplication only reads the remembered hash (cached_digest())
+in a request and leaves the hashing of new files to a background thread.
+
+Session state is a small JSON file next to the part file, so sessions
+survive a server restart and can be continued through any API worker
+process; a chunk holds an flock on the part file while it is written. A
+process whose running hash is behind the committed offset (after a restart,
+or because another process took the previous chunk) rebuilds it from the
+bytes already on disk.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+CHUNK_READ = 1024 * 1024
+SESSION_TTL = 24 * 3600
+
+
+class UploadError(Exception):
+    """Rejected upload request; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSession:
+    def __init__(self, manager, state):
+        self.manager = manager
+        self.state = state
+        self.lock = threading.Lock()
+        self._hasher = None
+        self._hashed = 0
+
+    @property
+    def id(self):
+        return self.state["id"]
+
+    @property
+    def offset(self):
+        return self.state["offset"]
+
+    @property
+    def part_path(self):
+        return os.path.join(self.manager.root, f"{self.id}.part")
+
+    @property
+    def state_path(self):
+        return os.path.join(self.manager.root, f"{self.id}.json")
+
+    def save(self):
+        self.state["updated_at"] = time.time()
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def reload(self):
+        """Pick up chunks committed by another process"""
+        try:
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Upload session not found", 404)
+
+    def hasher(self):
+        """sha256 of the committed bytes (rebuilt from the part file if this process is behind)"""
+        if self._hasher is None or self._hashed != self.offset:
+            self._hasher = hashlib.sha256()
+            self._hashed = self.offset
+            remaining = self.offset
+            if remaining:
+                with open(self.part_path, "rb") as f:
+                    while remaining:
+                        block = f.read(min(CHUNK_READ, remaining))
+                        if not block:
+                            raise UploadError("Part file is shorter than the committed offset", 500)
+                        self._hasher.update(block)
+                        remaining -= len(block)
+        return self._hasher
+
+    def write(self, start, stream, length):
+        """
+        Write length bytes read from stream at byte start. Bytes before the
+        committed offset (a resent chunk) are skipped; a gap is refused.
+        Returns the new offset; on a broken stream what arrived is kept.
+        """
+        fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise UploadError("Another chunk of this upload is being written", 409)
+            self.reload()
+            if start > self.offset:
+                raise UploadError(f"Chunk starts at {start} but only {self.offset} bytes are committed", 409)
+            if start + length > self.state["size"]:
+                raise UploadError("Chunk goes past the declared file size", 416)
+            hasher = self.hasher()
+            position = start
+            try:
+                while position < start + length:
+                    block = stream.read(min(CHUNK_READ, start + length - position))
+                    if not block:
+                        break
+                    skip = max(0, self.offset - position)
+                    data = memoryview(block)[skip:]
+                    at = position + skip
+                    while data:
+                        written = os.pwrite(fd, data, at)
+                        hasher.update(data[:written])
+                        data = data[written:]
+                        at += written
+                        self.state["offset"] = self._hashed = at
+                    position += len(block)
+                os.fdatasync(fd)
+            finally:
+                self.save()
+        finally:
+            os.close(fd)
+        return self.offset
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "filename": self.state["filename"],
+            "size": self.state["size"],
+            "offset": self.offset,
+            "complete": self.offset == self.state["size"],
+            "created_at": self.state["created_at"],
+        }
+
+
+class UploadSessions:
+    """Upload sessions under root; finalized files land in dest_dir"""
+
+    def __init__(self, root, dest_dir):
+        self.root = root
+        self.dest_dir = dest_dir
+        self.index_dir = os.path.join(root, "by_sha256")
+        self.path_index_dir = os.path.join(root, "by_path")
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.path_index_dir, exist_ok=True)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, digest):
+        """Name of a finalized file in dest_dir with this sha256, if it is still unchanged"""
+        try:
+            with open(os.path.join(self.index_dir, digest)) as f:
+                entry = json.load(f)
+            st = os.stat(os.path.join(self.dest_dir, entry["filename"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+            return None  # replaced by other content since
+        return entry["filename"]
+
+    def _index(self, digest, filename):
+        path = os.path.join(self.dest_dir, filename)
+        st = os.stat(path)
+        with open(os.path.join(self.index_dir, digest), "w") as f:
+            json.dump({"filename": filename, "size": st.st_size, "mtime_ns": st.st_mtime_ns}, f)
+        self._index_path(path, digest, st)
+
+    def _path_entry(self, path):
+        return os.path.join(self.path_index_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest())
+
+    def _index_path(self, path, digest, st):
+        tmp = f"{self._path_entry(path)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"path": os.path.abspath(path), "sha256": digest, "size": st.st_size,
+                       "mtime_ns": st.st_mtime_ns}, f)
+        os.replace(tmp, self._path_entry(path))
+
+    def cached_digest(self, path):
+        """Remembered sha256 of the file at path, None if it was never hashed or has changed since"""
+        st = os.stat(path)
+        try:
+            with open(self._path_entry(path)) as f:
+                entry = json.load(f)
+            if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                return entry["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def remember_digest(self, path, digest):
+        """Record the sha256 of a file just written (e.g. hashed while it was received)"""
+        self._index_path(path, digest, os.stat(path))
+
+    def file_digest(self, path):
+        """sha256 of the file at path, hashed only if it is new or changed since last time"""
+        st = os.stat(path)
+        digest = self.cached_digest(path)
+        if digest is not None:
+            return digest
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_READ), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        self._index_path(path, digest, st)
+        return digest
+
+    def create(self, filename, size, sha256=None):
+        self.expire()
+        state = {"id": uuid.uuid4().hex, "filename": filename, "size": int(size), "offset": 0,
+                 "sha256": sha256.lower() if sha256 else None, "created_at": time.time()}
+        session = UploadSession(self, state)
+        open(session.part_path, "wb").close()
+        session.save()
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        if not session_id.isalnum():
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and not session.lock.locked():
+                try:
+                    session.reload()
+                except UploadError:
+                    # Finalized or discarded by another process
+                    del self._sessions[session_id]
+                    return None
+            elif session is None:
+                try:
+                    with open(os.path.join(self.root, f"{session_id}.json")) as f:
+                        session = UploadSession(self, json.load(f))
+                except (OSError, ValueError):
+                    return None
+                self._sessions[session_id] = session
+            return session
+
+    def finalize(self, session):
+        """Move a complete upload into dest_dir; returns (filename, sha256, deduplicated)"""
+        session.reload()
+        if session.offset != session.state["size"]:
+            raise UploadError(f"Upload incomplete: {session.offset} of {session.state['size']} bytes", 409)
+        digest = session.hasher().hexdigest()
+        expected = session.state.get("sha256")
+        if expected and expected != digest:
+            self.discard(session)
+            raise UploadError(f"sha256 mismatch: expected {expected}, got {digest}", 422)
+        existing = self.lookup(digest)
+        if existing is not None:
+            self.discard(session)
+            return existing, digest, True
+        filename = self.place(session.part_path, session.state["filename"], digest)
+        self._index(digest, filename)
+        self.discard(session)
+        return filename, digest, False
+
+    def place(self, part_path, filename, digest):
+        """
+        Hard-link the part file into dest_dir without ever replacing a file
+        there (a queued or running job may be reading it): a taken name gets
+        the content hash, then a counter, appended. A part file on another
+        filesystem is copied into dest_dir first. Returns the name used.
+        """
+        try:
+            filename = self._link_free_name(part_path, filename, digest)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            copy_path = os.path.join(self.dest_dir, f".{os.path.basename(part_path)}")
+            try:
+                shutil.copyfile(part_path, copy_path)
+                filename = self._link_free_name(copy_path, filename, digest)
+            finally:
+                try:
+                    os.remove(copy_path)
+                except OSError:
+                    pass
+        os.remove(part_path)
+        return filename
+
+    def _link_free_name(self, path, filename, digest):
+        stem, ext = os.path.splitext(filename)
+        candidates = [filename, f"{stem}_{digest[:12]}{ext}"]
+        candidates += (f"{stem}_{digest[:12]}_{n}{ext}" for n in range(1, 1000))
+        for candidate in candidates:
+            try:
+                os.link(path, os.path.join(self.dest_dir, candidate))
+            except FileExistsError:
+                continue
+            return candidate
+        raise UploadError(f"No free name for {filename} in the input directory", 409)
+
+    def discard(self, session):
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        for path in (session.part_path, session.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def expire(self, ttl=SESSION_TTL):
+        """Drop sessions nobody has written to for ttl seconds"""
+        cutoff = time.time() - ttl
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            session = self.get(name[:-5])
+            if session is not None and session.state.get("updated_at", session.state["created_at"]) < cutoff:
+                self.discard(session)